@@ -0,0 +1,64 @@
+"""Micro-benchmark of the TSV parsing hot path.
+
+The rows of data/adversaries.tsv are cycled up to --rows (1M by default)
+without being held in memory, and the rows/sec of the features tokenizer
+and of the whole row parser are reported.
+
+    python benchmarks/feature_tokenizer.py --rows 1000000 --json out.json
+"""
+import argparse
+import csv
+import json
+import platform
+import sys
+import time
+from itertools import cycle, islice
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+
+from adversaries.helpers.feature_tokenizer import tokenize_features
+from adversaries.scripts.tsv_parser import parse_row
+
+
+def load_rows(path):
+    with open(path, encoding="utf-8") as file:
+        _, *rows = csv.reader(file, delimiter="\t")
+    return rows
+
+
+def bench(name, fn, rows, total):
+    start = time.perf_counter()
+    for row in islice(cycle(rows), total):
+        fn(row)
+    elapsed = time.perf_counter() - start
+    return {"name": name, "rows": total, "seconds": round(elapsed, 3),
+            "rows_per_sec": round(total / elapsed)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--tsv", default=ROOT / "data" / "adversaries.tsv")
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    rows = load_rows(args.tsv)
+    results = [
+        bench("tokenize_features", lambda r: tokenize_features(r[15]),
+              rows, args.rows),
+        bench("parse_row", parse_row, rows, args.rows),
+    ]
+    for r in results:
+        print(f"{r['name']:<20} {r['rows']:>10} rows  {r['seconds']:>8}s  "
+              f"{r['rows_per_sec']:>10} rows/s")
+
+    if args.json:
+        report = {"python": platform.python_version(), "results": results}
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""Benchmark of the adversary output representations.
+
+--rows adversaries (10k by default) with their relations are created in
+an in-memory SQLite database and loaded once, prefetched. Each
+representation is then timed over the loaded rows, no query involved:
+the DRF serializers (AdversaryListOut with its url, AdversaryDetailOut)
+against the compiled builders of serializers_out. The rendered JSON of
+both paths is checked to be identical.
+
+    python benchmarks/serializers_out.py --rows 10000 --json out.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from pathlib import Path
+
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "src"))
+os.environ.setdefault("ENV_NAME", "testing")
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings")
+
+import django
+django.setup()
+
+from django.core.management import call_command
+from django.test.utils import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import Account
+from adversaries.dtos.dto import AdversaryDTO, BasicAttackDTO, DamageDTO, \
+    TacticDTO, TagDTO, ExperienceDTO, FeatureDTO
+from adversaries.selectors import adversary_iter
+from adversaries.services import adversary_bulk_create
+from api.v1.adversaries.serializers_out import AdversaryDetailOut, \
+    AdversaryListOut, detail_representation, list_representation, \
+    detail_url_template
+
+
+def make_dtos(rows):
+    for i in range(rows):
+        yield AdversaryDTO(
+            name=f"Adversary {i}", tier=i % 4 + 1, type="BRU",
+            description="A benchmark adversary.", difficulty=12,
+            threshold_major=8, threshold_severe=15, hit_point=6,
+            stress_point=3, atk_bonus=2, source="benchmark",
+            basic_attack=BasicAttackDTO(
+                name="Claws", range="MEL",
+                damage=DamageDTO(dice_number=1, dice_type=i % 3 * 2 + 6,
+                                 bonus=2, damage_type="PHY")),
+            tactics=[TacticDTO(name=f"tactic {i % 7}"),
+                     TacticDTO(name=f"tactic {i % 5 + 7}")],
+            tags=[TagDTO(name=f"tag {i % 11}")],
+            experiences=[ExperienceDTO(name=f"exp {i % 13}", bonus=2)],
+            features=[FeatureDTO(name=f"feature {i % 17}", type="ACT",
+                                 description="Does something."),
+                      FeatureDTO(name=f"feature {i % 19 + 17}",
+                                 type="PAS")],
+        )
+
+
+def load(rows, batch_size=1000):
+    call_command("migrate", verbosity=0)
+    author = Account.objects.create(username="benchmark")
+    dtos = list(make_dtos(rows))
+    for i in range(0, rows, batch_size):
+        adversary_bulk_create(dtos[i:i + batch_size], author.id)
+    return list(adversary_iter())
+
+
+def compiled_list(advs, request):
+    item = list_representation(url=detail_url_template(request))
+    return [item(adv) for adv in advs]
+
+
+def bench(name, fn):
+    start = time.perf_counter()
+    data = fn()
+    elapsed = time.perf_counter() - start
+    return data, {"name": name, "rows": len(data),
+                  "seconds": round(elapsed, 3),
+                  "us_per_row": round(elapsed / len(data) * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args()
+
+    advs = load(args.rows)
+    request = APIRequestFactory().get("/adversaries/")
+    render = JSONRenderer().render
+
+    pairs = [
+        (("AdversaryListOut", lambda: AdversaryListOut(
+            advs, many=True, context={"request": request}).data),
+         ("list_representation", lambda: compiled_list(advs, request))),
+        (("AdversaryDetailOut", lambda: AdversaryDetailOut(
+            advs, many=True).data),
+         ("detail_representation", lambda: [
+             detail_representation(adv) for adv in advs])),
+    ]
+    results = []
+    for (ref_name, ref), (name, fn) in pairs:
+        expected, ref_result = bench(ref_name, ref)
+        data, result = bench(name, fn)
+        if render(data) != render(expected):
+            raise SystemExit(f"{name} differs from {ref_name}")
+        results += [ref_result, result]
+
+    for r in results:
+        print(f"{r['name']:<22} {r['rows']:>8} rows  {r['seconds']:>8}s  "
+              f"{r['us_per_row']:>8} us/row")
+
+    if args.json:
+        report = {"python": platform.python_version(), "results": results}
+        Path(args.json).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    with override_settings(ROOT_URLCONF="api.v1.urls",
+                           ALLOWED_HOSTS=["testserver"]):
+        main()
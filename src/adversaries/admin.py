@@ -2,6 +2,43 @@ from django.contrib import admin
 
 from adversaries.models import Adversary, BasicAttack, DamageProfile, \
     Experience, Feature, Tactic, AdversaryExperience, Tag
+from adversaries.read_model import documents_refresh
+from adversaries.search import search_index
+
+
+class DocumentsAdmin(admin.ModelAdmin):
+    """Rebuild the read model and search documents of the adversaries
+    using the rows written and move their version, the admin does not go
+    through the services."""
+    # lookup from Adversary to the model of the admin
+    adversaries_lookup = None
+
+    def _adversary_ids(self, objs):
+        return list(
+            Adversary.objects
+            .filter(**{f"{self.adversaries_lookup}__in": objs})
+            .values_list("pk", flat=True)
+            .distinct()
+        )
+
+    @staticmethod
+    def _refresh(ids):
+        documents_refresh(ids, bump_version=True)
+        search_index(ids)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        self._refresh(self._adversary_ids([form.instance.pk]))
+
+    def delete_model(self, request, obj):
+        ids = self._adversary_ids([obj.pk])
+        super().delete_model(request, obj)
+        self._refresh(ids)
+
+    def delete_queryset(self, request, queryset):
+        ids = self._adversary_ids(queryset)
+        super().delete_queryset(request, queryset)
+        self._refresh(ids)
 
 
 class AdversaryExperienceInline(admin.TabularInline):
@@ -14,35 +51,36 @@ class AdversaryExperienceInline(admin.TabularInline):
 
 
 @admin.register(Adversary)
-class AdversaryAdmin(admin.ModelAdmin):
+class AdversaryAdmin(DocumentsAdmin):
+    adversaries_lookup = "pk"
     inlines = [AdversaryExperienceInline]
 
 
 @admin.register(BasicAttack)
-class BasicAttackAdmin(admin.ModelAdmin):
-    pass
+class BasicAttackAdmin(DocumentsAdmin):
+    adversaries_lookup = "basic_attack"
 
 
 @admin.register(DamageProfile)
-class DamageProfileAdmin(admin.ModelAdmin):
-    pass
+class DamageProfileAdmin(DocumentsAdmin):
+    adversaries_lookup = "basic_attack__damage"
 
 
 @admin.register(Experience)
-class ExperienceAdmin(admin.ModelAdmin):
-    pass
+class ExperienceAdmin(DocumentsAdmin):
+    adversaries_lookup = "experiences"
 
 
 @admin.register(Feature)
-class FeatureAdmin(admin.ModelAdmin):
-    pass
+class FeatureAdmin(DocumentsAdmin):
+    adversaries_lookup = "features"
 
 
 @admin.register(Tactic)
-class TacticAdmin(admin.ModelAdmin):
-    pass
+class TacticAdmin(DocumentsAdmin):
+    adversaries_lookup = "tactics"
 
 
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin):
-    pass
+class TagAdmin(DocumentsAdmin):
+    adversaries_lookup = "tags"
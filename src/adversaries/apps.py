@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AdversariesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'adversaries'
+
+    def ready(self):
+        from adversaries import signals  # noqa: F401
@@ -0,0 +1,7 @@
+class VersionConflict(Exception):
+    """The adversary changed since the version the writer read."""
+    def __init__(self, pk, expected_version):
+        super().__init__(f"Adversary {pk} is not at version "
+                         f"{expected_version} anymore.")
+        self.pk = pk
+        self.expected_version = expected_version
@@ -0,0 +1,181 @@
+"""Streaming exports of adversaries.
+
+TSV rows use the column layout of data/adversaries.tsv (what
+scripts/tsv_parser.parse_tsv reads). NDJSON / JSON documents use the
+shape accepted by the adversary create endpoint. Each stream yields one
+row/document at a time, whatever the size of the iterable.
+
+The NDJSON / JSON streams of DOCUMENT_FORMATS take the documents as
+JSON text, e.g. assembled by the database (see adversaries.json_export).
+"""
+import csv
+import json
+
+from adversaries.helpers.formatting import format_csv_experience
+from adversaries.models import Adversary, DamageType, Feature
+
+
+TSV_HEADERS = [
+    "Adversary", "Tier", "Type", "Horde HP", "Description",
+    "Motives & Tactics", "Difficulty", "Thresholds", "HP", "Stress",
+    "Attack", "Weapon", "Range", "Damage", "Experience", "Features",
+]
+
+DAMAGE_TYPE_TSV = {
+    DamageType.UNSPECIFIED: "unk",
+    DamageType.PHYSICAL: "phy",
+    DamageType.MAGICAL: "mag",
+    DamageType.BOTH: "phy/mag",
+}
+
+# the TSV has no notation for unspecified features
+FEATURE_TYPE_TSV = {
+    Feature.Type.UNSPECIFIED: "Passive",
+    Feature.Type.PASSIVE: "Passive",
+    Feature.Type.ACTION: "Action",
+    Feature.Type.REACTION: "Reaction",
+}
+
+
+class _Echo:
+    """File-like object handing back what csv.writer writes."""
+    def write(self, value):
+        return value
+
+
+def _str_or_empty(value):
+    return "" if value is None else str(value)
+
+
+def format_tsv_damage(dp):
+    if dp.dice_number:
+        damage = f"{dp.dice_number}d{dp.dice_type}"
+        if dp.bonus:
+            damage += f"{dp.bonus:+d}"
+    else:
+        damage = str(dp.bonus)
+    return f"{damage} {DAMAGE_TYPE_TSV[dp.damage_type]}"
+
+
+def format_tsv_features(features):
+    return "  ".join(
+        f"{f.name} - {FEATURE_TYPE_TSV[f.type]}:  {f.description or ''}"
+        for f in features
+    )
+
+
+def to_tsv_row(adv):
+    ba = adv.basic_attack
+    dp = ba.damage if ba else None
+    adv_type = "Unknown" if adv.type == Adversary.Type.UNSPECIFIED \
+        else Adversary.Type(adv.type).label.title()
+
+    if adv.threshold_major is None:
+        thresholds = "None"
+    else:
+        thresholds = f"{adv.threshold_major}/{adv.threshold_severe}"
+
+    return [
+        adv.name,
+        f"Tier {adv.tier}",
+        adv_type,
+        f"{adv.horde_hit_point}/HP" if adv.horde_hit_point else "",
+        adv.description or "",
+        ", ".join(t.name for t in adv.tactics.all()),
+        _str_or_empty(adv.difficulty),
+        thresholds,
+        _str_or_empty(adv.hit_point),
+        _str_or_empty(adv.stress_point),
+        "" if adv.atk_bonus is None else f"{adv.atk_bonus:+d}",
+        ba.name if ba else "",
+        ba.get_range_display().title() if ba else "",
+        format_tsv_damage(dp) if dp else "",
+        format_csv_experience(adv.adversary_experiences.all()) or "",
+        format_tsv_features(adv.features.all()),
+    ]
+
+
+def to_document(adv):
+    ba = adv.basic_attack
+    dp = ba.damage if ba else None
+    return {
+        "id": adv.id,
+        "name": adv.name,
+        "tier": adv.tier,
+        "type": adv.type,
+        "description": adv.description,
+        "difficulty": adv.difficulty,
+        "threshold_major": adv.threshold_major,
+        "threshold_severe": adv.threshold_severe,
+        "hit_point": adv.hit_point,
+        "horde_hit_point": adv.horde_hit_point,
+        "stress_point": adv.stress_point,
+        "atk_bonus": adv.atk_bonus,
+        "source": adv.source,
+        "status": adv.status,
+        "basic_attack": {
+            "name": ba.name,
+            "range": ba.range,
+            "damage": {
+                "dice_number": dp.dice_number,
+                "dice_type": dp.dice_type,
+                "bonus": dp.bonus,
+                "damage_type": dp.damage_type,
+            } if dp else None,
+        } if ba else None,
+        "tactics": [t.name for t in adv.tactics.all()],
+        "tags": [t.name for t in adv.tags.all()],
+        "experiences": [
+            {"name": e.experience.name, "bonus": e.bonus}
+            for e in adv.adversary_experiences.all()
+        ],
+        "features": [
+            {"name": f.name, "type": f.type, "description": f.description}
+            for f in adv.features.all()
+        ],
+    }
+
+
+def stream_tsv(adversaries):
+    writer = csv.writer(_Echo(), delimiter="\t", lineterminator="\n")
+    yield writer.writerow(TSV_HEADERS)
+    for adv in adversaries:
+        yield writer.writerow(to_tsv_row(adv))
+
+
+def stream_ndjson_documents(documents):
+    for document in documents:
+        yield document + "\n"
+
+
+def stream_json_documents(documents):
+    yield "["
+    separator = ""
+    for document in documents:
+        yield separator + document
+        separator = ","
+    yield "]"
+
+
+def _json_documents(adversaries):
+    return (json.dumps(to_document(adv)) for adv in adversaries)
+
+
+def stream_ndjson(adversaries):
+    return stream_ndjson_documents(_json_documents(adversaries))
+
+
+def stream_json(adversaries):
+    return stream_json_documents(_json_documents(adversaries))
+
+
+EXPORT_FORMATS = {
+    "tsv": (stream_tsv, "text/tab-separated-values"),
+    "ndjson": (stream_ndjson, "application/x-ndjson"),
+    "json": (stream_json, "application/json"),
+}
+
+DOCUMENT_FORMATS = {
+    "ndjson": (stream_ndjson_documents, "application/x-ndjson"),
+    "json": (stream_json_documents, "application/json"),
+}
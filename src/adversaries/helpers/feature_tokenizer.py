@@ -0,0 +1,84 @@
+"""Single pass tokenizer for the features cell of the adversaries TSV.
+
+The cell is a run of chunks separated by two or more whitespaces. A
+chunk like "Relentless (3) - Passive:" opens a feature, the chunks
+following it up to the next header are its description."""
+import re
+from dataclasses import dataclass
+
+
+_SEPARATOR = re.compile(r"\s{2,}")
+_HEADER = re.compile(r"(.+)\s*-\s*(Passive|Action|Reaction):", re.I)
+
+
+@dataclass(frozen=True, slots=True)
+class FeatureParseError:
+    position: int
+    message: str
+
+
+def _chunks(text):
+    """Yield (position, chunk) for each chunk of the stripped text."""
+    start = len(text) - len(text.lstrip())
+    end = len(text.rstrip())
+    for sep in _SEPARATOR.finditer(text, start, end):
+        yield start, text[start:sep.start()]
+        start = sep.end()
+    if start < end:
+        yield start, text[start:end]
+
+
+def tokenize_features(text):
+    """Split a features cell in {name, type, description} dicts.
+
+    Args:
+        text: raw content of the features cell
+
+    Returns:
+        (features, errors), errors being FeatureParseError positioned on
+        the offending character of text. Text that cannot be attached to
+        a feature is reported and left out of the features.
+    """
+    features = []
+    errors = []
+    header_pos = None
+    desc = []
+
+    def close():
+        if not desc:
+            errors.append(FeatureParseError(
+                header_pos,
+                f"feature '{features[-1]['name']}' has no description"))
+        features[-1]["description"] = " ".join(desc)
+
+    for pos, chunk in _chunks(text):
+        # most chunks are descriptions, skip the backtracking regex when
+        # the chunk cannot be a header
+        header = _HEADER.match(chunk) if ":" in chunk else None
+        if header is None:
+            if header_pos is None:
+                errors.append(FeatureParseError(
+                    pos, "text before the first feature header"))
+            else:
+                desc.append(chunk)
+            continue
+
+        if header_pos is not None:
+            close()
+        if header.end() < len(chunk):
+            errors.append(FeatureParseError(
+                pos + header.end(),
+                "description must be separated from its header by two "
+                "spaces"))
+        name, ftype = header.groups()
+        features.append({
+            "name": name.strip(),
+            "type": ftype.upper()[:3],
+            "description": "",
+        })
+        header_pos = pos
+        desc = []
+
+    if header_pos is not None:
+        close()
+    return features, errors
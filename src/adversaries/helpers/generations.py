@@ -0,0 +1,52 @@
+"""Generation counters of the models, in the shared cache backend.
+
+Anything cached from a model (API responses...) is keyed by the current
+generation of the models it was read from: bumping a generation once a
+write commits makes those entries unreachable, they expire on their own.
+A missing counter (never set or evicted) starts again from the clock, an
+old generation is never handed out twice.
+"""
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+
+
+def generation_key(model):
+    return f"adversaries:generation:{model._meta.label_lower}"
+
+
+def _seed():
+    return time.time_ns()
+
+
+def generations(models):
+    """Current generation of each model, in a single cache round trip.
+
+    Returns:
+        list of generations, in the order of models
+    """
+    keys = [generation_key(m) for m in models]
+    found = cache.get_many(keys)
+    missing = [k for k in keys if k not in found]
+    for key in missing:
+        cache.add(key, _seed(), timeout=None)
+    if missing:
+        found.update(cache.get_many(missing))
+    return [found.get(k) for k in keys]
+
+
+def _bump(keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _seed(), timeout=None)
+
+
+def bump_generations(*models):
+    """Bump the generation of models once the current transaction
+    commits, a reader never caches rows under the generation of a
+    write it does not see yet."""
+    keys = [generation_key(m) for m in dict.fromkeys(models)]
+    transaction.on_commit(lambda: _bump(keys))
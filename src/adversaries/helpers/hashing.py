@@ -0,0 +1,20 @@
+import hashlib
+import json
+from dataclasses import asdict
+
+
+def content_hash(dto):
+    """Stable sha256 hex digest of a (nested) dataclass content.
+
+    Keys are sorted so the digest only changes with the values."""
+    payload = json.dumps(asdict(dto), sort_keys=True, separators=(",", ":"),
+                         default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def feature_hash(name, type_, description):
+    """Identity of a Feature: sha256 hex digest of its three fields.
+
+    None and "" descriptions stay distinct, as in the columns."""
+    payload = json.dumps([name, type_, description], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
@@ -0,0 +1,143 @@
+"""Per stage instrumentation of the imports.
+
+A profiler is activated around a run; the code being measured opens
+stages with stage(name), which is a no-op when no profiler is active.
+Wall time is recorded per stage, queries (count and time) are charged
+to the innermost open stage through a connection execute_wrapper."""
+import cProfile
+import pstats
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from django.db import connection
+
+
+_active = ContextVar("import_profiler", default=None)
+
+
+def stage(name):
+    profiler = _active.get()
+    return profiler.stage(name) if profiler else nullcontext()
+
+
+@dataclass(slots=True)
+class StageStats:
+    seconds: float = 0.0
+    queries: int = 0
+    query_seconds: float = 0.0
+
+
+class ImportProfiler:
+    """Args:
+        trace: also run cProfile and tracemalloc (slower, opt-in)
+    """
+    def __init__(self, trace=False):
+        self.trace = trace
+        self.rows = 0
+        self.seconds = 0.0
+        self.peak_memory = None
+        self.stages = {}
+        self._stack = []
+        self._profile = cProfile.Profile() if trace else None
+
+    def _stats(self, name):
+        return self.stages.setdefault(name, StageStats())
+
+    @contextmanager
+    def stage(self, name):
+        self._stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stats(name).seconds += time.perf_counter() - start
+            self._stack.pop()
+
+    def iterate(self, name, iterable):
+        """Yield from iterable, charging each next() to stage name."""
+        it = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(it)
+                except StopIteration:
+                    return
+            yield item
+
+    def _execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats = self._stats(self._stack[-1] if self._stack else "other")
+            stats.queries += 1
+            stats.query_seconds += time.perf_counter() - start
+
+    @contextmanager
+    def run(self):
+        token = _active.set(self)
+        if self.trace:
+            tracemalloc.start()
+            self._profile.enable()
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(self._execute_wrapper):
+                yield self
+        finally:
+            self.seconds = time.perf_counter() - start
+            if self.trace:
+                self._profile.disable()
+                self.peak_memory = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            _active.reset(token)
+
+    def _rate(self, seconds):
+        return round(self.rows / seconds) if seconds else None
+
+    def hot_spots(self, limit=25):
+        """Functions with the most own time, from cProfile."""
+        if self._profile is None:
+            return []
+        stats = pstats.Stats(self._profile).stats
+        top = sorted(stats.items(), key=lambda kv: kv[1][2], reverse=True)
+        return [
+            {
+                "function": f"{file}:{line}({func})",
+                "calls": nc,
+                "self_seconds": round(tt, 6),
+                "cumulative_seconds": round(ct, 6),
+            }
+            for (file, line, func), (_, nc, tt, ct, _) in top[:limit]
+        ]
+
+    def report(self):
+        return {
+            "rows": self.rows,
+            "seconds": round(self.seconds, 6),
+            "rows_per_sec": self._rate(self.seconds),
+            "peak_memory_bytes": self.peak_memory,
+            "stages": {
+                name: {
+                    "seconds": round(s.seconds, 6),
+                    "rows_per_sec": self._rate(s.seconds),
+                    "queries": s.queries,
+                    "query_seconds": round(s.query_seconds, 6),
+                }
+                for name, s in self.stages.items()
+            },
+            "hot_spots": self.hot_spots(),
+        }
+
+    def summary(self):
+        lines = [f"{self.rows} rows in {self.seconds:.2f}s "
+                 f"({self._rate(self.seconds)} rows/s)"]
+        for name, s in self.stages.items():
+            lines.append(f"  {name:<10} {s.seconds:>9.3f}s  "
+                         f"{s.queries:>7} queries  {s.query_seconds:>9.3f}s "
+                         f"in db")
+        if self.peak_memory is not None:
+            lines.append(f"  peak memory {self.peak_memory / 2**20:.1f} MiB")
+        return "\n".join(lines)
@@ -0,0 +1,166 @@
+"""Process-local interning of value object ids.
+
+Tactics, tags, experiences, damage profiles and basic attacks are few
+and almost never change: their key -> id mapping is kept in a bounded
+LRU per process and consulted before the database. Entries only reach
+the LRU once the transaction that read them commits. Modifying or
+deleting a row clears the local LRU at once and bumps a version stamp
+in the shared cache backend on commit, the other processes drop their
+entries on their next lookup. Entries also expire after a TTL, for the
+writes that send no signal.
+
+The version stamp needs a cache shared by the processes: with a
+process-local backend (the default locmem) interning is off unless the
+ADVERSARIES_INTERNING setting forces it, for a single process."""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+
+DEFAULT_MAXSIZE = 4096
+DEFAULT_TTL = 300
+PROCESS_LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+def shared_cache():
+    """True when the default cache is shared by the processes."""
+    return settings.CACHES["default"]["BACKEND"] \
+        not in PROCESS_LOCAL_BACKENDS
+
+
+def interning_enabled():
+    enabled = getattr(settings, "ADVERSARIES_INTERNING", None)
+    return shared_cache() if enabled is None else enabled
+
+
+class InternCache:
+    """Bounded LRU of value object key -> id, entries live ttl seconds."""
+    def __init__(self, label, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL):
+        self.label = label
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._version = None
+        # bumped on every local clear, stores computed before it are
+        # dropped
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    @property
+    def version_key(self):
+        return f"adversaries:intern:{self.label}:version"
+
+    def _clear(self):
+        self._data.clear()
+        self._generation += 1
+
+    def _check_version(self):
+        version = cache.get(self.version_key, 0)
+        if version != self._version:
+            self._clear()
+            self._version = version
+
+    def lookup(self, keys):
+        """Split keys between the interned ones and the ones to resolve.
+
+        Returns:
+            (dict key -> id, list of missing keys)
+        """
+        found, missing = {}, []
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            for key in keys:
+                pk, expires = self._data.get(key, (None, 0))
+                if expires <= now:
+                    self._data.pop(key, None)
+                    missing.append(key)
+                else:
+                    self._data.move_to_end(key)
+                    found[key] = pk
+            self.hits += len(found)
+            self.misses += len(missing)
+        return found, missing
+
+    def remember(self, mapping):
+        """Intern mapping when the current transaction commits, ids of
+        rolled back rows never reach the cache."""
+        if not mapping:
+            return
+        generation = self._generation
+        transaction.on_commit(lambda: self._store(mapping, generation))
+
+    def _store(self, mapping, generation):
+        with self._lock:
+            if generation != self._generation:
+                return
+            expires = time.monotonic() + self.ttl
+            for key, pk in mapping.items():
+                self._data[key] = (pk, expires)
+                self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self):
+        """Drop the local entries now and the other processes' ones once
+        the current transaction commits."""
+        with self._lock:
+            self._clear()
+        transaction.on_commit(self._bump_version)
+
+    def _bump_version(self):
+        if not cache.add(self.version_key, 1, timeout=None):
+            cache.incr(self.version_key)
+
+    def stats(self):
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+_registry = {}
+
+
+def register(model, maxsize=DEFAULT_MAXSIZE):
+    label = model._meta.label_lower
+    _registry.setdefault(label, InternCache(label, maxsize))
+    return _registry[label]
+
+
+def intern_cache(model):
+    """InternCache of model, None when model is not interned or
+    interning is off (see interning_enabled)."""
+    if not interning_enabled():
+        return None
+    return _registry.get(model._meta.label_lower)
+
+
+def intern_stats():
+    """Hit / miss counters of every interned model, for monitoring."""
+    return {label: c.stats() for label, c in _registry.items()}
+
+
+def intern_invalidate():
+    """Drop the entries of every interned model, here and (on commit)
+    in the other processes."""
+    for c in _registry.values():
+        c.invalidate()
+
+
+def intern_clear():
+    for c in _registry.values():
+        with c._lock:
+            c._clear()
+        c.hits = c.misses = 0
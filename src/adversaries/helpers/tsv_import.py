@@ -0,0 +1,147 @@
+"""Helpers of the pipe_tsv command that must stay importable without
+Django being set up (they run inside the parsing worker processes)."""
+import csv
+import io
+import os
+from collections import deque
+from functools import cache
+from glob import glob
+from importlib.util import spec_from_file_location, module_from_spec
+from itertools import tee
+from pathlib import Path
+
+
+def import_script_from_path(scriptpath):
+    spec = spec_from_file_location("script_parser", scriptpath)
+    mod = module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+
+@cache
+def _cached_script(scriptpath):
+    return import_script_from_path(scriptpath)
+
+
+def _record_ends(file):
+    """Yield the byte offset of the end of each TSV record of the binary
+    file, quoted cells spanning lines included."""
+    offset = 0
+
+    def lines():
+        nonlocal offset
+        for line in file:
+            offset += len(line)
+            yield line.decode("utf-8")
+
+    # the reader pulls the lines of one record at a time
+    for _ in csv.reader(lines(), delimiter="\t"):
+        yield offset
+
+
+def tsv_ranges(filepath, rows):
+    """Byte ranges (start, end) of filepath holding rows records each,
+    the header left out. A file without records is one empty range."""
+    with open(filepath, "rb") as file:
+        ends = _record_ends(file)
+        start = end = next(ends, 0)
+        count = 0
+        yielded = False
+        for end in ends:
+            count += 1
+            if count == rows:
+                yield start, end
+                start, count, yielded = end, 0, True
+        if count or not yielded:
+            yield start, end
+
+
+def parse_range(scriptpath, filepath, start, end):
+    """Worker task: parse the records of a byte range of a TSV file with
+    the parse_row of the parser script."""
+    parse_row = _cached_script(scriptpath).parse_row
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        text = file.read(end - start).decode("utf-8")
+    reader = csv.reader(io.StringIO(text, newline=""), delimiter="\t")
+    return [parse_row(row) for row in reader]
+
+
+def _parse_task(task):
+    return parse_range(*task)
+
+
+def parse_files(executor, scriptpath, filepaths, rows, window):
+    """Parse filepaths in tasks of rows records each, at most window
+    tasks in flight over all the files: a worker never holds nor sends
+    back a whole file.
+
+    Yields:
+        (filepath, rows of the file), the rows stream from the results
+        of the tasks, in order
+    """
+    tasks, keys = tee(
+        (scriptpath, filepath, start, end)
+        for filepath in filepaths
+        for start, end in tsv_ranges(filepath, rows)
+    )
+    results = zip((key[1] for key in keys),
+                  bounded_map(executor, _parse_task, tasks, window=window))
+    pending = next(results, None)
+
+    def file_rows(filepath):
+        nonlocal pending
+        while pending is not None and pending[0] == filepath:
+            yield from pending[1]
+            pending = next(results, None)
+
+    for filepath in filepaths:
+        # rows of the previous file its consumer left
+        while pending is not None and pending[0] != filepath:
+            pending = next(results, None)
+        yield filepath, file_rows(filepath)
+
+
+def import_root(path_or_glob):
+    """Directory the source keys of collect_tsv_files are relative to:
+    the directory, the fixed part of the glob or the parent of the
+    file."""
+    path = Path(path_or_glob)
+    if path.is_dir():
+        return path.resolve()
+    if any(c in path_or_glob for c in "*?["):
+        fixed = []
+        for part in path.parts:
+            if any(c in part for c in "*?["):
+                break
+            fixed.append(part)
+        return Path(*fixed).resolve() if fixed else Path.cwd()
+    return path.resolve().parent
+
+
+def source_key(root, filepath):
+    """Key of the adversaries imported from filepath: its path relative
+    to the import root, files of the same name do not collide."""
+    return Path(os.path.relpath(filepath, root)).as_posix()
+
+
+def collect_tsv_files(path_or_glob):
+    """Files matching a file path, a directory (its *.tsv) or a glob."""
+    path = Path(path_or_glob)
+    if path.is_dir():
+        return sorted(p.resolve() for p in path.glob("*.tsv"))
+    if any(c in path_or_glob for c in "*?["):
+        return sorted(Path(p).resolve() for p in glob(path_or_glob))
+    return [path.resolve()]
+
+
+def bounded_map(executor, fn, *iterables, window):
+    """Ordered executor.map keeping at most window tasks in flight, so
+    results are not piling up when the consumer is slower."""
+    pending = deque()
+    for args in zip(*iterables):
+        pending.append(executor.submit(fn, *args))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,142 @@
+"""Export documents of the adversaries assembled by the database.
+
+The document of helpers.exporting.to_document (the create payload, with
+the id) is built by one SQL expression per adversary: JSON functions for
+the basic attack and its damage, an ordered JSON aggregate per relation
+(json_group_array on SQLite, json_agg on Postgres). A query returns one
+JSON text per row, no model instance is built in python.
+
+Relations are listed in the order of their ids. On Postgres the objects
+are json_build_object, jsonb would not keep the order of the keys.
+"""
+from django.db import connection, NotSupportedError
+
+from adversaries.models import Adversary, AdversaryExperience, \
+    BasicAttack, DamageProfile, Experience, Feature, Tactic, Tag
+
+
+ADVERSARY_FIELDS = (
+    "id", "name", "tier", "type", "description", "difficulty",
+    "threshold_major", "threshold_severe", "hit_point", "horde_hit_point",
+    "stress_point", "atk_bonus", "source", "status",
+)
+DAMAGE_FIELDS = ("dice_number", "dice_type", "bonus", "damage_type")
+
+
+def _q(name):
+    return connection.ops.quote_name(name)
+
+
+def _table(model):
+    return _q(model._meta.db_table)
+
+
+def _column(alias, model, field):
+    return f"{alias}.{_q(model._meta.get_field(field).column)}"
+
+
+class _SqliteBackend:
+    def object(self, pairs):
+        return "json_object(" + ", ".join(
+            f"'{key}', {value}" for key, value in pairs) + ")"
+
+    def nested(self, sql):
+        # json() keeps a subquery / CASE result a JSON value, not a string
+        return f"json({sql})"
+
+    def array(self, value, source, order, objects=False):
+        # the ordered subquery feeds the aggregate, its objects are text
+        # again once out of it
+        item = "json(item)" if objects else "item"
+        return (
+            f"json((SELECT json_group_array({item}) FROM ("
+            f"SELECT {value} AS item {source} ORDER BY {order})))"
+        )
+
+
+class _PostgresBackend:
+    def object(self, pairs):
+        return "json_build_object(" + ", ".join(
+            f"'{key}', {value}" for key, value in pairs) + ")"
+
+    def nested(self, sql):
+        return sql
+
+    def array(self, value, source, order, objects=False):
+        return (
+            f"(SELECT coalesce(json_agg({value} ORDER BY {order}), "
+            f"'[]'::json) {source})"
+        )
+
+
+_BACKENDS = {
+    "sqlite": _SqliteBackend(),
+    "postgresql": _PostgresBackend(),
+}
+
+
+def _backend():
+    try:
+        return _BACKENDS[connection.vendor]
+    except KeyError:
+        raise NotSupportedError(
+            f"No JSON aggregation for {connection.vendor}.")
+
+
+def _names(backend, adversary, model, through, field):
+    return backend.array(
+        "v.name",
+        f"FROM {_table(through)} l JOIN {_table(model)} v "
+        f"ON v.id = l.{_q(field + '_id')} "
+        f"WHERE l.adversary_id = {adversary}.id",
+        "v.id",
+    )
+
+
+def _basic_attack(backend, adversary):
+    damage = backend.object(
+        (f, _column("dp", DamageProfile, f)) for f in DAMAGE_FIELDS)
+    basic_attack = backend.object([
+        ("name", _column("ba", BasicAttack, "name")),
+        ("range", _column("ba", BasicAttack, "range")),
+        ("damage", backend.nested(
+            f"CASE WHEN dp.id IS NULL THEN NULL ELSE {damage} END")),
+    ])
+    return backend.nested(
+        f"(SELECT {basic_attack} FROM {_table(BasicAttack)} ba "
+        f"LEFT JOIN {_table(DamageProfile)} dp ON dp.id = ba.damage_id "
+        f"WHERE ba.id = {adversary}.basic_attack_id)"
+    )
+
+
+def export_document_sql(adversary=None):
+    """SQL expression of the export document (JSON text) of the row of
+    the adversary table aliased adversary (the table name by default,
+    the alias of the ORM)."""
+    adversary = adversary or _table(Adversary)
+    backend = _backend()
+    features = Adversary.features.through
+    return backend.object([
+        *((f, _column(adversary, Adversary, f)) for f in ADVERSARY_FIELDS),
+        ("basic_attack", _basic_attack(backend, adversary)),
+        ("tactics", _names(backend, adversary, Tactic,
+                           Adversary.tactics.through, "tactic")),
+        ("tags", _names(backend, adversary, Tag, Adversary.tags.through,
+                        "tag")),
+        ("experiences", backend.array(
+            backend.object([("name", "e.name"), ("bonus", "l.bonus")]),
+            f"FROM {_table(AdversaryExperience)} l "
+            f"JOIN {_table(Experience)} e ON e.id = l.experience_id "
+            f"WHERE l.adversary_id = {adversary}.id",
+            "e.id", objects=True,
+        )),
+        ("features", backend.array(
+            backend.object(
+                (k, _column("f", Feature, k))
+                for k in ("name", "type", "description")),
+            f"FROM {_table(features)} l "
+            f"JOIN {_table(Feature)} f ON f.id = l.feature_id "
+            f"WHERE l.adversary_id = {adversary}.id",
+            "f.id", objects=True,
+        )),
+    ])
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from adversaries.helpers.exporting import EXPORT_FORMATS, \
+    DOCUMENT_FORMATS
+from adversaries.selectors import adversary_iter, adversary_export_documents
+
+
+class Command(BaseCommand):
+    help = "Stream every adversary as tsv (pipe_tsv layout), ndjson or json"
+    default_chunk_size = 2000
+
+    def add_arguments(self, parser):
+        parser.add_argument('-f', '--format', choices=EXPORT_FORMATS,
+                            default="tsv")
+        parser.add_argument('-o', '--output',
+                            help="output file, default: stdout")
+        parser.add_argument('-c', '--chunk-size', type=int,
+                            default=self.default_chunk_size,
+                            help="rows fetched (and prefetched) together")
+
+    def handle(self, *args, **options):
+        # json documents are assembled by the database
+        if options["format"] in DOCUMENT_FORMATS:
+            stream, _ = DOCUMENT_FORMATS[options["format"]]
+            rows = stream(adversary_export_documents(
+                chunk_size=options["chunk_size"]))
+        else:
+            stream, _ = EXPORT_FORMATS[options["format"]]
+            rows = stream(adversary_iter(chunk_size=options["chunk_size"]))
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8",
+                      newline="") as file:
+                file.writelines(rows)
+        else:
+            for row in rows:
+                self.stdout.write(row, ending="")
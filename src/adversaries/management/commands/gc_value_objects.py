@@ -0,0 +1,50 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from adversaries.services import GC_GRACE, value_objects_gc
+
+
+class Command(BaseCommand):
+    help = "Delete the value objects (basic attacks, damage profiles, " \
+           "features, tactics, tags, experiences) no adversary uses"
+    default_batch_size = 1000
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', type=int,
+                            default=self.default_batch_size,
+                            help="rows deleted per transaction")
+        parser.add_argument('-g', '--grace-days', type=float,
+                            default=GC_GRACE.days,
+                            help="days a row stays unreferenced before "
+                                 "its deletion")
+        parser.add_argument('-n', '--dry-run', action="store_true",
+                            help="only count the orphan rows")
+        parser.add_argument('-i', '--interval', type=float,
+                            help="run again every INTERVAL seconds")
+        parser.add_argument('--runs', type=int,
+                            help="stop after RUNS runs (periodic mode)")
+
+    def report(self, reclaimed, seconds, dry_run):
+        verb = "would delete" if dry_run else "deleted"
+        details = ", ".join(f"{label.split('.')[-1]}: {count}"
+                            for label, count in reclaimed.items())
+        self.stdout.write(f"GC {verb} {sum(reclaimed.values())} row(s) "
+                          f"in {seconds:.2f}s ({details}).")
+
+    def handle(self, *args, **options):
+        interval = options["interval"]
+        runs = options["runs"] if interval is not None else 1
+        grace = timedelta(days=options["grace_days"])
+        done = 0
+        while runs is None or done < runs:
+            if done:
+                time.sleep(interval)
+            start = time.perf_counter()
+            reclaimed = value_objects_gc(batch_size=options["batch_size"],
+                                         dry_run=options["dry_run"],
+                                         grace=grace)
+            self.report(reclaimed, time.perf_counter() - start,
+                        options["dry_run"])
+            done += 1
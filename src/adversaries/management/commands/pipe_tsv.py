@@ -1,25 +1,56 @@
-from importlib.util import spec_from_file_location, module_from_spec
+import json
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import islice
 from pathlib import Path
 
 from django.conf import settings
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
 
-from adversaries.models import Tactic, DamageProfile, BasicAttack, \
-    Experience, Feature, Adversary, DamageType
+from accounts.models import Account
+from adversaries.dtos.dto import AdversaryDTO, BasicAttackDTO, DamageDTO, \
+    TacticDTO, ExperienceDTO, FeatureDTO
+from adversaries.helpers.instrumentation import ImportProfiler
+from adversaries.helpers.interning import intern_stats
+from adversaries.helpers.tsv_import import import_script_from_path, \
+    parse_files, collect_tsv_files, import_root, source_key
+from adversaries.models import BasicAttack, Feature, Adversary, DamageType
+from adversaries.services import adversary_import_batch, \
+    adversary_retire_missing
 
 
-def import_script_from_path(scriptpath):
-    spec = spec_from_file_location("script_parser", scriptpath)
-    mod = module_from_spec(spec)
-    spec.loader.exec_module(mod)
-    return mod
+def batched(iterable, size):
+    it = iter(iterable)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def read_checkpoint(checkpoint, filepath):
+    """Number of rows of filepath already committed by a previous run."""
+    if not checkpoint.exists():
+        return 0
+    data = json.loads(checkpoint.read_text())
+    if data["source"] != str(filepath):
+        raise CommandError(f"Checkpoint {checkpoint} belongs to "
+                           f"{data['source']}, not {filepath}.")
+    return data["rows"]
+
+
+def write_checkpoint(checkpoint, filepath, rows):
+    # write then rename, a crash never leaves a half written checkpoint
+    tmp = checkpoint.with_name(checkpoint.name + ".tmp")
+    tmp.write_text(json.dumps({"source": str(filepath), "rows": rows}))
+    tmp.replace(checkpoint)
 
 
 class Command(BaseCommand):
     help = "Transform tsv input into db entries"
     default_scriptpath = (settings.BASE_DIR / "adversaries" / "scripts" /
                           "tsv_parser.py")
+    default_batch_size = 500
+    default_chunk_size = 5000
 
     RANGE_MAP = {
         "close": BasicAttack.Range.CLOSE,
@@ -36,79 +67,190 @@ class Command(BaseCommand):
     }
 
     def add_arguments(self, parser):
-        parser.add_argument("tsv_filepath")
-        parser.add_argument('-s', '--script_filepath')
-
-    @transaction.atomic
-    def handle(self, *args, **options):
-        filepath = Path(options["tsv_filepath"]).resolve()
-        scriptpath = Path(options["script_filepath"]).resolve() \
-            if options["script_filepath"] else self.default_scriptpath
-
-        mod = import_script_from_path(scriptpath)
-        adversaries = mod.parse_tsv(filepath)
-
-        for data in adversaries:
-            tactics = []
-            for t_name in data["tactics"]:
-                tac, _ = Tactic.objects.get_or_create(name=t_name)
-                tactics.append(tac)
+        parser.add_argument("tsv_path",
+                            help="tsv file, directory of tsv files or glob")
+        parser.add_argument('-s', '--script_filepath',
+                            help="parser script defining parse_tsv, and "
+                                 "parse_row for --workers")
+        parser.add_argument('-a', '--author', required=True,
+                            help="username of the adversaries author")
+        parser.add_argument('-b', '--batch-size', type=int,
+                            default=self.default_batch_size,
+                            help="rows resolved and inserted together")
+        parser.add_argument('-c', '--chunk-size', type=int,
+                            default=self.default_chunk_size,
+                            help="rows committed per transaction, and "
+                                 "parsed per task of the worker pool")
+        parser.add_argument('--checkpoint',
+                            help="progress file (single file import), "
+                                 "default: <tsv file>.checkpoint")
+        parser.add_argument('-r', '--resume', action="store_true",
+                            help="skip the rows committed by a failed run")
+        parser.add_argument('--retire', action="store_true",
+                            help="delete the adversaries previously "
+                                 "imported from a file but not in it anymore")
+        parser.add_argument('-w', '--workers', type=int, default=1,
+                            help="processes parsing files in parallel")
+        parser.add_argument('-p', '--profile', metavar="OUT_JSON",
+                            help="write a json report with cProfile hot "
+                                 "spots and tracemalloc peak memory")
 
+    def to_dto(self, data):
+        basic_attack = None
+        if data["basic_attack"] is not None:
             dmg = data["basic_attack"]["damage"]
-            dp, _ = DamageProfile.objects.get_or_create(
+            damage = DamageDTO(
                 dice_number=dmg["dice_number"],
                 dice_type=dmg["dice_type"],
                 bonus=dmg["bonus"],
                 damage_type=DamageType(dmg["damage_type"]),
-            )
-
-            ba_range = self.RANGE_MAP.get(
-                data["basic_attack"]["range"].lower(),
-                BasicAttack.Range.MELEE,
-            )
-            basic_attack, _ = BasicAttack.objects.get_or_create(
+            ) if dmg else None
+            basic_attack = BasicAttackDTO(
                 name=data["basic_attack"]["name"],
-                range=ba_range,
-                damage=dp,
+                range=self.RANGE_MAP.get(
+                    data["basic_attack"]["range"].lower(),
+                    BasicAttack.Range.MELEE,
+                ),
+                damage=damage,
             )
+        horde_hit_point = data["horde_hit_point"]
 
-            experiences = []
-            for exp in data["experiences"]:
-                exp_obj, _ = Experience.objects.get_or_create(
-                    name=exp["name"], bonus=exp["bonus"]
+        return AdversaryDTO(
+            name=data["name"],
+            tier=data["tier"],
+            type=Adversary.Type(data["type"].upper()),
+            description=data["description"],
+            difficulty=data["difficulty"],
+            threshold_major=data["threshold_major"],
+            threshold_severe=data["threshold_severe"],
+            hit_point=data["hit_point"],
+            horde_hit_point=int(horde_hit_point) if horde_hit_point else None,
+            stress_point=data["stress_point"],
+            atk_bonus=data["atk_bonus"],
+            source="official",
+            basic_attack=basic_attack,
+            tactics=[TacticDTO(name=t.strip())
+                     for t in data["tactics"] if t.strip()],
+            experiences=[ExperienceDTO(name=e["name"], bonus=e["bonus"])
+                         for e in data["experiences"]],
+            features=[
+                FeatureDTO(
+                    name=f["name"],
+                    type=self.FEATURE_TYPE_MAP[f["type"].upper()],
+                    description=f.get("description", ""),
                 )
-                experiences.append(exp_obj)
-
-            features = []
-            for feat in data["features"]:
-                ftype = self.FEATURE_TYPE_MAP[feat["type"].upper()]
-                feat_obj, created = Feature.objects.get_or_create(
-                    name=feat["name"],
-                    type=ftype,
-                    defaults={"description": feat.get("description", "")},
-                )
-                desc = feat.get("description")
-                if not created and desc and feat_obj.description != desc:
-                    feat_obj.description = desc
-                    feat_obj.save(update_fields=["description"])
-                features.append(feat_obj)
-
-            adversary = Adversary.objects.create(
-                name=data["name"],
-                tier=data["tier"],
-                type=Adversary.Type(data["type"].upper()),
-                description=data["description"],
-                difficulty=data["difficulty"],
-                threshold_major=data["threshold_major"],
-                threshold_severe=data["threshold_severe"],
-                hit_point=data["hit_point"],
-                horde_hit_point=data["horde_hit_point"],
-                stress_point=data["stress_point"],
-                atk_bonus=data["atk_bonus"],
-                basic_attack=basic_attack,
-                source="official",
-            )
+                for f in data["features"]
+            ],
+        )
+
+    def report_feature_errors(self, key, rows):
+        """Warn about the parse errors of the features cells of rows, the
+        text they point at is not imported.
+
+        Returns:
+            number of errors
+        """
+        count = 0
+        for data in rows:
+            for error in data.get("feature_errors", ()):
+                self.stderr.write(
+                    f"{key}: {data['name']}: features, character "
+                    f"{error.position}: {error.message}")
+                count += 1
+        return count
+
+    def import_rows(self, filepath, key, rows, author, profiler, options):
+        """Sync the rows of one file, committing them chunk by chunk.
+
+        Rows are keyed by key, the path of the file relative to the
+        import root, only new or modified rows are written (see
+        adversary_import_batch)."""
+        checkpoint = Path(options["checkpoint"]).resolve() \
+            if options["checkpoint"] \
+            else filepath.with_name(filepath.name + ".checkpoint")
+        done = read_checkpoint(checkpoint, filepath) \
+            if options["resume"] else 0
+        retire = options["retire"]
+
+        rows = profiler.iterate("parse", rows)
+        # rows committed by a previous run are skipped but still count
+        # as present in the file
+        names = {data["name"] for data in islice(rows, done)}
+        stats = Counter()
+        count = 0
+        for chunk in batched(rows, options["chunk_size"]):
+            with transaction.atomic():
+                for batch in batched(chunk, options["batch_size"]):
+                    with profiler.stage("parse"):
+                        dtos = [self.to_dto(data) for data in batch]
+                    stats["feature_errors"] += self.report_feature_errors(
+                        key, batch)
+                    stats.update(adversary_import_batch(
+                        dtos, author_id=author.id, source_key=key))
+            if retire:
+                names.update(data["name"] for data in chunk)
+            count += len(chunk)
+            profiler.rows += len(chunk)
+            write_checkpoint(checkpoint, filepath, done + count)
+
+        if retire:
+            with profiler.stage("retire"):
+                stats["retired"] = adversary_retire_missing(
+                    author.id, key, names)
+        checkpoint.unlink(missing_ok=True)
+        return stats
+
+    def handle(self, *args, **options):
+        filepaths = collect_tsv_files(options["tsv_path"])
+        root = import_root(options["tsv_path"])
+        if not filepaths:
+            raise CommandError(f"No tsv file matches {options['tsv_path']}.")
+        if options["checkpoint"] and len(filepaths) > 1:
+            raise CommandError("--checkpoint needs a single tsv file.")
+
+        scriptpath = Path(options["script_filepath"]).resolve() \
+            if options["script_filepath"] else self.default_scriptpath
+
+        try:
+            author = Account.objects.get(username=options["author"])
+        except Account.DoesNotExist:
+            raise CommandError(f"Unknown author '{options['author']}'.")
+
+        workers = options["workers"]
+        mod = import_script_from_path(scriptpath)
+        if workers > 1 and not hasattr(mod, "parse_row"):
+            # workers parse byte ranges of the files, row by row
+            raise CommandError(f"--workers needs a parser script defining "
+                               f"parse_row(row), {scriptpath} does not.")
+        # parsing is CPU bound and spread over processes in tasks of
+        # chunk_size rows, this process stays the single writer to the
+        # database
+        pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 \
+            else nullcontext()
+        profiler = ImportProfiler(trace=bool(options["profile"]))
+        with pool, profiler.run():
+            if workers > 1:
+                parsed = parse_files(pool, scriptpath, filepaths,
+                                     options["chunk_size"],
+                                     window=2 * workers)
+            else:
+                parsed = ((f, mod.parse_tsv(f)) for f in filepaths)
+
+            stats = Counter()
+            parsed = profiler.iterate("parse", parsed)
+            for filepath, rows in parsed:
+                stats.update(self.import_rows(
+                    filepath, source_key(root, filepath), rows, author,
+                    profiler, options))
 
-            adversary.tactics.add(*tactics)
-            adversary.experiences.add(*experiences)
-            adversary.features.add(*features)
+        self.stdout.write(
+            f"Imported {len(filepaths)} file(s): "
+            f"{stats['created']} created, {stats['updated']} updated, "
+            f"{stats['unchanged']} unchanged, {stats['retired']} retired, "
+            f"{stats['feature_errors']} feature parse error(s)."
+        )
+        self.stdout.write(profiler.summary())
+        if options["profile"]:
+            report = {"files": [str(f) for f in filepaths], **stats,
+                      **profiler.report(), "interning": intern_stats()}
+            Path(options["profile"]).write_text(json.dumps(report, indent=2))
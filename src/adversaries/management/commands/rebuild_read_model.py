@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from adversaries.helpers.generations import bump_generations
+from adversaries.models import Adversary
+from adversaries.read_model import documents_rebuild, DEFAULT_BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = "Rebuild the read model: the rendered document of every " \
+           "adversary"
+
+    def add_arguments(self, parser):
+        parser.add_argument('-b', '--batch-size', type=int,
+                            default=DEFAULT_BATCH_SIZE,
+                            help="documents rebuilt per transaction")
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        rebuilt = documents_rebuild(batch_size=options["batch_size"])
+        # the cached responses may hold the previous documents
+        bump_generations(Adversary)
+        self.stdout.write(f"Rebuilt {rebuilt} document(s) in "
+                          f"{time.perf_counter() - start:.2f}s.")
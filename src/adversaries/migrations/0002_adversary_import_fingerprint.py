@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 22:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adversary',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='adversary',
+            name='source_key',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['author', 'source_key'], name='adversaries_author__e2c9a6_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+import hashlib
+import json
+
+from django.db import migrations, models
+
+
+def _feature_hash(name, type_, description):
+    # frozen copy of adversaries.helpers.hashing.feature_hash
+    payload = json.dumps([name, type_, description], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def backfill_feature_hash(apps, schema_editor):
+    Feature = apps.get_model("adversaries", "Feature")
+    Through = apps.get_model("adversaries", "Adversary").features.through
+
+    kept = {}
+    duplicates = {}
+    batch = []
+    for feature in Feature.objects.only(
+            "id", "name", "type", "description").order_by("id").iterator(
+            chunk_size=2000):
+        h = _feature_hash(feature.name, feature.type, feature.description)
+        if h in kept:
+            # the old constraint let NULL descriptions repeat
+            duplicates[feature.id] = kept[h]
+            continue
+        kept[h] = feature.id
+        feature.hash = h
+        batch.append(feature)
+        if len(batch) >= 2000:
+            Feature.objects.bulk_update(batch, ["hash"])
+            batch = []
+    if batch:
+        Feature.objects.bulk_update(batch, ["hash"])
+
+    # point the links of duplicates to the kept feature, then drop them
+    for dup_id, keep_id in duplicates.items():
+        linked = Through.objects.filter(feature_id=keep_id) \
+            .values_list("adversary_id", flat=True)
+        Through.objects.filter(feature_id=dup_id,
+                               adversary_id__in=linked).delete()
+        Through.objects.filter(feature_id=dup_id).update(feature_id=keep_id)
+    Feature.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0002_adversary_import_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='feature',
+            name='hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_feature_hash,
+                             migrations.RunPython.noop),
+    ]
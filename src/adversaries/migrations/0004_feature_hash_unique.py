@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """Own migration (and transaction) so the backfill of 0003 is
+    committed before the table is altered."""
+
+    dependencies = [
+        ('adversaries', '0003_feature_hash'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='feature',
+            name='feature_entity',
+        ),
+        migrations.AlterField(
+            model_name='feature',
+            name='hash',
+            field=models.CharField(editable=False, max_length=64, unique=True),
+        ),
+    ]
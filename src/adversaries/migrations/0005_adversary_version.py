@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0004_feature_hash_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='adversary',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0005_adversary_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='adversary',
+            name='adversaries_name_67125c_idx',
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['name', 'id'], name='adversaries_name_4d8cd6_idx'),
+        ),
+    ]
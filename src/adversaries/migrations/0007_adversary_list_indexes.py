@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0006_adversary_name_id_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='adversary',
+            name='adversaries_status_26bf76_idx',
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['created_at', 'id'], name='adversaries_created_8d252d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['updated_at', 'id'], name='adversaries_updated_4224b1_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['tier', 'name', 'id'], name='adversaries_tier_84762b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['status', 'name', 'id'], name='adversaries_status_aaac3d_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['difficulty'], name='adversaries_difficu_1a4cd6_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='adversary',
+            index=models.Index(fields=['hit_point'], name='adversaries_hit_poi_a857a3_idx'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations
+
+
+# frozen copy of the documents of adversaries.search
+BODY = (
+    "coalesce(a.description, '') || ' ' || coalesce(("
+    "SELECT {agg}(f.name || ' ' || coalesce(f.description, ''), ' ') "
+    "FROM adversaries_adversary_features af "
+    "JOIN adversaries_feature f ON f.id = af.feature_id "
+    "WHERE af.adversary_id = a.id), '')"
+)
+
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE adversaries_adversary_search USING fts5("
+    "name, body, tokenize='porter unicode61')",
+    "INSERT INTO adversaries_adversary_search (rowid, name, body) "
+    "SELECT a.id, a.name, " + BODY.format(agg="group_concat") + " "
+    "FROM adversaries_adversary a",
+]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE adversaries_adversary_search ("
+    "adversary_id bigint PRIMARY KEY "
+    "REFERENCES adversaries_adversary (id) "
+    "ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+    "document tsvector NOT NULL)",
+    "CREATE INDEX adversaries_adversary_search_document "
+    "ON adversaries_adversary_search USING gin (document)",
+    "INSERT INTO adversaries_adversary_search (adversary_id, document) "
+    "SELECT a.id, "
+    "setweight(to_tsvector('english', a.name), 'A') || "
+    "setweight(to_tsvector('english', "
+    + BODY.format(agg="string_agg") + "), 'B') "
+    "FROM adversaries_adversary a",
+]
+
+
+def create_search_index(apps, schema_editor):
+    statements = {
+        "sqlite": SQLITE_CREATE,
+        "postgresql": POSTGRES_CREATE,
+    }.get(schema_editor.connection.vendor, [])
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ("sqlite", "postgresql"):
+        schema_editor.execute("DROP TABLE adversaries_adversary_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0007_adversary_list_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-17 23:35
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0008_adversary_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AdversaryDocument',
+            fields=[
+                ('adversary', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='document', serialize=False, to='adversaries.adversary')),
+                ('detail', models.TextField()),
+                ('summary', models.TextField()),
+            ],
+        ),
+    ]
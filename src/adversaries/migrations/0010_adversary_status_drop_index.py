@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0009_adversary_document'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='adversary',
+            name='status',
+            field=models.CharField(blank=True, choices=[(None, '(Unspecified)'), ('UNK', 'UNSPECIFIED'), ('DRA', 'DRAFT'), ('PUB', 'PUBLISHED')], db_column='status', default='UNK', max_length=3),
+        ),
+    ]
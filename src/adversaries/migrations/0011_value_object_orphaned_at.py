@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('adversaries', '0010_adversary_status_drop_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='basicattack',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='damageprofile',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='experience',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='feature',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tactic',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='orphaned_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+    ]
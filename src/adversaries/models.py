@@ -4,9 +4,21 @@ from django.db.models import Q
 from django.db.models.functions import Lower
 
 from accounts.models import Account
+from adversaries.helpers.hashing import feature_hash
 
 
-class Tactic(models.Model):
+class ValueObject(models.Model):
+    """Base of the shared rows adversaries reference"""
+    # set by the garbage collector when the row is first found
+    # unreferenced, cleared if it is referenced again
+    orphaned_at = models.DateTimeField(null=True, blank=True,
+                                       editable=False)
+
+    class Meta:
+        abstract = True
+
+
+class Tactic(ValueObject):
     """Value object"""
     name = models.CharField(max_length=100, unique=True)
 
@@ -19,7 +31,7 @@ class Tactic(models.Model):
         ]
 
 
-class Tag(models.Model):
+class Tag(ValueObject):
     """Value object"""
     name = models.CharField(max_length=100, unique=True)
 
@@ -32,7 +44,7 @@ class Tag(models.Model):
         ]
 
 
-class Experience(models.Model):
+class Experience(ValueObject):
     """Value object
     source: https://stackoverflow.com/questions/59596176/
     when-we-should-use-db-index-true-in-django#59596256
@@ -58,7 +70,7 @@ class DamageType(models.TextChoices):
     __empty__ = "(Unspecified)"
 
 
-class DamageProfile(models.Model):
+class DamageProfile(ValueObject):
     """Value object"""
     dice_number = models.PositiveSmallIntegerField(
         validators=[MinValueValidator(0)],
@@ -104,7 +116,7 @@ class DamageProfile(models.Model):
         ]
 
 
-class BasicAttack(models.Model):
+class BasicAttack(ValueObject):
     """Value object"""
     class Range(models.TextChoices):
         UNSPECIFIED = "UNK", "UNSPECIFIED"
@@ -148,7 +160,7 @@ class BasicAttack(models.Model):
         ]
 
 
-class Feature(models.Model):
+class Feature(ValueObject):
     """Entity"""
     class Type(models.TextChoices):
         UNSPECIFIED = "UNK", "UNSPECIFIED"
@@ -166,6 +178,9 @@ class Feature(models.Model):
         blank=True
     )
     description = models.TextField(null=True, blank=True)
+    # identity of the feature, a unique index on the description text
+    # would bloat and reject long texts
+    hash = models.CharField(max_length=64, unique=True, editable=False)
 
     @property
     def type_value(self):
@@ -175,13 +190,12 @@ class Feature(models.Model):
     def type_value(self, value):
         self.type = self.Type.UNSPECIFIED if value in (None, "") else value
 
-    class Meta:
-        constraints = [
-            models.UniqueConstraint(
-                fields=("name", "type", "description"),
-                name="feature_entity"
-            )
-        ]
+    def save(self, *args, **kwargs):
+        self.hash = feature_hash(self.name, self.type, self.description)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            kwargs["update_fields"] = {*update_fields, "hash"}
+        super().save(*args, **kwargs)
     # finish later the decomposition of features
 
 
@@ -250,14 +264,21 @@ class Adversary(models.Model):
     # metadata
     author = models.ForeignKey(to=Account, on_delete=models.PROTECT)
     source = models.CharField(max_length=200, null=True, blank=True)
+    # import bookkeeping: source_key is the tsv file a row came from (its
+    # path relative to the import root) and content_hash the fingerprint
+    # of the row, unchanged rows are skipped
+    source_key = models.CharField(max_length=255, null=True, blank=True)
+    content_hash = models.CharField(max_length=64, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # optimistic concurrency: bumped by every write of the services
+    version = models.PositiveIntegerField(default=1)
     status = models.CharField(
         max_length=3,
         choices=Status.choices,
         default=Status.UNSPECIFIED,
         blank=True,
-        db_index=True,
+        # indexed by the (status, name, id) index of Meta
         db_column="status"
     )
 
@@ -317,9 +338,17 @@ class Adversary(models.Model):
             )
         ]
         indexes = [
-            models.Index(fields=["name"]),
+            # filters and keyset orderings of the collection endpoint,
+            # author is served by the adversary_entity constraint
+            models.Index(fields=["name", "id"]),
+            models.Index(fields=["created_at", "id"]),
+            models.Index(fields=["updated_at", "id"]),
             models.Index(fields=["type", "tier"]),
-            models.Index(fields=["status"])
+            models.Index(fields=["tier", "name", "id"]),
+            models.Index(fields=["status", "name", "id"]),
+            models.Index(fields=["difficulty"]),
+            models.Index(fields=["hit_point"]),
+            models.Index(fields=["author", "source_key"]),
         ]
 
     def add_experience(self, experience, bonus=0):
@@ -345,3 +374,22 @@ class AdversaryExperience(models.Model):
                 name="unique_adversary_experience"
             )
         ]
+
+
+class AdversaryDocument(models.Model):
+    """Read model: the adversary as the API renders it, one row per
+    adversary, rebuilt by the services with every write of the aggregate
+    (see adversaries.read_model).
+
+    Documents are kept as JSON text, a jsonb column would not preserve
+    the order of the fields."""
+    adversary = models.OneToOneField(
+        Adversary,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="document"
+    )
+    # AdversaryDetailOut and AdversaryListOut (without the request
+    # dependent url) representations
+    detail = models.TextField()
+    summary = models.TextField()
@@ -0,0 +1,93 @@
+"""Read model of the adversaries: the rendered documents.
+
+Every read of an adversary used to join its author and basic attack and
+prefetch four relations. The documents (AdversaryDocument) store it as
+the v1 API renders it, the detail and the list item, so a read is a
+fetch by primary key. The services rebuild the documents of the
+adversaries they write, in their transaction; rebuild_read_model
+rebuilds them all, e.g. after writes made outside of the services.
+
+An adversary without a document (not built yet) is rendered from its
+rows by the readers.
+"""
+import json
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from adversaries.models import Adversary, AdversaryDocument
+from adversaries.selectors import adversary_list
+from api.v1.adversaries.serializers_out import AdversaryListOut, \
+    detail_representation, list_representation
+
+
+DEFAULT_BATCH_SIZE = 500
+
+# the url of a list item depends on the request, added when read
+SUMMARY_FIELDS = [f for f in AdversaryListOut._declared_fields
+                  if f != "url"]
+
+
+def render_documents(advs):
+    """Documents of advs, loaded with all their relations."""
+    summary = list_representation(SUMMARY_FIELDS)
+    return [
+        AdversaryDocument(
+            adversary_id=adv.pk,
+            detail=json.dumps(detail_representation(adv)),
+            summary=json.dumps(summary(adv)),
+        )
+        for adv in advs
+    ]
+
+
+def documents_refresh(adversary_ids, batch_size=DEFAULT_BATCH_SIZE,
+                      bump_version=False):
+    """(Re)build the documents of adversary_ids, a fixed number of
+    queries per batch: the adversaries with their relations, then one
+    upsert.
+
+    Args:
+        bump_version: move the version and updated_at of the
+            adversaries too (their ETag), for the writes made outside of
+            the services, which do it in their versioned save
+    """
+    ids = list(adversary_ids)
+    for i in range(0, len(ids), batch_size):
+        if bump_version:
+            (Adversary.objects
+             .filter(pk__in=ids[i:i + batch_size])
+             .update(version=F("version") + 1, updated_at=timezone.now()))
+        AdversaryDocument.objects.bulk_create(
+            render_documents(
+                adversary_list().filter(pk__in=ids[i:i + batch_size])),
+            update_conflicts=True,
+            unique_fields=["adversary"],
+            update_fields=["detail", "summary"],
+        )
+
+
+def documents_rebuild(batch_size=DEFAULT_BATCH_SIZE):
+    """Rebuild every document, batch by batch in id order, each batch
+    in its own transaction. The versions move, the rows may have been
+    written outside of the services.
+
+    Returns:
+        number of rebuilt documents
+    """
+    rebuilt = 0
+    last_pk = 0
+    while True:
+        ids = list(
+            adversary_list(fields=[])
+            .filter(pk__gt=last_pk)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not ids:
+            return rebuilt
+        with transaction.atomic():
+            documents_refresh(ids, batch_size, bump_version=True)
+        rebuilt += len(ids)
+        last_pk = ids[-1]
@@ -1,5 +1,11 @@
 import csv
-import re
+
+from adversaries.helpers.feature_tokenizer import tokenize_features
+
+
+def int_or_none(value):
+    value = value.strip().replace("+", "")
+    return int(value) if value else None
 
 
 def safe_split_threshold(value):
@@ -46,68 +52,49 @@ def clean_experience_input(experience_input):
     experiences = experience_input.split(",")
     output = []
     for experience in experiences:
-        name, value = experience.split(" +")
+        name, value = experience.strip().rsplit(" ", 1)
         output.append({"name": name.strip(), "bonus": int(value)})
     return output
 
 
 def clean_feature_input(feature_input):
-    chunks = re.split(r'\s{2,}', feature_input.strip())
-
-    header_pattern = re.compile(r'(.+)\s*-\s*(Passive|Action|Reaction):', re.I)
-    header_indexes = []
-    for idx, chunk in enumerate(chunks):
-        if header_pattern.match(chunk.strip()):
-            header_indexes.append(idx)
-
-    out = []
-    for i, header_idx in enumerate(header_indexes):
-        header = chunks[header_idx].strip()
-        name, ftype = header_pattern.match(header).groups()
-        name = name.strip()
-        ftype = ftype.strip().upper()[:3]
-
-        start = header_idx + 1
-        end = header_indexes[i + 1] if i + 1 < len(header_indexes) \
-            else len(chunks)
-        desc = " ".join(chunks[start:end]).strip()
-
-        out.append({
-            "name": name,
-            "type": ftype,
-            "description": desc
-        })
-    return out
+    """(features, errors) of the features cell, see tokenize_features."""
+    return tokenize_features(feature_input)
+
+
+def parse_row(row):
+    major, severe = safe_split_threshold(row[7])
+    features, feature_errors = clean_feature_input(row[15])
+    return {
+        "name": row[0],
+        "tier": int(row[1].split()[-1]),
+        "type": row[2].upper().strip()[:3],
+        "horde_hit_point": row[3].split("/")[0] or None,
+        "description": row[4],
+        "tactics": row[5].lower().split(","),
+        "difficulty": int_or_none(row[6]),
+        "threshold_major": major,
+        "threshold_severe": severe,
+        "hit_point": int_or_none(row[8]),
+        "stress_point": int_or_none(row[9]),
+        "atk_bonus": int_or_none(row[10]),
+        "basic_attack": {
+            "name": row[11],
+            "range": row[12].lower().strip(),
+            "damage": clean_damage_input(row[13]) if row[13].strip()
+            else None
+        } if row[11] else None,
+        "experiences": clean_experience_input(row[14]) if row[14]
+        else [],
+        "features": features,
+        "feature_errors": feature_errors,
+    }
 
 
 def parse_tsv(filepath):
+    """Yield one parsed row at a time, the file is never fully loaded."""
     with open(filepath, 'r', encoding="utf-8") as file:
         tsv_reader = csv.reader(file, delimiter="\t")
-        headers, *rows = list(tsv_reader)
-        output = []
-        for row in rows:
-            major, severe = safe_split_threshold(row[7])
-            data = {
-                "name": row[0],
-                "tier": int(row[1].split()[-1]),
-                "type": row[2].upper().strip()[:3],
-                "horde_hit_point": row[3].split("/")[0] or None,
-                "description": row[4],
-                "tactics": row[5].lower().split(","),
-                "difficulty": int(row[6]),
-                "threshold_major": major,
-                "threshold_severe": severe,
-                "hit_point": int(row[8]),
-                "stress_point": int(row[9]),
-                "atk_bonus": int(row[10].replace("+", "")),
-                "basic_attack": {
-                    "name": row[11],
-                    "range": row[12].lower().strip(),
-                    "damage": clean_damage_input(row[13])
-                },
-                "experiences": clean_experience_input(row[14]) if row[14]
-                else [],
-                "features": clean_feature_input(row[15])
-            }
-            output.append(data)
-        return output
+        next(tsv_reader, None)  # headers
+        for row in tsv_reader:
+            yield parse_row(row)
@@ -0,0 +1,158 @@
+"""Full-text search index of the adversaries.
+
+One document per adversary: its name (weighted most) and a body made of
+its description and the names and descriptions of its features. The
+index is an FTS5 virtual table on SQLite and a tsvector column with a
+GIN index on Postgres, both created by migration 0008. The services
+reindex the adversaries they write, in their transaction.
+
+Documents are built by the database from the stored rows, reindexing
+never loads the adversaries in python.
+"""
+import re
+
+from django.db import connection, NotSupportedError
+
+from adversaries.models import Adversary, Feature
+
+
+SEARCH_TABLE = "adversaries_adversary_search"
+
+# weight of the name against the body in the ranking
+NAME_WEIGHT = 10.0
+
+
+def _document_body(agg):
+    features = Adversary.features.through._meta.db_table
+    return (
+        f"coalesce(a.description, '') || ' ' || coalesce(("
+        f"SELECT {agg}(f.name || ' ' || coalesce(f.description, ''), ' ') "
+        f"FROM {features} af "
+        f"JOIN {Feature._meta.db_table} f ON f.id = af.feature_id "
+        f"WHERE af.adversary_id = a.id), '')"
+    )
+
+
+def _words(query):
+    # plain words only, no FTS / tsquery syntax reaches the database
+    return re.findall(r"\w+", query.lower())
+
+
+class _SqliteBackend:
+    def index(self, cursor, ids):
+        params = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({params})", ids)
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, name, body) "
+            f"SELECT a.id, a.name, {_document_body('group_concat')} "
+            f"FROM {Adversary._meta.db_table} a WHERE a.id IN ({params})",
+            ids,
+        )
+
+    def unindex(self, cursor, ids):
+        params = ", ".join(["%s"] * len(ids))
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid IN ({params})", ids)
+
+    def ranked(self, words):
+        # bm25 is lower for better matches
+        return (
+            f"SELECT rowid AS id, -bm25({SEARCH_TABLE}, {NAME_WEIGHT}, 1.0) "
+            f"AS score FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s",
+            [" OR ".join(f'"{w}"' for w in words)],
+        )
+
+
+class _PostgresBackend:
+    def index(self, cursor, ids):
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (adversary_id, document) "
+            f"SELECT a.id, "
+            f"setweight(to_tsvector('english', a.name), 'A') || "
+            f"setweight(to_tsvector('english', "
+            f"{_document_body('string_agg')}), 'B') "
+            f"FROM {Adversary._meta.db_table} a WHERE a.id = ANY(%s) "
+            f"ON CONFLICT (adversary_id) "
+            f"DO UPDATE SET document = EXCLUDED.document",
+            [ids],
+        )
+
+    def unindex(self, cursor, ids):
+        # the foreign key cascades too, for deletes outside the services
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE adversary_id = ANY(%s)",
+            [ids])
+
+    def ranked(self, words):
+        # weights of the D, C, B (body) and A (name) labels. ts_rank is a
+        # real, cast to the double the cursor round-trips so the (score,
+        # id) of a page compares equal to the stored rank
+        weights = f"{{0.1, 0.1, {1 / NAME_WEIGHT}, 1.0}}"
+        return (
+            f"SELECT adversary_id AS id, "
+            f"ts_rank('{weights}', document, q)::double precision "
+            f"AS score "
+            f"FROM {SEARCH_TABLE}, to_tsquery('english', %s) q "
+            f"WHERE document @@ q",
+            [" | ".join(words)],
+        )
+
+
+_BACKENDS = {
+    "sqlite": _SqliteBackend(),
+    "postgresql": _PostgresBackend(),
+}
+
+
+def _backend():
+    try:
+        return _BACKENDS[connection.vendor]
+    except KeyError:
+        raise NotSupportedError(
+            f"No full-text search for {connection.vendor}.")
+
+
+def search_index(adversary_ids):
+    """(Re)build the search documents of adversary_ids."""
+    ids = list(adversary_ids)
+    if ids:
+        with connection.cursor() as cursor:
+            _backend().index(cursor, ids)
+
+
+def search_unindex(adversary_ids):
+    """Drop the search documents of adversary_ids."""
+    ids = list(adversary_ids)
+    if ids:
+        with connection.cursor() as cursor:
+            _backend().unindex(cursor, ids)
+
+
+def search_ranked(query, limit, after=None):
+    """Adversary ids matching any word of query, best match first:
+    the more (and the rarer) words matched, in the name above all, the
+    better.
+
+    Args:
+        after: (score, id) of the last result of the previous page
+
+    Returns:
+        list of (id, score), ordered by score desc then id
+    """
+    words = _words(query)
+    if not words:
+        return []
+    sql, params = _backend().ranked(words)
+    where = ""
+    if after is not None:
+        score, pk = after
+        where = "WHERE score < %s OR (score = %s AND id > %s)"
+        params = [*params, score, score, pk]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT id, score FROM ({sql}) ranked {where} "
+            f"ORDER BY score DESC, id LIMIT %s",
+            [*params, limit],
+        )
+        return cursor.fetchall()
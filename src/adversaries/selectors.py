@@ -1,4 +1,11 @@
-from adversaries.models import Adversary, Experience, Tactic, Tag, Feature
+from django.db.models import Count, Exists, F, Max, OuterRef, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Lower
+
+from adversaries.models import Adversary, Experience, Tactic, Tag, Feature, \
+    BasicAttack, DamageProfile, AdversaryExperience
+from adversaries.json_export import export_document_sql
+from adversaries.search import search_ranked
 
 
 def adversary_get(pk):
@@ -15,17 +22,183 @@ def adversary_get(pk):
     )
 
 
-def adversary_list():
+# keyset orderings of the collection, each one backed by an index
+ADVERSARY_ORDERINGS = {
+    "name": ("name", "id"),
+    "-name": ("-name", "-id"),
+    "created_at": ("created_at", "id"),
+    "-created_at": ("-created_at", "-id"),
+    "updated_at": ("updated_at", "id"),
+    "-updated_at": ("-updated_at", "-id"),
+}
+
+
+def _linked_to(model, through, field, name):
+    # value object names are matched on Lower(name), its unique index
+    ids = model.objects.annotate(name_key=Lower("name")) \
+        .filter(name_key=Lower(Value(name))).values("id")
+    return Q(pk__in=through.objects.filter(**{f"{field}__in": ids})
+             .values("adversary_id"))
+
+
+# relations loaded with a join or a prefetch, by adversary field name
+ADVERSARY_JOINS = {
+    "author": "author",
+    "basic_attack": "basic_attack__damage",
+}
+ADVERSARY_PREFETCHES = {
+    "tactics": "tactics",
+    "tags": "tags",
+    "features": "features",
+    "experiences": "adversary_experiences__experience",
+}
+
+
+def _load(qs, fields):
+    if fields is None:
+        return (
+            qs
+            .select_related(*ADVERSARY_JOINS.values())
+            .prefetch_related(*ADVERSARY_PREFETCHES.values())
+        )
+    qs = qs.only("id", *(f for f in fields if f not in ADVERSARY_PREFETCHES))
+    joins = [ADVERSARY_JOINS[f] for f in fields if f in ADVERSARY_JOINS]
+    # select_related() without argument would follow every foreign key
+    if joins:
+        qs = qs.select_related(*joins)
+    return qs.prefetch_related(*(ADVERSARY_PREFETCHES[f] for f in fields
+                                 if f in ADVERSARY_PREFETCHES))
+
+
+def adversary_list(*, fields=None, tier=None, type=None, status=None,
+                   author_id=None, tags=(), tactics=(), difficulty_min=None,
+                   difficulty_max=None, hit_point_min=None,
+                   hit_point_max=None):
+    """Adversaries matching every given filter.
+
+    Args:
+        fields: adversary fields and relations to load, the other
+            columns are deferred and their joins / prefetches skipped.
+            Everything when None.
+        tags: names of tags the adversary must all have
+        tactics: names of tactics the adversary must all have
+        difficulty_min, difficulty_max, hit_point_min, hit_point_max:
+            inclusive bounds
+    """
+    filters = {
+        "tier": tier,
+        "type": type,
+        "status": status,
+        "author_id": author_id,
+        "difficulty__gte": difficulty_min,
+        "difficulty__lte": difficulty_max,
+        "hit_point__gte": hit_point_min,
+        "hit_point__lte": hit_point_max,
+    }
+    qs = Adversary.objects.filter(
+        **{k: v for k, v in filters.items() if v is not None})
+    for name in tags:
+        qs = qs.filter(_linked_to(Tag, Adversary.tags.through, "tag", name))
+    for name in tactics:
+        qs = qs.filter(_linked_to(Tactic, Adversary.tactics.through,
+                                  "tactic", name))
+    return _load(qs, fields)
+
+
+def adversary_document(pk):
+    """(version, updated_at, detail document) of the adversary, in one
+    query, None when it does not exist.
+
+    The document is the JSON text of the read model, None when it is
+    not built (see adversaries.read_model)."""
     return (
         Adversary.objects
-        .select_related("author", "basic_attack__damage")
-        .prefetch_related(
-            "tactics",
-            "tags",
-            "features",
-            "adversary_experiences__experience",
-        )
-        .all()
+        .filter(pk=pk)
+        .values_list("version", "updated_at", "document__detail")
+        .first()
+    )
+
+
+def with_summaries(qs):
+    """qs with the list document (JSON text) of each adversary as
+    summary, None when it is not built. One left join on the primary
+    key, whatever the relations of the document."""
+    return qs.annotate(summary=F("document__summary"))
+
+
+def adversary_list_state(**filters):
+    """(last updated_at, count) of adversary_list(**filters), in one
+    aggregate query. updated_at is None for an empty list."""
+    state = (
+        adversary_list(fields=["updated_at"], **filters)
+        .aggregate(last=Max("updated_at"), count=Count("id"))
+    )
+    return state["last"], state["count"]
+
+
+def adversary_ranked(ranked, fields=None, summaries=False):
+    """Adversaries of ranked, a list of (id, score) of search_ranked, in
+    its order.
+
+    Args:
+        fields: see adversary_list
+        summaries: load the list documents too, see with_summaries
+
+    Returns:
+        list of (adversary, score)
+    """
+    qs = adversary_list(fields=fields)
+    if summaries:
+        qs = with_summaries(qs)
+    advs = qs.in_bulk([pk for pk, _ in ranked])
+    # an adversary deleted since it was indexed is not a result
+    return [(advs[pk], score) for pk, score in ranked if pk in advs]
+
+
+def adversary_search(query, limit, after=None, fields=None,
+                     summaries=False):
+    """Page of the adversaries matching the full-text query, best first.
+
+    Args:
+        after: (score, id) of the last result of the previous page
+        fields, summaries: see adversary_ranked
+
+    Returns:
+        list of (adversary, score)
+    """
+    return adversary_ranked(search_ranked(query, limit, after),
+                            fields=fields, summaries=summaries)
+
+
+def adversary_names_taken(author_id, names):
+    return set(
+        Adversary.objects
+        .filter(author_id=author_id, name__in=names)
+        .values_list("name", flat=True)
+    )
+
+
+def adversary_iter(chunk_size=2000, **filters):
+    """Stream the adversaries of adversary_list(**filters) by id,
+    relations are prefetched chunk by chunk."""
+    return (
+        adversary_list(**filters)
+        .order_by("id")
+        .iterator(chunk_size=chunk_size)
+    )
+
+
+def adversary_export_documents(chunk_size=2000, **filters):
+    """Stream the export documents (JSON text) of the adversaries of
+    adversary_list(**filters) by id. Each document is assembled by the
+    database, relations included, in a single query: no model instance
+    is built."""
+    return (
+        adversary_list(fields=[], **filters)
+        .annotate(export_document=RawSQL(export_document_sql(), ()))
+        .order_by("id")
+        .values_list("export_document", flat=True)
+        .iterator(chunk_size=chunk_size)
     )
 
 
@@ -59,3 +232,28 @@ def feature_get(pk):
 
 def feature_list():
     return Feature.objects.all()
+
+
+def value_object_orphans():
+    """Unreferenced value object rows, as (model, queryset) pairs in a
+    safe deletion order: basic attacks before the damage profiles they
+    reference. Each queryset is a NOT EXISTS anti-join."""
+    def unreferenced(model, referencing, field):
+        return model.objects.filter(~Exists(
+            referencing.filter(**{field: OuterRef("pk")})))
+
+    orphan_attacks = unreferenced(BasicAttack, Adversary.objects,
+                                  "basic_attack")
+    # damage profiles only used by orphan basic attacks are orphans too
+    used_attacks = BasicAttack.objects.exclude(pk__in=orphan_attacks)
+    return [
+        (BasicAttack, orphan_attacks),
+        (DamageProfile, unreferenced(DamageProfile, used_attacks, "damage")),
+        (Feature, unreferenced(Feature, Adversary.features.through.objects,
+                               "feature")),
+        (Tactic, unreferenced(Tactic, Adversary.tactics.through.objects,
+                              "tactic")),
+        (Tag, unreferenced(Tag, Adversary.tags.through.objects, "tag")),
+        (Experience, unreferenced(Experience, AdversaryExperience.objects,
+                                  "experience")),
+    ]
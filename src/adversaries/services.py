@@ -1,39 +1,207 @@
-from django.db import transaction
-from django.db.models import Q
-
+import string
+from contextlib import contextmanager
+from datetime import timedelta
+from functools import wraps
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, connections, router, \
+    transaction
+from django.db.models import F, Q, Value
+from django.db.models.functions import Lower
+from django.utils import timezone
+
+from adversaries.dtos.dto import DamageDTO
+from adversaries.exceptions import VersionConflict
+from adversaries.helpers.generations import bump_generations
+from adversaries.helpers.hashing import content_hash, feature_hash
+from adversaries.helpers.instrumentation import stage
+from adversaries.helpers.interning import intern_cache, intern_invalidate
 from adversaries.helpers.sentinel import is_unset
 from adversaries.models import Adversary, Tactic, Tag, Experience, \
     Feature, DamageProfile, BasicAttack, AdversaryExperience, DamageType
+from adversaries.read_model import documents_refresh
+from adversaries.search import search_index
+from adversaries.selectors import value_object_orphans
 
 
 def _remove_none_field(d):
     return {k: v for k, v in d.items() if v is not None}
 
 
-@transaction.atomic
-def adversary_create(dto, author_id):
-    """TODO: Optimize queries later (less query if possible)"""
-    ba_obj = None
-    if dto.basic_attack is not None:
-        dp_obj = None
-        dmg = dto.basic_attack.damage
-        if dmg:
-            dp_kwargs = _remove_none_field({
-                "dice_number": dmg.dice_number,
-                "dice_type": dmg.dice_type,
-                "bonus": dmg.bonus,
-                "damage_type": dmg.damage_type,
-            })
-            dp_obj, _ = DamageProfile.objects.get_or_create(**dp_kwargs)
-
-        ba_kwargs = _remove_none_field({
-            "name": dto.basic_attack.name,
-            "range": dto.basic_attack.range,
-            "damage": dp_obj,
-        })
-        ba_obj, _ = BasicAttack.objects.get_or_create(**ba_kwargs)
-
-    adv_kwargs = _remove_none_field({
+DAMAGE_PROFILE_KEY = ("dice_number", "dice_type", "bonus", "damage_type")
+BASIC_ATTACK_KEY = ("name", "range", "damage_id")
+FEATURE_KEY = ("name", "type", "description")
+
+
+def _damage_key(dto):
+    # keys are compared to database values, coerce like the fields would
+    return (
+        int(dto.dice_number or 0),
+        int(dto.dice_type or 0),
+        int(dto.bonus or 0),
+        dto.damage_type or DamageType.UNSPECIFIED,
+    )
+
+
+def _basic_attack_key(dto, dp_ids):
+    dp_id = dp_ids[_damage_key(dto.damage)] if dto.damage else None
+    return dto.name, dto.range or BasicAttack.Range.UNSPECIFIED, dp_id
+
+
+def _feature_key(dto):
+    return dto.name, dto.type or Feature.Type.UNSPECIFIED, dto.description
+
+
+def _fetch_value_object_ids(model, fields, keys):
+    """One query: filter on the distinct values of each field (superset
+    of the wanted rows) then keep exact key matches in python."""
+    q = Q()
+    for i, f in enumerate(fields):
+        values = {k[i] for k in keys}
+        field_q = Q(**{f"{f}__in": values - {None}})
+        if None in values:
+            field_q |= Q(**{f"{f}__isnull": True})
+        q &= field_q
+
+    rows = model.objects.filter(q).values_list(*fields, "id")
+    return {row[:-1]: row[-1] for row in rows if row[:-1] in keys}
+
+
+def _resolve_value_objects(model, fields, keys):
+    """Map every distinct key (tuple ordered as fields) to a row id.
+
+    Interned keys cost nothing, the others are looked up and the
+    missing rows bulk created: at most three queries whatever the
+    number of keys."""
+    keys = set(keys)
+    if not keys:
+        return {}
+
+    interned = intern_cache(model)
+    found = {}
+    if interned is not None:
+        found, missing = interned.lookup(keys)
+        if not missing:
+            return found
+        keys = set(missing)
+
+    existing = _fetch_value_object_ids(model, fields, keys)
+    to_create = [model(**dict(zip(fields, k)))
+                 for k in keys if k not in existing]
+    if to_create:
+        model.objects.bulk_create(to_create)
+        bump_generations(model)
+        existing = _fetch_value_object_ids(model, fields, keys)
+
+    if interned is not None:
+        interned.remember(existing)
+    return {**found, **existing}
+
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+
+def _name_key(name):
+    # same folding as the LOWER() of the Lower("name") unique indexes,
+    # SQLite only folds ASCII: "Écraser" and "écraser" are two rows there
+    if connection.vendor == "sqlite":
+        return name.translate(_ASCII_LOWER)
+    return name.lower()
+
+
+def _ids_by_name_key(model, names_by_key, exhaustive=False):
+    """Name key -> id of the rows of the names of names_by_key (name key
+    -> name), keyed by the lowered name of the database.
+
+    Args:
+        exhaustive: look the keys not found up one by one with the
+            LOWER() of the database, in case _name_key folded them
+            differently
+    """
+    qs = model.objects.annotate(name_key=Lower("name"))
+    ids = dict(
+        qs.filter(name_key__in=names_by_key).values_list("name_key", "id"))
+    if not exhaustive:
+        return ids
+    for key in names_by_key.keys() - ids.keys():
+        pk = qs.filter(name_key=Lower(Value(names_by_key[key]))) \
+            .values_list("id", flat=True).first()
+        if pk is not None:
+            ids[key] = pk
+    return ids
+
+
+def _resolve_names(model, names):
+    """Name -> id for value objects identified by their name, whatever
+    its casing.
+
+    Lookups filter on Lower(name), which the functional unique index
+    covers, so "Burrow" finds "burrow". The casing stored first stays
+    the display one: a new row takes the first casing of names."""
+    first_casing = {}
+    for name in names:
+        first_casing.setdefault(_name_key(name), name)
+    if not first_casing:
+        return {}
+
+    interned = intern_cache(model)
+    ids = {}
+    missing = list(first_casing)
+    if interned is not None:
+        found, missing = interned.lookup([(k,) for k in first_casing])
+        ids = {k[0]: pk for k, pk in found.items()}
+        missing = [k[0] for k in missing]
+
+    if missing:
+        missing = {k: first_casing[k] for k in missing}
+        existing = _ids_by_name_key(model, missing)
+        to_create = [model(name=name)
+                     for k, name in missing.items() if k not in existing]
+        if to_create:
+            # a row folded differently is already there, found below
+            model.objects.bulk_create(to_create, ignore_conflicts=True)
+            bump_generations(model)
+            existing = _ids_by_name_key(model, missing, exhaustive=True)
+        if interned is not None:
+            interned.remember({(k,): pk for k, pk in existing.items()})
+        ids.update(existing)
+
+    return {name: ids[_name_key(name)] for name in names}
+
+
+def _feature_ids_by_hash(hashes):
+    return dict(
+        Feature.objects
+        .filter(hash__in=hashes)
+        .values_list("hash", "id")
+    )
+
+
+def _resolve_features(keys):
+    """Map (name, type, description) keys to Feature ids.
+
+    Features are looked up on their indexed hash column, a single
+    hash__in query whatever the number and length of the keys, missing
+    ones are bulk created."""
+    by_hash = {feature_hash(*k): k for k in keys}
+    if not by_hash:
+        return {}
+
+    existing = _feature_ids_by_hash(by_hash)
+    to_create = [
+        Feature(name=k[0], type=k[1], description=k[2], hash=h)
+        for h, k in by_hash.items() if h not in existing
+    ]
+    if to_create:
+        Feature.objects.bulk_create(to_create)
+        bump_generations(Feature)
+        existing = _feature_ids_by_hash(by_hash)
+
+    return {by_hash[h]: pk for h, pk in existing.items()}
+
+
+def _adversary_fields(dto):
+    return _remove_none_field({
         "name": dto.name,
         "tier": dto.tier,
         "type": dto.type,
@@ -45,135 +213,631 @@ def adversary_create(dto, author_id):
         "horde_hit_point": dto.horde_hit_point,
         "stress_point": dto.stress_point,
         "atk_bonus": dto.atk_bonus,
-        "basic_attack": ba_obj,
         "source": dto.source,
         "status": dto.status,
     })
 
-    adv = Adversary(**adv_kwargs, author_id=author_id)
+
+def _resolve_relations(dtos):
+    """Resolve every distinct value object referenced by dtos, a few
+    queries per model whatever the number of dtos and items."""
+    basic_attacks = [d.basic_attack for d in dtos if d.basic_attack]
+    dp_ids = _resolve_value_objects(
+        DamageProfile, DAMAGE_PROFILE_KEY,
+        {_damage_key(ba.damage) for ba in basic_attacks if ba.damage})
+    return {
+        "tactics": _resolve_names(
+            Tactic, [t.name for d in dtos for t in d.tactics]),
+        "tags": _resolve_names(
+            Tag, [t.name for d in dtos for t in d.tags]),
+        "experiences": _resolve_names(
+            Experience, [e.name for d in dtos for e in d.experiences]),
+        "features": _resolve_features(
+            {_feature_key(f) for d in dtos for f in d.features}),
+        "damage_profiles": dp_ids,
+        "basic_attacks": _resolve_value_objects(
+            BasicAttack, BASIC_ATTACK_KEY,
+            {_basic_attack_key(ba, dp_ids) for ba in basic_attacks}),
+    }
+
+
+def _basic_attack_id(dto, resolved):
+    if dto.basic_attack is None:
+        return None
+    key = _basic_attack_key(dto.basic_attack, resolved["damage_profiles"])
+    return resolved["basic_attacks"][key]
+
+
+def _link_relations(advs, dtos, resolved):
+    """Bulk insert the M2M and experience through rows of saved advs,
+    one query per relation."""
+    tactic_through = Adversary.tactics.through
+    tag_through = Adversary.tags.through
+    feature_through = Adversary.features.through
+    tactic_ids = resolved["tactics"]
+    tag_ids = resolved["tags"]
+    feat_ids = resolved["features"]
+    exp_ids = resolved["experiences"]
+
+    tactic_rows, tag_rows, feature_rows, exp_rows = [], [], [], []
+    for adv, dto in zip(advs, dtos):
+        # names differing only by their casing are the same row
+        tactic_rows += [
+            tactic_through(adversary_id=adv.pk, tactic_id=pk)
+            for pk in dict.fromkeys(tactic_ids[t.name] for t in dto.tactics)
+        ]
+        tag_rows += [
+            tag_through(adversary_id=adv.pk, tag_id=pk)
+            for pk in dict.fromkeys(tag_ids[t.name] for t in dto.tags)
+        ]
+        feature_rows += [
+            feature_through(adversary_id=adv.pk, feature_id=feat_ids[k])
+            for k in dict.fromkeys(_feature_key(f) for f in dto.features)
+        ]
+        bonuses = {exp_ids[e.name]: e.bonus or 0 for e in dto.experiences}
+        exp_rows += [
+            AdversaryExperience(adversary_id=adv.pk,
+                                experience_id=pk,
+                                bonus=bonus)
+            for pk, bonus in bonuses.items()
+        ]
+
+    for model, rows in ((tactic_through, tactic_rows),
+                        (tag_through, tag_rows),
+                        (feature_through, feature_rows),
+                        (AdversaryExperience, exp_rows)):
+        if rows:
+            model.objects.bulk_create(rows)
+
+
+def _is_fk_violation(exc):
+    return "foreign key" in str(exc).lower()
+
+
+def _retry_stale_interning(service):
+    """Run service again, once, with the interned ids dropped when its
+    transaction failed on a foreign key: an interned row was deleted by
+    a process whose invalidation did not reach this one.
+
+    Only the outermost transaction is retried, the foreign keys are
+    checked on its commit."""
+    @wraps(service)
+    def wrapper(*args, **kwargs):
+        outermost = not transaction.get_connection().in_atomic_block
+        try:
+            return service(*args, **kwargs)
+        except IntegrityError as exc:
+            if not (outermost and _is_fk_violation(exc)):
+                raise
+            intern_invalidate()
+            return service(*args, **kwargs)
+    return wrapper
+
+
+@_retry_stale_interning
+@transaction.atomic
+def adversary_create(dto, author_id):
+    """Create one adversary with its relations.
+
+    Value objects are resolved set-wise and through rows bulk inserted,
+    the query count does not depend on the number of tactics, tags,
+    experiences or features."""
+    resolved = _resolve_relations([dto])
+
+    adv = Adversary(**_adversary_fields(dto),
+                    basic_attack_id=_basic_attack_id(dto, resolved),
+                    author_id=author_id)
     adv.full_clean()
     adv.save()
 
-    for t in dto.tactics:
-        obj, _ = Tactic.objects.get_or_create(name=t.name)
-        adv.tactics.add(obj)
-    for tg in dto.tags:
-        obj, _ = Tag.objects.get_or_create(name=tg.name)
-        adv.tags.add(obj)
-    for exp in dto.experiences:
-        obj, _ = Experience.objects.get_or_create(name=exp.name)
-        adv.add_experience(obj, bonus=exp.bonus)
-    for f in dto.features:
-        feat, _ = Feature.objects.get_or_create(
-            name=f.name, type=Feature.Type(f.type), description=f.description)
-        adv.features.add(feat)
+    _link_relations([adv], [dto], resolved)
+    search_index([adv.pk])
+    documents_refresh([adv.pk])
+    bump_generations(Adversary)
 
     return adv
 
 
-def _sync_experiences(adv, exp_dtos):
-    target = {e.name: e.bonus for e in exp_dtos}
-    if not target:
-        AdversaryExperience.objects.filter(adversary=adv).delete()
-        return
+@_retry_stale_interning
+@transaction.atomic
+def adversary_bulk_create(dtos, author_id):
+    """Create a batch of adversaries with a fixed number of queries.
+
+    Every distinct value object of the batch is resolved once (lookup,
+    bulk_create of the missing rows, lookup again), then adversaries and
+    M2M / through rows are bulk inserted. The query count depends on
+    the number of relations, not on the number of dtos."""
+    dtos = list(dtos)
+    if not dtos:
+        return []
+
+    with stage("resolve"):
+        resolved = _resolve_relations(dtos)
+
+    with stage("insert"):
+        advs = []
+        for dto in dtos:
+            adv = Adversary(**_adversary_fields(dto),
+                            basic_attack_id=_basic_attack_id(dto, resolved),
+                            author_id=author_id)
+            # FK and unique checks would cost one query per row, the
+            # database constraints enforce them on insert.
+            adv.full_clean(exclude=["author", "basic_attack"],
+                           validate_unique=False,
+                           validate_constraints=False)
+            advs.append(adv)
+        Adversary.objects.bulk_create(advs)
+
+        adv_ids = dict(
+            Adversary.objects
+            .filter(author_id=author_id, name__in=[a.name for a in advs])
+            .values_list("name", "id")
+        )
+        for adv in advs:
+            adv.pk = adv_ids[adv.name]
+
+    with stage("link"):
+        _link_relations(advs, dtos, resolved)
 
-    names = list(target.keys())
+    with stage("index"):
+        search_index(adv.pk for adv in advs)
+    with stage("document"):
+        documents_refresh(adv.pk for adv in advs)
+    bump_generations(Adversary)
 
-    names_to_id = dict(
-        Experience.objects
-        .filter(name__in=names)
-        .values_list("name", "id")
-    )
+    return advs
 
-    missing = [Experience(name=n) for n in names if n not in names_to_id]
-    if missing:
-        Experience.objects.bulk_create(missing)
-        names_to_id = dict(
-            Experience.objects
-            .filter(name__in=names)
-            .values_list("name", "id")
+
+@_retry_stale_interning
+@transaction.atomic
+def adversary_import_batch(dtos, author_id, source_key):
+    """Delta import of a batch of rows coming from source_key.
+
+    Rows are matched on (author, name) and fingerprinted: new rows are
+    bulk created, rows whose fingerprint or source changed are updated
+    and unchanged rows cost nothing.
+
+    Returns:
+        dict counting the "created", "updated" and "unchanged" rows
+    """
+    with stage("diff"):
+        hashes = [content_hash(dto) for dto in dtos]
+        existing = {
+            name: (pk, h, key)
+            for name, pk, h, key in (
+                Adversary.objects
+                .filter(author_id=author_id, name__in=[d.name for d in dtos])
+                .values_list("name", "id", "content_hash", "source_key")
+            )
+        }
+
+        new, changed = [], []
+        for dto, h in zip(dtos, hashes):
+            row = existing.get(dto.name)
+            if row is None:
+                new.append((dto, h))
+            elif row[1:] != (h, source_key):
+                changed.append((row[0], dto, h))
+
+    advs = adversary_bulk_create([dto for dto, _ in new], author_id)
+    with stage("insert"):
+        for adv, (_, h) in zip(advs, new):
+            adv.content_hash = h
+            adv.source_key = source_key
+        if advs:
+            Adversary.objects.bulk_update(advs,
+                                          ["content_hash", "source_key"])
+
+    with stage("update"):
+        for pk, dto, h in changed:
+            adversary_update(Adversary(pk=pk), dto)
+            (Adversary.objects
+             .filter(pk=pk)
+             .update(content_hash=h, source_key=source_key))
+
+    return {
+        "created": len(new),
+        "updated": len(changed),
+        "unchanged": len(dtos) - len(new) - len(changed),
+    }
+
+
+def adversary_retire_missing(author_id, source_key, kept_names,
+                             batch_size=500):
+    """Delete the adversaries imported from source_key that are not in
+    kept_names anymore, batch by batch to keep transactions short.
+
+    Returns:
+        number of deleted adversaries
+    """
+    stale = [
+        pk for pk, name in (
+            Adversary.objects
+            .filter(author_id=author_id, source_key=source_key)
+            .values_list("id", "name")
+            .iterator()
         )
+        if name not in kept_names
+    ]
+    for i in range(0, len(stale), batch_size):
+        with transaction.atomic():
+            (Adversary.objects
+             .filter(pk__in=stale[i:i + batch_size])
+             .delete())
+            bump_generations(Adversary)
+    return len(stale)
+
+
+# README: orphans are kept for a month before their deletion
+GC_GRACE = timedelta(days=30)
+
+
+def _delete_still_unreferenced(model, orphans, pks, using):
+    """Delete the rows of pks that are still orphans, in one statement.
+
+    The anti-join is re-checked by the DELETE itself: a row referenced
+    since the lookup is kept, and no link of it is deleted (a Collector
+    would cascade them).
+
+    Returns:
+        number of deleted rows
+    """
+    still_orphans, params = orphans.using(using).filter(pk__in=pks) \
+        .values("pk").query.sql_with_params()
+    table = connections[using].ops.quote_name(model._meta.db_table)
+    column = connections[using].ops.quote_name(model._meta.pk.column)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN "
+                       f"({still_orphans})", params)
+        return cursor.rowcount
+
+
+def value_objects_gc(batch_size=1000, dry_run=False, grace=GC_GRACE):
+    """Delete the value objects no adversary references anymore.
+
+    A run first marks the new orphans and unmarks the rows referenced
+    again; only the rows orphaned for longer than grace are deleted.
+    The window covers a writer that resolved an old orphan but has not
+    linked it yet: its foreign key would fail at commit.
+
+    Orphans are deleted batch by batch, each batch in its own short
+    transaction on the write alias. A batch whose delete still breaks
+    a foreign key (a link committed concurrently) is skipped.
+
+    Args:
+        grace: timedelta a row stays unreferenced before its deletion
+
+    Returns:
+        dict model label -> number of deleted (or, dry_run, deletable)
+        rows
+    """
+    now = timezone.now()
+    cutoff = now - grace
+    reclaimed = {}
+    for model, orphans in value_object_orphans():
+        label = model._meta.label_lower
+        using = router.db_for_write(model)
+        if dry_run:
+            deletable = Q(orphaned_at__lte=cutoff)
+            if cutoff >= now:
+                # rows this run would mark are already past the window
+                deletable |= Q(orphaned_at__isnull=True)
+            reclaimed[label] = orphans.filter(deletable).count()
+            continue
+
+        with transaction.atomic(using=using):
+            (model.objects.using(using)
+             .filter(orphaned_at__isnull=False)
+             .exclude(pk__in=orphans.values("pk"))
+             .update(orphaned_at=None))
+            orphans.using(using).filter(orphaned_at__isnull=True) \
+                .update(orphaned_at=now)
+
+        reclaimed[label] = 0
+        interned = intern_cache(model)
+        expired = orphans.using(using).filter(orphaned_at__lte=cutoff)
+        last_pk = 0
+        while True:
+            pks = list(
+                expired
+                .filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", flat=True)[:batch_size]
+            )
+            if not pks:
+                break
+            last_pk = pks[-1]
+            try:
+                with transaction.atomic(using=using):
+                    deleted = _delete_still_unreferenced(
+                        model, expired, pks, using)
+                    if deleted:
+                        # no signals either
+                        bump_generations(model)
+                        if interned is not None:
+                            interned.invalidate()
+            except IntegrityError:
+                continue
+            reclaimed[label] += deleted
+    return reclaimed
+
+
+def _apply_link_diff(m2m_manager, current_ids, target_ids):
+    """Delete and insert only the through rows that differ.
+
+    Returns:
+        True if a row was written
+    """
+    through = m2m_manager.through
+    source = m2m_manager.source_field_name
+    target = m2m_manager.target_field_name
+    adv_id = m2m_manager.instance.pk
+
+    to_remove = current_ids - target_ids
+    to_add = target_ids - current_ids
+    if to_remove:
+        (through.objects
+         .filter(**{source: adv_id, f"{target}__in": to_remove})
+         .delete())
+    if to_add:
+        through.objects.bulk_create([
+            through(**{f"{source}_id": adv_id, f"{target}_id": pk})
+            for pk in to_add
+        ])
+    return bool(to_remove or to_add)
+
+
+def _current_names(m2m_manager):
+    return {_name_key(name): pk
+            for name, pk in m2m_manager.values_list("name", "id")}
+
+
+def _current_experiences(adv):
+    return {
+        _name_key(name): (exp_id, bonus)
+        for name, exp_id, bonus in (
+            AdversaryExperience.objects
+            .filter(adversary=adv)
+            .values_list("experience__name", "experience_id", "bonus")
+        )
+    }
+
+
+def _current_features(m2m_manager):
+    return {row[:-1]: row[-1]
+            for row in m2m_manager.values_list(*FEATURE_KEY, "id")}
+
+
+def _load_links(adv):
+    """Current M2M and experience state of adv, one query per relation."""
+    return {
+        "tactics": _current_names(adv.tactics),
+        "tags": _current_names(adv.tags),
+        "features": _current_features(adv.features),
+        "experiences": _current_experiences(adv),
+    }
+
+
+def _sync_experiences(adv, exp_dtos, current=None):
+    """Make the experiences of adv match exp_dtos.
+
+    Args:
+        current: name key -> (experience id, bonus) already linked,
+            loaded when not given
 
-    seen_ids = set()
-    for name, bonus in target.items():
-        exp_id = names_to_id[name]
-        AdversaryExperience.objects.update_or_create(
-            adversary=adv,
-            experience_id=exp_id,
-            defaults={"bonus": bonus}
+    Returns:
+        True if a row was written
+    """
+    if current is None:
+        current = _current_experiences(adv)
+    target = {_name_key(e.name): e.bonus or 0 for e in exp_dtos}
+
+    exp_ids = {key: exp_id for key, (exp_id, _) in current.items()}
+    exp_ids.update({
+        _name_key(name): pk
+        for name, pk in _resolve_names(
+            Experience,
+            [e.name for e in exp_dtos if _name_key(e.name) not in current]
+        ).items()
+    })
+
+    # new links and changed bonuses in a single upsert
+    upserts = [
+        AdversaryExperience(adversary_id=adv.pk,
+                            experience_id=exp_ids[key],
+                            bonus=bonus)
+        for key, bonus in target.items()
+        if current.get(key, (None, None))[1] != bonus
+    ]
+    if upserts:
+        AdversaryExperience.objects.bulk_create(
+            upserts,
+            update_conflicts=True,
+            unique_fields=["adversary", "experience"],
+            update_fields=["bonus"],
         )
-        seen_ids.add(exp_id)
 
-    (AdversaryExperience.objects
-     .filter(adversary=adv)
-     .exclude(experience_id__in=seen_ids)
-     .delete())
+    stale = [exp_id for key, (exp_id, _) in current.items()
+             if key not in target]
+    if stale:
+        (AdversaryExperience.objects
+         .filter(adversary=adv, experience_id__in=stale)
+         .delete())
 
+    return bool(upserts or stale)
 
-def _sync_m2m_by_name(m2m_manager, model, dtos):
+
+def _sync_m2m_by_name(m2m_manager, model, dtos, current=None):
+    """Make the links of m2m_manager match the names of dtos.
+
+    Args:
+        current: name key -> id already linked, loaded when not given
+
+    Returns:
+        True if a row was written
+    """
+    if current is None:
+        current = _current_names(m2m_manager)
     names = [t.name for t in dtos]
-    if not names:
-        m2m_manager.set([])
-        return
-
-    names_to_id = dict(
-        model.objects
-        .filter(name__in=names)
-        .values_list("name", "id")
-    )
 
-    to_create = [model(name=n) for n in names if n not in names_to_id]
-    if to_create:
-        model.objects.bulk_create(to_create)
-        names_to_id = dict(
-            model.objects
-            .filter(name__in=names)
-            .values_list("name", "id")
-        )
+    resolved = _resolve_names(
+        model, [n for n in names if _name_key(n) not in current])
+    target_ids = {current[_name_key(n)] if n not in resolved
+                  else resolved[n] for n in names}
 
-    m2m_manager.set([names_to_id[n] for n in names])
+    return _apply_link_diff(m2m_manager, set(current.values()), target_ids)
 
 
-def _sync_features(m2m_manager, dtos):
-    if not dtos:
-        m2m_manager.set([])
-        return
+def _sync_features(m2m_manager, dtos, current=None):
+    """Make the features of m2m_manager match dtos.
 
-    keys = [(f.name, Feature.Type(f.type), f.description) for f in dtos]
+    Args:
+        current: (name, type, description) -> id already linked, loaded
+            when not given
 
-    q = Q()
-    for n, t, d in keys:
-        # |= add 'or Q' to existing Query 'q' to build complete Query
-        q |= Q(name=n, type=t, description=d)
-
-    features = Feature.objects.filter(q).only(
-        "id", "name", "type", "description")
-    existing = {
-        (feat.name, feat.type, feat.description): feat.id
-        for feat in features
-    }
+    Returns:
+        True if a row was written
+    """
+    if current is None:
+        current = _current_features(m2m_manager)
+    keys = dict.fromkeys(_feature_key(f) for f in dtos)
 
-    to_create = [
-        Feature(name=n, type=t, description=d)
-        for (n, t, d) in keys if (n, t, d) not in existing
-    ]
+    ids = {**current, **_resolve_features(
+        [k for k in keys if k not in current])}
+
+    return _apply_link_diff(m2m_manager, set(current.values()),
+                            {ids[k] for k in keys})
+
+
+def _stored_damage_key(dp):
+    if dp is None:
+        return None
+    return tuple(getattr(dp, f) for f in DAMAGE_PROFILE_KEY)
+
+
+def _stored_basic_attack_key(ba):
+    """(name, range, damage key) of a stored basic attack or None."""
+    if ba is None:
+        return None
+    return ba.name, ba.range, _stored_damage_key(ba.damage)
 
-    if to_create:
-        Feature.objects.bulk_create(to_create)
-        # need to refresh Query stored in cache
-        features = Feature.objects.filter(q).only(
-            "id", "name", "type", "description")
-        existing = {
-            (feat.name, feat.type, feat.description): feat.id
-            for feat in features
-        }
 
-    m2m_manager.set([existing[k] for k in keys])
+def _target_basic_attack_key(dto):
+    """Same key for the basic attack a full dto describes."""
+    if dto is None:
+        return None
+    dp_key = _damage_key(dto.damage) if dto.damage else None
+    return dto.name, dto.range or BasicAttack.Range.UNSPECIFIED, dp_key
+
+
+def _basic_attack_id_from_key(key):
+    name, range_ba, dp_key = key
+    dp_id = None
+    if dp_key is not None:
+        dp_id = _resolve_value_objects(
+            DamageProfile, DAMAGE_PROFILE_KEY, {dp_key})[dp_key]
+    ba_key = (name, range_ba, dp_id)
+    return _resolve_value_objects(
+        BasicAttack, BASIC_ATTACK_KEY, {ba_key})[ba_key]
+
+
+def _field_changed(adv, field, old):
+    # compare as stored, "14" from a form equals the stored 14
+    try:
+        value = adv._meta.get_field(field).to_python(getattr(adv, field))
+    except ValidationError:
+        return True
+    return value != old
+
+
+# fields of the search documents (with the features), see search.py
+SEARCHED_FIELDS = {"name", "description"}
+
+SCALAR_FIELDS = (
+    "name", "tier", "type", "description", "difficulty", "threshold_major",
+    "threshold_severe", "hit_point", "horde_hit_point", "stress_point",
+    "atk_bonus", "source", "status",
+)
+
+
+@contextmanager
+def _links_synced(adv, expected_version):
+    """Map the IntegrityError of the links synced before the conditional
+    UPDATE (a concurrent writer inserted the same through rows) to a
+    VersionConflict, that writer is ahead.
+
+    Raises:
+        VersionConflict: a link write raced another writer
+    """
+    try:
+        with transaction.atomic():
+            yield
+    except IntegrityError as exc:
+        # a deleted (interned) value object is not a conflict
+        if _is_fk_violation(exc):
+            raise
+        raise VersionConflict(adv.pk, expected_version)
+
+
+def _check_version(adv, expected_version):
+    if expected_version is not None and adv.version != expected_version:
+        raise VersionConflict(adv.pk, expected_version)
+
+
+def _save_versioned(adv, fields, expected_version):
+    """Conditional UPDATE of fields, only if the row is still at
+    expected_version, and bump the version.
+
+    The row lock only lasts from this statement to the commit, the
+    relations synced before are rolled back with the transaction on a
+    conflict.
+
+    Raises:
+        VersionConflict: another writer committed in between
+    """
+    adv.updated_at = timezone.now()
+    values = {}
+    for name in (*fields, "updated_at"):
+        attname = adv._meta.get_field(name).attname
+        values[attname] = getattr(adv, attname)
+
+    updated = (
+        Adversary.objects
+        .filter(pk=adv.pk, version=expected_version)
+        .update(version=F("version") + 1, **values)
+    )
+    if not updated:
+        raise VersionConflict(adv.pk, expected_version)
+    adv.version = expected_version + 1
+    bump_generations(Adversary)
 
 
+@_retry_stale_interning
 @transaction.atomic
-def adversary_update(adv, dto):
-    adv = Adversary.objects.select_for_update().get(pk=adv.pk)
+def adversary_update(adv, dto, expected_version=None):
+    """Replace the adversary with dto, writing only what differs.
+
+    The current aggregate (row, basic attack and links) is loaded once
+    and diffed with dto: unchanged relations are not resolved again and
+    an identical PUT issues no write at all. No row lock is taken, the
+    final UPDATE is conditioned on the version read and links racing a
+    concurrent writer are a conflict too.
+
+    Args:
+        expected_version: version the client edited (If-Match), the
+            loaded one when None
+
+    Raises:
+        VersionConflict: the adversary is not at expected_version
+    """
+    adv = (
+        Adversary.objects
+        .select_related("basic_attack__damage")
+        .get(pk=adv.pk)
+    )
+    _check_version(adv, expected_version)
+    links = _load_links(adv)
+    before = {f: getattr(adv, f) for f in SCALAR_FIELDS}
 
     # --- Simple attributes --- #
     adv.name = dto.name
@@ -190,154 +854,225 @@ def adversary_update(adv, dto):
     adv.source = dto.source
     adv.status_value = dto.status
 
+    changed = [f for f, old in before.items() if _field_changed(adv, f, old)]
+
     # --- Basic Attack --- #
-    if dto.basic_attack is None:
-        adv.basic_attack = None
-    else:
-        ba = dto.basic_attack
-        dp_obj = None
-
-        if ba.damage is not None:
-            d = ba.damage
-            dp_obj, _ = DamageProfile.objects.get_or_create(
-                dice_number=d.dice_number,
-                dice_type=d.dice_type,
-                bonus=d.bonus,
-                damage_type=d.damage_type
-            )
+    ba_key = _target_basic_attack_key(dto.basic_attack)
+    if ba_key != _stored_basic_attack_key(adv.basic_attack):
+        adv.basic_attack_id = _basic_attack_id_from_key(ba_key) \
+            if ba_key is not None else None
+        changed.append("basic_attack")
 
-        ba_obj, _ = BasicAttack.objects.get_or_create(
-            name=ba.name,
-            range=ba.range,
-            damage=dp_obj
-        )
-        adv.basic_attack = ba_obj
+    if changed:
+        adv.full_clean()
 
     # --- M2M --- #
-    _sync_m2m_by_name(adv.tags, Tag, dto.tags)
-    _sync_m2m_by_name(adv.tactics, Tactic, dto.tactics)
-    _sync_features(adv.features, dto.features)
-    _sync_experiences(adv, dto.experiences)
-
-    adv.full_clean()
-    adv.save()
+    with _links_synced(adv, adv.version):
+        features_linked = _sync_features(adv.features, dto.features,
+                                         links["features"])
+        linked = [
+            _sync_m2m_by_name(adv.tags, Tag, dto.tags, links["tags"]),
+            _sync_m2m_by_name(adv.tactics, Tactic, dto.tactics,
+                              links["tactics"]),
+            _sync_experiences(adv, dto.experiences, links["experiences"]),
+        ]
+
+    if changed or features_linked or any(linked):
+        _save_versioned(adv, changed, adv.version)
+        documents_refresh([adv.pk])
+    if SEARCHED_FIELDS.intersection(changed) or features_linked:
+        search_index([adv.pk])
 
     return adv
 
 
-def _resolve_damage_profile(existing_dp, dto):
+def _patched_damage_key(existing_dp, dto):
     if is_unset(dto):
-        return existing_dp
+        return _stored_damage_key(existing_dp)
 
     if dto is None:
         return None
 
-    dice_number = getattr(existing_dp, "dice_number", None)
-    dice_type = getattr(existing_dp, "dice_type", None)
-    bonus = getattr(existing_dp, "bonus", None)
-    damage_type = getattr(existing_dp, "damage_type", None)
-
-    if not is_unset(dto.dice_number):
-        dice_number = dto.dice_number
-    if not is_unset(dto.dice_type):
-        dice_type = dto.dice_type
-    if not is_unset(dto.bonus):
-        bonus = dto.bonus
-    if not is_unset(dto.damage_type):
-        damage_type = DamageType(dto.damage_type) \
-            if dto.damage_type is not None else None
-
-    if (dice_number is None
-            and dice_type is None
-            and bonus is None
-            and damage_type is None):
-        return None
-
-    dp_kwargs = _remove_none_field({
-        "dice_number": dice_number,
-        "dice_type": dice_type,
-        "bonus": bonus,
-        "damage_type": damage_type,
-    })
-    dp, _ = DamageProfile.objects.get_or_create(**dp_kwargs)
+    values = {f: getattr(existing_dp, f, None) for f in DAMAGE_PROFILE_KEY}
+    for f in DAMAGE_PROFILE_KEY:
+        if not is_unset(getattr(dto, f)):
+            values[f] = getattr(dto, f)
 
-    return dp
+    if all(v is None for v in values.values()):
+        return None
 
+    return _damage_key(DamageDTO(**values))
 
-def _resolve_basic_attack(existing_ba, dto):
-    if is_unset(dto):
-        return existing_ba
 
+def _patched_basic_attack_key(existing_ba, dto):
+    """(name, range, damage key) once dto is applied to existing_ba, None
+    when the adversary ends up without basic attack."""
     if dto is None:
         return None
 
     name = getattr(existing_ba, "name", None)
     range_ba = getattr(existing_ba, "range", None)
-    damage = getattr(existing_ba, "damage", None)
 
     if not is_unset(dto.name):
         name = dto.name
     if not is_unset(dto.range):
         range_ba = dto.range
-    damage = _resolve_damage_profile(damage, dto.damage)
+    dp_key = _patched_damage_key(getattr(existing_ba, "damage", None),
+                                 dto.damage)
 
-    if (name, range_ba, damage) == (None, None, None):
+    if (name, range_ba, dp_key) == (None, None, None):
         return None
 
-    ba_kwargs = _remove_none_field({
-        "name": name,
-        "range": range_ba,
-        "damage": damage,
-    })
-    ba_obj, _ = BasicAttack.objects.get_or_create(**ba_kwargs)
-
-    return ba_obj
-
-
-@transaction.atomic
-def adversary_partial_update(adv, dto):
-    adv = Adversary.objects.select_for_update().get(pk=adv.pk)
-
-    simple_attr_map = {
-        "name": "name",
-        "tier": "tier_value",
-        "type": "type_value",
-        "description": "description",
-        "difficulty": "difficulty",
-        "threshold_major": "threshold_major",
-        "threshold_severe": "threshold_severe",
-        "hit_point": "hit_point",
-        "horde_hit_point": "horde_hit_point",
-        "stress_point": "stress_point",
-        "atk_bonus": "atk_bonus",
-        "source": "source",
-        "status": "status_value"
-    }
-
-    # --- Simple attributes --- #
-    for attr in simple_attr_map:
-        value = getattr(dto, attr)
-        if not is_unset(value):
-            setattr(adv, simple_attr_map[attr], value)
+    return name or "", range_ba or BasicAttack.Range.UNSPECIFIED, dp_key
+
+
+PATCH_ATTR_MAP = {
+    "name": "name",
+    "tier": "tier_value",
+    "type": "type_value",
+    "description": "description",
+    "difficulty": "difficulty",
+    "threshold_major": "threshold_major",
+    "threshold_severe": "threshold_severe",
+    "hit_point": "hit_point",
+    "horde_hit_point": "horde_hit_point",
+    "stress_point": "stress_point",
+    "atk_bonus": "atk_bonus",
+    "source": "source",
+    "status": "status_value"
+}
+
+
+def _patch_fields(adv, dto):
+    """Set the fields present in dto on adv, return the changed ones."""
+    changed = []
+    for field, attr in PATCH_ATTR_MAP.items():
+        value = getattr(dto, field)
+        if is_unset(value):
+            continue
+        old = getattr(adv, field)
+        setattr(adv, attr, value)
+        if _field_changed(adv, field, old):
+            changed.append(field)
+    return changed
+
+
+def adversary_patch_changes(adv, dto):
+    """Parts of adv that dto modifies, without lock nor write.
+
+    adv is the current state as loaded by the caller (adversary_get),
+    its prefetched relations are compared without query.
+
+    Returns:
+        set of field names, plus "basic_attack", "tactics", "tags",
+        "features" and "experiences" for the relations
+    """
+    changes = set(_patch_fields(Adversary(**{
+        f: getattr(adv, f) for f in SCALAR_FIELDS
+    }), dto))
 
-    # --- Basic attack --- #
     if not is_unset(dto.basic_attack):
-        adv.basic_attack = _resolve_basic_attack(adv.basic_attack,
-                                                 dto.basic_attack)
+        if (_patched_basic_attack_key(adv.basic_attack, dto.basic_attack)
+                != _stored_basic_attack_key(adv.basic_attack)):
+            changes.add("basic_attack")
 
-    # --- M2M --- #
     if not is_unset(dto.tactics):
-        _sync_m2m_by_name(adv.tactics, Tactic, dto.tactics)
+        if ({_name_key(t.name) for t in adv.tactics.all()}
+                != {_name_key(t.name) for t in dto.tactics}):
+            changes.add("tactics")
 
     if not is_unset(dto.tags):
-        _sync_m2m_by_name(adv.tags, Tag, dto.tags)
-
-    if not is_unset(dto.experiences):
-        _sync_experiences(adv, dto.experiences)
+        if ({_name_key(t.name) for t in adv.tags.all()}
+                != {_name_key(t.name) for t in dto.tags}):
+            changes.add("tags")
 
     if not is_unset(dto.features):
-        _sync_features(adv.features, dto.features)
+        current = {(f.name, f.type, f.description)
+                   for f in adv.features.all()}
+        if current != {_feature_key(f) for f in dto.features}:
+            changes.add("features")
+
+    if not is_unset(dto.experiences):
+        current = {_name_key(ae.experience.name): ae.bonus
+                   for ae in adv.adversary_experiences.all()}
+        if current != {_name_key(e.name): e.bonus or 0
+                       for e in dto.experiences}:
+            changes.add("experiences")
+
+    return changes
+
+
+@_retry_stale_interning
+def adversary_partial_update(adv, dto, changes=None, expected_version=None):
+    """Apply the fields present in dto, writing only what changed.
+
+    When dto changes nothing, adv is returned as is: no validation and
+    no write. Otherwise the changed columns are validated and written
+    by a conditional UPDATE on the version, only the modified relations
+    are synced.
+
+    Args:
+        changes: result of adversary_patch_changes(adv, dto) when the
+            caller already computed it
+        expected_version: version the client edited (If-Match), the
+            one of adv when None
+
+    Raises:
+        VersionConflict: the adversary is not at expected_version
+    """
+    _check_version(adv, expected_version)
+    if changes is None:
+        changes = adversary_patch_changes(adv, dto)
+    if not changes:
+        return adv
+
+    version = adv.version
+    with transaction.atomic():
+        adv = (
+            Adversary.objects
+            .select_related("basic_attack__damage")
+            .get(pk=adv.pk)
+        )
+        _check_version(adv, version)
+
+        # --- Simple attributes --- #
+        changed = _patch_fields(adv, dto)
+
+        # --- Basic attack --- #
+        if "basic_attack" in changes:
+            ba_key = _patched_basic_attack_key(adv.basic_attack,
+                                               dto.basic_attack)
+            if ba_key != _stored_basic_attack_key(adv.basic_attack):
+                adv.basic_attack_id = _basic_attack_id_from_key(ba_key) \
+                    if ba_key is not None else None
+                changed.append("basic_attack")
+
+        if changed:
+            # (author, name) uniqueness is only checked with both fields
+            checked = {*changed, "author"} if "name" in changed \
+                else set(changed)
+            adv.full_clean(exclude=[
+                f.name for f in adv._meta.fields if f.name not in checked
+            ])
+
+        # --- M2M --- #
+        linked = features_linked = False
+        with _links_synced(adv, version):
+            if "tactics" in changes:
+                linked |= _sync_m2m_by_name(adv.tactics, Tactic,
+                                            dto.tactics)
+            if "tags" in changes:
+                linked |= _sync_m2m_by_name(adv.tags, Tag, dto.tags)
+            if "experiences" in changes:
+                linked |= _sync_experiences(adv, dto.experiences)
+            if "features" in changes:
+                features_linked = _sync_features(adv.features,
+                                                 dto.features)
+
+        if changed or linked or features_linked:
+            _save_versioned(adv, changed, version)
+            documents_refresh([adv.pk])
+        if SEARCHED_FIELDS.intersection(changed) or features_linked:
+            search_index([adv.pk])
 
-    adv.full_clean()
-    adv.save()
     return adv
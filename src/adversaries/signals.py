@@ -0,0 +1,88 @@
+from django.db.models.signals import post_save, post_delete, pre_save
+
+from accounts.models import Account
+from adversaries.helpers.generations import bump_generations
+from adversaries.helpers.interning import register, intern_cache
+from adversaries.models import Adversary, Tactic, Tag, Experience, \
+    DamageProfile, BasicAttack, Feature
+from adversaries.read_model import documents_refresh
+from adversaries.search import search_unindex
+
+
+INTERNED_MODELS = (Tactic, Tag, Experience, DamageProfile, BasicAttack)
+# the services bump generations themselves, the signals catch the writes
+# made outside of them (admin...)
+GENERATION_MODELS = (Adversary, Feature, *INTERNED_MODELS)
+
+
+def _invalidate_on_save(sender, instance, created, **kwargs):
+    # a new row cannot make an interned id stale
+    interned = intern_cache(sender)
+    if not created and interned is not None:
+        interned.invalidate()
+
+
+def _invalidate_on_delete(sender, instance, **kwargs):
+    interned = intern_cache(sender)
+    if interned is not None:
+        interned.invalidate()
+
+
+for model in INTERNED_MODELS:
+    register(model)
+    post_save.connect(_invalidate_on_save, sender=model,
+                      dispatch_uid=f"intern_save_{model._meta.label_lower}")
+    post_delete.connect(_invalidate_on_delete, sender=model,
+                        dispatch_uid=f"intern_del_{model._meta.label_lower}")
+
+
+def _bump_generation(sender, **kwargs):
+    bump_generations(sender)
+
+
+for model in GENERATION_MODELS:
+    post_save.connect(_bump_generation, sender=model,
+                      dispatch_uid=f"gen_save_{model._meta.label_lower}")
+    post_delete.connect(_bump_generation, sender=model,
+                        dispatch_uid=f"gen_del_{model._meta.label_lower}")
+
+
+def _track_author_rename(sender, instance, update_fields=None, **kwargs):
+    # a save is a rename only when the username differs from the stored
+    # one, a password change saves every field too
+    instance._username_changed = False
+    if instance.pk is None or (update_fields is not None
+                               and "username" not in update_fields):
+        return
+    stored = (Account.objects.filter(pk=instance.pk)
+              .values_list("username", flat=True).first())
+    instance._username_changed = stored is not None \
+        and stored != instance.username
+
+
+def _refresh_author_documents(sender, instance, created, **kwargs):
+    # the documents embed the username of the author, their ETag moves
+    if created or not getattr(instance, "_username_changed", False):
+        return
+    instance._username_changed = False
+    ids = list(Adversary.objects.filter(author=instance)
+               .values_list("pk", flat=True))
+    if ids:
+        documents_refresh(ids, bump_version=True)
+        bump_generations(Adversary)
+
+
+pre_save.connect(_track_author_rename, sender=Account,
+                 dispatch_uid="documents_author_rename")
+post_save.connect(_refresh_author_documents, sender=Account,
+                  dispatch_uid="documents_author_save")
+
+
+def _unindex_on_delete(sender, instance, **kwargs):
+    # every delete of an adversary (services, admin, cascades) drops its
+    # search document, the FTS5 table has no foreign key
+    search_unindex([instance.pk])
+
+
+post_delete.connect(_unindex_on_delete, sender=Adversary,
+                    dispatch_uid="search_unindex_adversary")
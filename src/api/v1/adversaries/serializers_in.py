@@ -1,6 +1,9 @@
 from rest_framework import serializers
 
 from adversaries.helpers.normalizers import normalize_choices
+from adversaries.models import Adversary
+from adversaries.selectors import ADVERSARY_ORDERINGS
+from api.v1.adversaries.serializers_out import AdversaryListOut
 
 
 class DamageIn(serializers.Serializer):
@@ -98,3 +101,64 @@ class AdversaryPatchIn(AdversaryCreateIn):
     name = serializers.CharField(allow_null=True, required=False)
 
     basic_attack = BasicAttackPatchIn(allow_null=True, required=False)
+
+
+class SparseFieldsIn(serializers.Serializer):
+    """?fields= comma separated output fields (all of them by default),
+    ?expand= relations added to them."""
+    fields = serializers.CharField(required=False)
+    expand = serializers.CharField(required=False)
+
+    @staticmethod
+    def _names(value, allowed):
+        names = [n.strip() for n in value.split(",") if n.strip()]
+        if not names:
+            raise serializers.ValidationError("Expected field names.")
+        unknown = [n for n in names if n not in allowed]
+        if unknown:
+            raise serializers.ValidationError(
+                f"Unknown {unknown}. Try one of {list(allowed)}.")
+        return names
+
+    def validate_fields(self, value):
+        return self._names(value, list(AdversaryListOut._declared_fields))
+
+    def validate_expand(self, value):
+        return self._names(value, AdversaryListOut.RELATIONS)
+
+    def output_fields(self):
+        """Names of the fields to output, None for all of them."""
+        data = self.validated_data
+        if "fields" not in data:
+            return None
+        return list(dict.fromkeys([*data["fields"],
+                                   *data.get("expand", ())]))
+
+
+class AdversaryListQueryIn(SparseFieldsIn):
+    """Filters and ordering of the adversary collection, tag and tactic
+    can be repeated (adversaries having all of them)."""
+    tier = serializers.CharField(required=False)
+    type = serializers.CharField(required=False)
+    status = serializers.CharField(required=False)
+    author = serializers.IntegerField(required=False, min_value=1)
+    tag = serializers.ListField(
+        child=serializers.CharField(), required=False)
+    tactic = serializers.ListField(
+        child=serializers.CharField(), required=False)
+    difficulty_min = serializers.IntegerField(required=False, min_value=0)
+    difficulty_max = serializers.IntegerField(required=False, min_value=0)
+    hit_point_min = serializers.IntegerField(required=False, min_value=0)
+    hit_point_max = serializers.IntegerField(required=False, min_value=0)
+    ordering = serializers.ChoiceField(
+        choices=list(ADVERSARY_ORDERINGS), default="name")
+
+    def validate_type(self, value):
+        return normalize_choices(value, "ADV_TYPE", allow_null=False)
+
+    def validate_tier(self, value):
+        tier = normalize_choices(value, "ADV_TIER", allow_null=False)
+        return Adversary.Tier.UNSPECIFIED if tier == "UNK" else tier
+
+    def validate_status(self, value):
+        return normalize_choices(value, "ADV_STATUS", allow_null=False)
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from rest_framework.reverse import reverse
 
 from adversaries.helpers.formatting import format_csv_name, \
     format_csv_experience, format_basic_attack
@@ -107,6 +108,17 @@ class AdversaryDetailOut(serializers.Serializer):
 
 
 class AdversaryListOut(serializers.Serializer):
+    """fields: names of the fields to output, all of them when None."""
+    # relations, each one costs a join or a prefetch query
+    RELATIONS = ("author", "basic_attack", "experiences", "tactics",
+                 "features", "tags")
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     id = serializers.IntegerField()
     name = serializers.CharField()
 
@@ -176,3 +188,141 @@ class AdversaryListOut(serializers.Serializer):
         if obj.features:
             return format_csv_name(obj.features.all())
         return None
+
+
+# --- Compiled representations --- #
+# Plain dict builders giving the exact representations of the
+# serializers above from prefetched rows, without serializer nor field
+# instances per row. The serializers stay the reference (field order,
+# RELATIONS); the tests check both produce the same JSON.
+_DATETIME = serializers.DateTimeField()
+# a pk no url can contain otherwise, replaced by the pk of each row
+_URL_PK = 987654321
+
+
+def _int(value):
+    return None if value is None else int(value)
+
+
+def _str(value):
+    return None if value is None else str(value)
+
+
+def _datetime(value):
+    return _DATETIME.to_representation(value)
+
+
+def detail_url_template(request):
+    """Absolute url of the adversaries, as the url field of
+    AdversaryListOut: a single reverse(), then pk -> url."""
+    url = reverse("adversaries-detail", kwargs={"adversary_id": _URL_PK},
+                  request=request)
+    head, tail = url.rsplit(str(_URL_PK), 1)
+    return lambda pk: f"{head}{pk}{tail}"
+
+
+def _damage(dp):
+    return {
+        "dice_number": _int(dp.dice_number),
+        "dice_type": _int(dp.dice_type),
+        "bonus": _int(dp.bonus),
+        "damage_type": _str(dp.damage_type),
+    }
+
+
+def _basic_attack(ba):
+    if ba is None:
+        return None
+    return {
+        "name": _str(ba.name),
+        "range": _str(ba.range),
+        "damage": _damage(ba.damage) if ba.damage is not None else None,
+    }
+
+
+_SCALARS = {
+    "id": lambda adv: _int(adv.id),
+    "name": lambda adv: _str(adv.name),
+    "tier": lambda adv: _str(adv.tier),
+    "type": lambda adv: _str(adv.type),
+    "description": lambda adv: _str(adv.description),
+    "difficulty": lambda adv: _int(adv.difficulty),
+    "threshold_major": lambda adv: _int(adv.threshold_major),
+    "threshold_severe": lambda adv: _int(adv.threshold_severe),
+    "hit_point": lambda adv: _int(adv.hit_point),
+    "horde_hit_point": lambda adv: _int(adv.horde_hit_point),
+    "stress_point": lambda adv: _int(adv.stress_point),
+    "atk_bonus": lambda adv: _int(adv.atk_bonus),
+    "source": lambda adv: _str(adv.source),
+    "created_at": lambda adv: _datetime(adv.created_at),
+    "updated_at": lambda adv: _datetime(adv.updated_at),
+    "status": lambda adv: _str(adv.status),
+}
+
+_DETAIL_RELATIONS = {
+    "basic_attack": lambda adv: _basic_attack(adv.basic_attack),
+    "experiences": lambda adv: [
+        {"name": _str(e.experience.name), "bonus": _int(e.bonus)}
+        for e in adv.adversary_experiences.all()
+    ],
+    "tactics": lambda adv: [t.name for t in adv.tactics.all()],
+    "features": lambda adv: [
+        {"id": _int(f.id), "name": _str(f.name), "type": _str(f.type),
+         "description": _str(f.description)}
+        for f in adv.features.all()
+    ],
+    "author": lambda adv: None if adv.author is None else {
+        "id": _int(adv.author.id), "username": _str(adv.author.username)},
+    "tags": lambda adv: [t.name for t in adv.tags.all()],
+}
+
+
+def _list_basic_attack(adv):
+    ba = adv.basic_attack
+    dmg = ba.damage if ba else None
+    if not ba or not dmg:
+        return None
+    return format_basic_attack(name=ba.name, rge=ba.range,
+                               dice_number=dmg.dice_number,
+                               dice_type=dmg.dice_type, bonus=dmg.bonus,
+                               damage_type=dmg.damage_type)
+
+
+_LIST_RELATIONS = {
+    "basic_attack": _list_basic_attack,
+    "experiences": lambda adv: format_csv_experience(
+        adv.adversary_experiences.all()),
+    "tactics": lambda adv: format_csv_name(adv.tactics.all()),
+    "features": lambda adv: format_csv_name(adv.features.all()),
+    "author": lambda adv: adv.author.username if adv.author else None,
+    "tags": lambda adv: format_csv_name(adv.tags.all()),
+}
+
+_DETAIL_GETTERS = [
+    (name, {**_SCALARS, **_DETAIL_RELATIONS}[name])
+    for name in AdversaryDetailOut._declared_fields
+]
+
+
+def detail_representation(adv):
+    """AdversaryDetailOut(adv).data as a plain dict."""
+    return {name: get(adv) for name, get in _DETAIL_GETTERS}
+
+
+def list_representation(fields=None, url=None):
+    """Compile the AdversaryListOut representation of fields (all of
+    them when None).
+
+    Args:
+        url: detail_url_template of the request, needed for the url
+            field
+
+    Returns:
+        adversary -> dict
+    """
+    getters = {**_SCALARS, **_LIST_RELATIONS,
+               "url": lambda adv: url(adv.pk)}
+    compiled = [(name, getters[name])
+                for name in AdversaryListOut._declared_fields
+                if fields is None or name in fields]
+    return lambda adv: {name: get(adv) for name, get in compiled}
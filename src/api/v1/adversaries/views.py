@@ -1,15 +1,34 @@
-from django.http import Http404
+import json
+
+from django.http import Http404, StreamingHttpResponse
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.reverse import reverse
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from adversaries.selectors import adversary_get, adversary_list
+from adversaries.exceptions import VersionConflict
+from adversaries.helpers.exporting import EXPORT_FORMATS, \
+    DOCUMENT_FORMATS
+from adversaries.models import Adversary, BasicAttack, DamageProfile, \
+    Experience, Feature, Tactic, Tag
+from adversaries.search import search_ranked
+from adversaries.selectors import adversary_get, adversary_list, \
+    adversary_iter, adversary_names_taken, adversary_ranked, \
+    adversary_document, adversary_list_state, with_summaries, \
+    adversary_export_documents, ADVERSARY_ORDERINGS
 from adversaries.services import adversary_create, adversary_update, \
-    adversary_partial_update
-from api.v1.adversaries.serializers_out import AdversaryDetailOut, \
-    AdversaryListOut
+    adversary_partial_update, adversary_patch_changes, adversary_bulk_create
+from api.v1.adversaries.serializers_out import AdversaryListOut, \
+    detail_representation, list_representation, detail_url_template
 from api.v1.adversaries.serializers_in import AdversaryCreateIn, \
-    AdversaryPutIn, AdversaryPatchIn
+    AdversaryPutIn, AdversaryPatchIn, AdversaryListQueryIn, SparseFieldsIn
+from api.v1.helpers.conditional import PreconditionFailed, EditConflict, \
+    etag, version_etag, if_match_version, collection_etag, \
+    validator_headers, not_modified
+from api.v1.helpers.pagination import KeysetPagination, RankedPagination
+from api.v1.helpers.response_cache import cache_response, \
+    get_or_compute, versioned_key
 from api.v1.helpers.mappers import to_adversary_dto, to_adversary_patch_dto
 
 
@@ -21,43 +40,178 @@ class AdversaryItemApi(APIView):
             raise Http404
         return adv
 
+    @staticmethod
+    def _respond(request, adv):
+        return Response(detail_representation(adv),
+                        status=status.HTTP_200_OK,
+                        headers=validator_headers(etag(adv), adv.updated_at))
+
     def get(self, request, adversary_id):
-        adv = self._get_adv(adversary_id)
-        data = AdversaryDetailOut(adv, context={"request": request}).data
-        return Response(data)
+        # a single query, 304 or not: no prefetch nor serializer
+        state = adversary_document(adversary_id)
+        if state is None:
+            raise Http404
+        version, updated_at, document = state
+        headers = validator_headers(version_etag(version), updated_at)
+        response = not_modified(request, headers, updated_at)
+        if response is not None:
+            return response
+
+        if document is None:
+            return self._respond(request, self._get_adv(adversary_id))
+        return Response(json.loads(document), status=status.HTTP_200_OK,
+                        headers=headers)
 
     def put(self, request, adversary_id):
         adv = self._get_adv(adversary_id)
+        expected_version = if_match_version(request, adv)
 
         ser = AdversaryPutIn(data=request.data)
         ser.is_valid(raise_exception=True)
 
         dto = to_adversary_dto(ser.validated_data)
-        adv = adversary_update(adv, dto)
+        try:
+            adv = adversary_update(adv, dto,
+                                   expected_version=expected_version)
+        except VersionConflict:
+            raise PreconditionFailed() if expected_version is not None \
+                else EditConflict()
 
-        data = AdversaryDetailOut(adv, context={"request": request}).data
-        return Response(data, status=status.HTTP_200_OK)
+        return self._respond(request, adv)
 
     def patch(self, request, adversary_id):
         adv = self._get_adv(adversary_id)
+        expected_version = if_match_version(request, adv)
 
         ser = AdversaryPatchIn(data=request.data)
         ser.is_valid(raise_exception=True)
 
         dto = to_adversary_patch_dto(ser.validated_data)
-        adv = adversary_partial_update(adv, dto)
+        changes = adversary_patch_changes(adv, dto)
+        # unchanged: the prefetched adv is answered as is, nothing reloaded
+        if changes:
+            try:
+                adv = adversary_partial_update(
+                    adv, dto, changes=changes,
+                    expected_version=expected_version)
+            except VersionConflict:
+                raise PreconditionFailed() \
+                    if expected_version is not None else EditConflict()
+
+        return self._respond(request, adv)
+
+
+# models whose rows make up the list responses, a write to any of them
+# invalidates the cached pages
+ADVERSARY_LIST_MODELS = (Adversary, BasicAttack, DamageProfile, Experience,
+                         Feature, Tactic, Tag)
+
+
+def _loaded_fields(output, extra=()):
+    """Adversary fields to load for the output fields (None: all),
+    url only needs the always loaded pk."""
+    if output is None:
+        return None
+    return [f for f in output if f != "url"] + \
+        [f.lstrip("-") for f in extra]
+
 
-        data = AdversaryDetailOut(adv, context={"request": request}).data
-        return Response(data, status=status.HTTP_200_OK)
+def _reads_documents(output):
+    """Whether the list items are read from the documents: whenever a
+    relation is output, plain columns are cheaper read alone."""
+    return output is None or \
+        not set(output).isdisjoint(AdversaryListOut.RELATIONS)
+
+
+def _list_items(request, advs, output, documents):
+    """List items of advs, from their documents when loaded
+    with_summaries. The others are rendered from their rows."""
+    url = detail_url_template(request)
+    render = list_representation(output, url)
+    if not documents:
+        return [render(adv) for adv in advs]
+
+    missing = adversary_list().in_bulk(
+        [adv.pk for adv in advs if adv.summary is None])
+    items = []
+    for adv in advs:
+        if adv.summary is None:
+            items.append(render(missing[adv.pk]))
+            continue
+        item = json.loads(adv.summary)
+        if output is not None:
+            item = {k: v for k, v in item.items() if k in output}
+        # url is the last field of AdversaryListOut
+        if output is None or "url" in output:
+            item["url"] = url(adv.pk)
+        items.append(item)
+    return items
+
+
+def _list_filters(params):
+    """adversary_list filters of validated AdversaryListQueryIn params."""
+    return {
+        "tier": params.get("tier"),
+        "type": params.get("type"),
+        "status": params.get("status"),
+        "author_id": params.get("author"),
+        "tags": params.get("tag", ()),
+        "tactics": params.get("tactic", ()),
+        "difficulty_min": params.get("difficulty_min"),
+        "difficulty_max": params.get("difficulty_max"),
+        "hit_point_min": params.get("hit_point_min"),
+        "hit_point_max": params.get("hit_point_max"),
+    }
 
 
 class AdversaryCollectionApi(APIView):
+    """?limit= adversaries per page, pages are walked with the next /
+    previous links.
+
+    Filters (see AdversaryListQueryIn) and ?ordering= (name, -name,
+    created_at, updated_at...) are each served by an index. ?fields=
+    and ?expand= pick the output fields, the columns, joins and
+    prefetches of the others are skipped. Relations are read from the
+    stored documents (see adversaries.read_model)."""
+    pagination_class = KeysetPagination
+
     def get(self, request):
-        adversaries = adversary_list()
-        data = AdversaryListOut(adversaries,
-                                many=True,
-                                context={'request': request}).data
-        return Response(data)
+        ser = AdversaryListQueryIn(data=request.query_params)
+        ser.is_valid(raise_exception=True)
+        filters = _list_filters(ser.validated_data)
+
+        # the state of the filtered list is cached like the pages, it is
+        # computed once per write whatever the page: a hot page is
+        # answered (304 or not) without query
+        last_updated, count = get_or_compute(
+            versioned_key(("adversary_list_state", sorted(filters.items())),
+                          ADVERSARY_LIST_MODELS),
+            lambda: adversary_list_state(**filters))
+        headers = validator_headers(
+            collection_etag(request, last_updated, count), last_updated)
+
+        response = not_modified(request, headers)
+        if response is None:
+            response = self._page(request, ser.validated_data,
+                                  ser.output_fields())
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    @cache_response(*ADVERSARY_LIST_MODELS)
+    def _page(self, request, params, output):
+        ordering = ADVERSARY_ORDERINGS[params["ordering"]]
+        documents = _reads_documents(output)
+        # the paginator reads the ordering fields of the page edges
+        fields = _loaded_fields([] if documents else output, ordering)
+
+        qs = adversary_list(fields=fields, **_list_filters(params))
+        if documents:
+            qs = with_summaries(qs)
+        paginator = self.pagination_class(ordering=ordering)
+        adversaries = paginator.paginate_queryset(qs, request, view=self)
+        data = _list_items(request, adversaries, output, documents)
+        return paginator.get_paginated_response(data)
 
     def post(self, request):
         ser = AdversaryCreateIn(data=request.data)
@@ -66,5 +220,119 @@ class AdversaryCollectionApi(APIView):
         dto = to_adversary_dto(ser.validated_data)
         adv = adversary_create(dto, author_id=request.user.id)
 
-        data = AdversaryDetailOut(adv, context={"request": request}).data
-        return Response(data, status=status.HTTP_201_CREATED)
+        return Response(detail_representation(adv),
+                        status=status.HTTP_201_CREATED)
+
+
+class AdversarySearchApi(APIView):
+    """?q= full-text search over the names, descriptions and features,
+    best matches first, ?limit= results per page, ?fields= / ?expand=
+    as for the collection."""
+    pagination_class = RankedPagination
+
+    def get(self, request):
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError({"q": "This parameter is required."})
+        ser = SparseFieldsIn(data=request.query_params)
+        ser.is_valid(raise_exception=True)
+        output = ser.output_fields()
+        documents = _reads_documents(output)
+        fields = _loaded_fields([] if documents else output)
+
+        paginator = self.pagination_class()
+        rows = paginator.paginate_ranked(
+            lambda limit, after: search_ranked(query, limit, after),
+            lambda ranked: adversary_ranked(ranked, fields=fields,
+                                            summaries=documents),
+            request,
+        )
+        data = _list_items(request, [adv for adv, _ in rows], output,
+                           documents)
+        return paginator.get_paginated_response(data)
+
+
+class AdversaryBulkApi(APIView):
+    """Create many adversaries at once.
+
+    Items are validated one by one, the valid ones are created together
+    (value objects resolved once for the batch, one transaction) and the
+    response lists one result per item, in the payload order."""
+    max_items = 1000
+
+    def post(self, request):
+        if not isinstance(request.data, list):
+            raise ValidationError({"non_field_errors": "Expected a list."})
+        if len(request.data) > self.max_items:
+            raise ValidationError({"non_field_errors":
+                                   f"At most {self.max_items} items."})
+
+        results = [None] * len(request.data)
+        valid = {}
+        for i, item in enumerate(request.data):
+            ser = AdversaryCreateIn(data=item)
+            if ser.is_valid():
+                valid[i] = to_adversary_dto(ser.validated_data)
+            else:
+                results[i] = {"index": i,
+                              "status": status.HTTP_400_BAD_REQUEST,
+                              "errors": ser.errors}
+
+        taken = adversary_names_taken(request.user.id,
+                                      [dto.name for dto in valid.values()])
+        to_create = {}
+        for i, dto in valid.items():
+            if dto.name in taken:
+                results[i] = {"index": i,
+                              "status": status.HTTP_409_CONFLICT,
+                              "errors": {"name": "Name already taken."}}
+            else:
+                taken.add(dto.name)
+                to_create[i] = dto
+
+        advs = adversary_bulk_create(to_create.values(),
+                                     author_id=request.user.id)
+        for i, adv in zip(to_create, advs):
+            results[i] = {
+                "index": i,
+                "status": status.HTTP_201_CREATED,
+                "id": adv.pk,
+                "url": reverse("adversaries-detail",
+                               kwargs={"adversary_id": adv.pk},
+                               request=request),
+            }
+
+        all_created = len(advs) == len(results)
+        return Response(results, status=status.HTTP_201_CREATED
+                        if all_created else status.HTTP_207_MULTI_STATUS)
+
+
+class AdversaryExportApi(APIView):
+    """Stream the catalog, ?output=tsv|ndjson|json (`format` is taken by
+    DRF content negotiation), filtered as the collection.
+
+    NDJSON / JSON documents are assembled by the database and streamed
+    as is, no model instance is built."""
+    chunk_size = 2000
+
+    def get(self, request):
+        output = request.query_params.get("output", "ndjson")
+        if output not in EXPORT_FORMATS:
+            raise ValidationError(
+                {"output": f"Try one of {list(EXPORT_FORMATS)}."})
+        ser = AdversaryListQueryIn(data=request.query_params)
+        ser.is_valid(raise_exception=True)
+        filters = _list_filters(ser.validated_data)
+
+        if output in DOCUMENT_FORMATS:
+            stream, content_type = DOCUMENT_FORMATS[output]
+            rows = stream(adversary_export_documents(
+                chunk_size=self.chunk_size, **filters))
+        else:
+            stream, content_type = EXPORT_FORMATS[output]
+            rows = stream(adversary_iter(chunk_size=self.chunk_size,
+                                         **filters))
+        response = StreamingHttpResponse(rows, content_type=content_type)
+        response["Content-Disposition"] = \
+            f'attachment; filename="adversaries.{output}"'
+        return response
@@ -0,0 +1,89 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = "The adversary was modified, fetch it again."
+    default_code = "precondition_failed"
+
+
+class EditConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "The adversary was modified by a concurrent request."
+    default_code = "conflict"
+
+
+def version_etag(version):
+    return f'"{version}"'
+
+
+def etag(adv):
+    """Strong ETag of an adversary, its version."""
+    return version_etag(adv.version)
+
+
+def collection_etag(request, last_updated, count):
+    """Weak ETag of a collection page: the request (filters, page,
+    fields) and the state of the collection (last update and row
+    count, a delete changes it too)."""
+    params = sorted(
+        (k, v) for k in request.query_params
+        for v in request.query_params.getlist(k)
+    )
+    raw = repr((request.path, params, last_updated, count))
+    return f'W/"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+
+
+def validator_headers(etag_value, last_modified=None):
+    headers = {"ETag": etag_value}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified.timestamp())
+    return headers
+
+
+def not_modified(request, headers, last_modified=None):
+    """304 Not Modified when the copy of the client is current
+    (If-None-Match, or If-Modified-Since without it), 412 when an
+    If-Match fails, None when the response has to be built.
+
+    Args:
+        headers: validator_headers of the resource, sent with the 304
+        last_modified: datetime checked against If-Modified-Since, left
+            out for collections (a delete does not move it)
+    """
+    response = get_conditional_response(
+        request,
+        etag=headers["ETag"],
+        last_modified=int(last_modified.timestamp())
+        if last_modified is not None else None,
+    )
+    if response is not None:
+        for header, value in headers.items():
+            response[header] = value
+    return response
+
+
+def if_match_version(request, adv):
+    """Version of adv the client asks to modify (If-Match).
+
+    Returns:
+        adv.version when one of the ETags matches, None without If-Match
+        or with "*"
+
+    Raises:
+        PreconditionFailed: no ETag matches the current version
+    """
+    header = request.headers.get("If-Match")
+    if header is None or header.strip() == "*":
+        return None
+
+    # weak ETags never match If-Match
+    tags = {t.strip() for t in header.split(",")}
+    if etag(adv) not in tags:
+        raise PreconditionFailed()
+    return adv.version
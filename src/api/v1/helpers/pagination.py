@@ -0,0 +1,206 @@
+import binascii
+import datetime
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class _CursorEncoder(DjangoJSONEncoder):
+    # DjangoJSONEncoder cuts datetimes to milliseconds, a cursor keeps
+    # the stored microseconds or rows of the same millisecond repeat or
+    # get skipped
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(position, reverse=False):
+    payload = json.dumps({"p": position, "r": reverse},
+                         cls=_CursorEncoder, separators=(",", ":"))
+    return urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """(position, reverse) of a cursor token.
+
+    Raises:
+        ValueError: the token was not made by encode_cursor
+    """
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        data = json.loads(urlsafe_b64decode(padded.encode()))
+        return list(data["p"]), bool(data["r"])
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError,
+            KeyError, TypeError) as e:
+        raise ValueError("invalid cursor") from e
+
+
+def _split(term):
+    return (term[1:], True) if term.startswith("-") else (term, False)
+
+
+def keyset_filter(ordering, position, reverse=False):
+    """Q of the rows strictly after position in ordering (before it
+    when reverse).
+
+    (a, b) > (x, y) is written a >= x AND (a > x OR (a = x AND b > y)):
+    the leading bound is a plain range on the first column, an index
+    on the ordering columns seeks to it instead of scanning.
+    """
+    terms = [_split(t) for t in ordering]
+    # descending fields and backward pages read towards smaller values
+    ops = ["lt" if desc != reverse else "gt" for _, desc in terms]
+
+    branches = []
+    for i, value in enumerate(position):
+        equal = {terms[j][0]: position[j] for j in range(i)}
+        branches.append(Q(**equal, **{f"{terms[i][0]}__{ops[i]}": value}))
+    bound = Q(**{f"{terms[0][0]}__{ops[0]}e": position[0]})
+    return bound & reduce(or_, branches)
+
+
+class KeysetPagination(BasePagination):
+    """Cursor pagination over a unique ordering, without OFFSET nor
+    COUNT.
+
+    The cursor holds the ordering values of the last (next page) or
+    first (previous page) row served, a page is a range read from that
+    position: deep pages cost the same as the first one. The last
+    ordering field must be unique (id) and none of them nullable.
+    """
+    ordering = ("name", "id")
+    default_limit = 50
+    max_limit = 200
+    cursor_query_param = "cursor"
+    limit_query_param = "limit"
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = tuple(ordering)
+
+    def get_limit(self, request):
+        raw = request.query_params.get(self.limit_query_param)
+        if raw is None:
+            return self.default_limit
+        try:
+            limit = int(raw)
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.max_limit:
+            raise ValidationError({self.limit_query_param:
+                                   f"Expected 1 to {self.max_limit}."})
+        return limit
+
+    def get_cursor(self, queryset, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if token is None:
+            return None, False
+        try:
+            position, reverse = decode_cursor(token)
+            if len(position) != len(self.ordering):
+                raise ValueError("invalid cursor")
+            # back to python values (dates...) for the lookups
+            position = [
+                queryset.model._meta.get_field(_split(t)[0]).to_python(v)
+                for t, v in zip(self.ordering, position)
+            ]
+        except (ValueError, DjangoValidationError):
+            raise ValidationError({self.cursor_query_param:
+                                   "Invalid cursor."})
+        return position, reverse
+
+    def _position(self, obj):
+        return [getattr(obj, _split(t)[0]) for t in self.ordering]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        limit = self.get_limit(request)
+        position, reverse = self.get_cursor(queryset, request)
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [t[1:] if t.startswith("-") else f"-{t}"
+                        for t in ordering]
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                keyset_filter(self.ordering, position, reverse))
+
+        # one extra row tells whether the page is the last one
+        rows = list(queryset[:limit + 1])
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if reverse:
+            rows.reverse()
+            has_next, has_previous = position is not None, has_more
+        else:
+            has_next, has_previous = has_more, position is not None
+
+        self.next_cursor = encode_cursor(self._position(rows[-1])) \
+            if rows and has_next else None
+        self.previous_cursor = encode_cursor(self._position(rows[0]), True) \
+            if rows and has_previous else None
+        return rows
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            "next": self._link(self.next_cursor),
+            "previous": self._link(self.previous_cursor),
+            "results": data,
+        })
+
+
+class RankedPagination(KeysetPagination):
+    """Forward only cursor pagination of ranked results, the cursor
+    holds the (score, id) of the last result served."""
+
+    def get_after(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if token is None:
+            return None
+        try:
+            (score, pk), _ = decode_cursor(token)
+            return float(score), int(pk)
+        except (ValueError, TypeError):
+            raise ValidationError({self.cursor_query_param:
+                                   "Invalid cursor."})
+
+    def paginate_ranked(self, rank, load, request):
+        """Page of the ranked results.
+
+        Args:
+            rank: rank(limit, after), list of (id, score)
+            load: load(ranked), list of (object, score) of the ranked ids
+                still existing
+
+        The next cursor is decided on the ranked ids, a result dropped
+        by load does not end the pages early.
+        """
+        self.request = request
+        limit = self.get_limit(request)
+
+        # one extra result tells whether the page is the last one
+        ranked = rank(limit + 1, self.get_after(request))
+        self.next_cursor = None
+        if len(ranked) > limit:
+            ranked = ranked[:limit]
+            pk, score = ranked[-1]
+            self.next_cursor = encode_cursor([score, pk])
+        self.previous_cursor = None
+        return load(ranked)
@@ -0,0 +1,107 @@
+"""Server-side cache of the collection responses.
+
+A response is cached under its normalized request (scheme and host, the
+absolute urls of the body depend on them, path and sorted query
+parameters) and the generations of the models it reads: a write bumps
+them (see adversaries.helpers.generations) and the next request misses.
+Nothing is ever deleted, stale entries expire with their timeout.
+
+Entries and generations live in the default cache, which has to be
+shared by the processes (production.py configures one): with a
+process-local cache a worker would not see the bumps of the others and
+serve stale pages, and stale 304s, for up to DEFAULT_TIMEOUT.
+
+On a miss a single request computes the response, the concurrent ones
+wait for it a little instead of all querying the database (stampede).
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from adversaries.helpers.generations import generations
+
+
+DEFAULT_TIMEOUT = 300
+# a request computing an entry holds the lock at most this long (s)
+LOCK_TIMEOUT = 10
+# how long, and how often, the other requests poll for the entry (s)
+WAIT_TIMEOUT = 2.0
+WAIT_STEP = 0.05
+
+_MISS = object()
+
+
+def versioned_key(parts, models):
+    """Cache key of parts under the current generations of models."""
+    raw = repr((parts, generations(models)))
+    return "api:v1:response:" + hashlib.sha256(raw.encode()).hexdigest()
+
+
+def response_key(request, models):
+    params = sorted(
+        (k, v) for k in request.query_params
+        for v in request.query_params.getlist(k)
+    )
+    return versioned_key(
+        (request.scheme, request.get_host(), request.path, params), models)
+
+
+def get_or_compute(key, compute, timeout=DEFAULT_TIMEOUT):
+    """Cached value of key, compute() stored under it on a miss.
+
+    Only the request winning the lock computes, the others poll the
+    cache for up to WAIT_TIMEOUT then compute on their own.
+    """
+    value = cache.get(key, _MISS)
+    if value is not _MISS:
+        return value
+
+    lock = key + ":lock"
+    if cache.add(lock, 1, timeout=LOCK_TIMEOUT):
+        try:
+            value = compute()
+            if value is not None:
+                cache.set(key, value, timeout=timeout)
+            return value
+        finally:
+            cache.delete(lock)
+
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        value = cache.get(key, _MISS)
+        if value is not _MISS:
+            return value
+    return compute()
+
+
+def cache_response(*models, timeout=DEFAULT_TIMEOUT):
+    """Cache the 200 responses of an APIView get, until a write to one
+    of models.
+
+    Only for responses identical for every user.
+    """
+    def decorator(get):
+        @wraps(get)
+        def wrapper(view, request, *args, **kwargs):
+            response = None
+
+            def compute():
+                nonlocal response
+                response = get(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return None
+                return response.data
+
+            data = get_or_compute(response_key(request, models), compute,
+                                  timeout)
+            # computed by this request (cached or not): answered as is
+            if response is not None:
+                return response
+            return Response(data)
+        return wrapper
+    return decorator
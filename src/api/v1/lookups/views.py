@@ -2,8 +2,10 @@ from rest_framework import serializers
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from adversaries.models import Experience, Feature, Tactic, Tag
 from adversaries.selectors import experience_list, experience_get, \
     tactic_list, tactic_get, tag_list, tag_get, feature_list, feature_get
+from api.v1.helpers.response_cache import cache_response
 
 
 class ExperienceCollectionApi(APIView):
@@ -11,6 +13,7 @@ class ExperienceCollectionApi(APIView):
         id = serializers.IntegerField()
         name = serializers.CharField()
 
+    @cache_response(Experience)
     def get(self, request):
         experiences = experience_list()
         data = self.OutputSerializer(experiences, many=True).data
@@ -35,6 +38,7 @@ class FeatureCollectionApi(APIView):
         type = serializers.CharField()
         description = serializers.CharField()
 
+    @cache_response(Feature)
     def get(self, request):
         features = feature_list()
         data = self.OutputSerializer(features, many=True).data
@@ -59,6 +63,7 @@ class TacticCollectionApi(APIView):
         id = serializers.IntegerField()
         name = serializers.CharField()
 
+    @cache_response(Tactic)
     def get(self, request):
         tactics = tactic_list()
         data = self.OutputSerializer(tactics, many=True).data
@@ -81,6 +86,7 @@ class TagCollectionApi(APIView):
         id = serializers.IntegerField()
         name = serializers.CharField()
 
+    @cache_response(Tag)
     def get(self, request):
         tags = tag_list()
         data = self.OutputSerializer(tags, many=True).data
@@ -1,6 +1,8 @@
 from django.urls import path
 
-from api.v1.adversaries.views import AdversaryCollectionApi, AdversaryItemApi
+from api.v1.adversaries.views import AdversaryCollectionApi, \
+    AdversaryItemApi, AdversaryBulkApi, AdversaryExportApi, \
+    AdversarySearchApi
 from api.v1.lookups.views import ExperienceCollectionApi, ExperienceItemApi, \
     TacticCollectionApi, TacticItemApi, FeatureCollectionApi, FeatureItemApi, \
     TagCollectionApi, TagItemApi
@@ -16,6 +18,12 @@ urlpatterns = [
          name='adversaries-detail'),
     path('adversaries/', AdversaryCollectionApi.as_view(),
          name='adversaries-list'),
+    path('adversaries/bulk/', AdversaryBulkApi.as_view(),
+         name='adversaries-bulk'),
+    path('adversaries/export/', AdversaryExportApi.as_view(),
+         name='adversaries-export'),
+    path('adversaries/search/', AdversarySearchApi.as_view(),
+         name='adversaries-search'),
 
     path("lookups/experiences/", ExperienceCollectionApi.as_view(),
          name="experiences-list"),
@@ -35,6 +35,10 @@ def _guardrails():
         engine = DATABASES["default"]["ENGINE"]
         if engine.endswith("sqlite3"):
             raise ImproperlyConfigured("SQLite is not allowed in Production.")
+        backend = CACHES["default"]["BACKEND"]
+        if backend.endswith(("LocMemCache", "DummyCache")):
+            raise ImproperlyConfigured(
+                "Production needs a cache shared by the processes.")
 
 
 _guardrails()
@@ -14,3 +14,7 @@ DATABASES = {
         'NAME': BASE_DIR / 'db.sqlite3',
     }
 }
+
+# runserver is a single process, the locmem cache is enough to intern
+# value objects
+ADVERSARIES_INTERNING = True
@@ -30,3 +30,23 @@ DATABASES = {
         'PORT': int(os.getenv("PGPORT", "5432")),
     }
 }
+
+# shared by the workers and the management commands: the interned value
+# objects, the cache generations and the cached responses are
+# invalidated through it. Redis when REDIS_URL is set, else the
+# database (python manage.py createcachetable)
+REDIS_URL = os.getenv("REDIS_URL")
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'django_cache',
+        }
+    }
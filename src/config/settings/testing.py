@@ -10,3 +10,6 @@ DATABASES = {
         "NAME": ":memory:",
     }
 }
+
+# a single process, the locmem cache is enough to intern value objects
+ADVERSARIES_INTERNING = True
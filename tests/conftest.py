@@ -1,6 +1,8 @@
 import pytest
+from django.core.cache import cache
 
 from accounts.models import Account
+from adversaries.helpers.interning import intern_clear
 
 
 @pytest.fixture
@@ -12,3 +14,11 @@ def conf_account():
 def fast_auth(settings):
     settings.PASSWORD_HASHERS = ["django.contrib.auth.hashers.MD5PasswordHasher"]
     settings.AUTH_PASSWORD_VALIDATORS = []
+
+
+@pytest.fixture(autouse=True)
+def clear_intern_caches():
+    # ids interned by a test must not leak into the next database
+    yield
+    intern_clear()
+    cache.clear()
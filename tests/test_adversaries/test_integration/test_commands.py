@@ -0,0 +1,414 @@
+import json
+from datetime import timedelta
+from io import StringIO
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command, CommandError
+from django.db import connection
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from accounts.models import Account
+from adversaries.dtos.dto import AdversaryDTO, BasicAttackDTO, DamageDTO, \
+    TacticDTO, FeatureDTO
+from adversaries.helpers.exporting import to_document
+from adversaries.helpers.interning import intern_cache
+from adversaries.models import Adversary, Tactic, Feature, BasicAttack, \
+    AdversaryExperience, DamageProfile, AdversaryDocument
+from adversaries.selectors import adversary_iter
+from adversaries.services import adversary_create, adversary_update, \
+    value_objects_gc
+
+
+TSV_PATH = settings.BASE_DIR.parent / "data" / "adversaries.tsv"
+
+
+# --- PIPE TSV --- #
+@pytest.mark.django_db
+def test_pipe_tsv_imports_every_row(conf_account, tmp_path):
+    checkpoint = tmp_path / "import.checkpoint"
+    call_command("pipe_tsv", TSV_PATH, author=conf_account.username,
+                 batch_size=50, chunk_size=100, checkpoint=checkpoint)
+
+    assert Adversary.objects.count() == 129
+    assert AdversaryDocument.objects.count() == 129
+    adv = Adversary.objects.get(name="Acid Burrower")
+    assert adv.author == conf_account
+    assert adv.source == "official"
+    assert adv.tier == 1
+    assert adv.type == Adversary.Type.SOLO
+    assert adv.basic_attack.range == BasicAttack.Range.VERY_CLOSE
+    assert adv.basic_attack.damage.dice_type == 12
+    assert set(adv.tactics.values_list("name", flat=True)) == {
+        "burrow", "drag away", "feed", "reposition"
+    }
+    assert adv.features.count() == 4
+    assert AdversaryExperience.objects.get(adversary=adv).bonus == 2
+
+    # value objects are shared between adversaries
+    assert Tactic.objects.filter(name="burrow").count() == 1
+    assert Feature.objects.count() < sum(
+        a.features.count() for a in Adversary.objects.all())
+    # a complete import leaves no checkpoint behind
+    assert not checkpoint.exists()
+
+
+@pytest.fixture
+def broken_tsv(tmp_path):
+    """Copy of the first 30 rows, row 25 has an invalid difficulty."""
+    lines = TSV_PATH.read_text(encoding="utf-8").splitlines()[:31]
+    cells = lines[25].split("\t")
+    good_difficulty, cells[6] = cells[6], "not a number"
+    lines[25] = "\t".join(cells)
+    path = tmp_path / "shard.tsv"
+    path.write_text("\n".join(lines), encoding="utf-8")
+    return path, good_difficulty
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_commits_chunks_and_resumes(conf_account, broken_tsv):
+    path, good_difficulty = broken_tsv
+    checkpoint = path.with_name(path.name + ".checkpoint")
+
+    with pytest.raises(ValueError):
+        call_command("pipe_tsv", path, author=conf_account.username,
+                     chunk_size=10, batch_size=4)
+
+    # the two first chunks were committed before the failure
+    assert Adversary.objects.count() == 20
+    assert json.loads(checkpoint.read_text())["rows"] == 20
+
+    path.write_text(path.read_text(encoding="utf-8").replace(
+        "not a number", good_difficulty), encoding="utf-8")
+    call_command("pipe_tsv", path, author=conf_account.username,
+                 chunk_size=10, resume=True)
+
+    assert Adversary.objects.count() == 30
+    assert not checkpoint.exists()
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_resume_rejects_foreign_checkpoint(conf_account, tmp_path):
+    checkpoint = tmp_path / "other.checkpoint"
+    checkpoint.write_text(json.dumps({"source": "/elsewhere.tsv",
+                                      "rows": 3}))
+
+    with pytest.raises(CommandError):
+        call_command("pipe_tsv", TSV_PATH, author=conf_account.username,
+                     checkpoint=checkpoint, resume=True)
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_unknown_author():
+    with pytest.raises(CommandError):
+        call_command("pipe_tsv", TSV_PATH, author="nobody")
+
+
+@pytest.fixture
+def tsv_shards(tmp_path):
+    """data/adversaries.tsv split in three shards of 43 rows."""
+    header, *rows = TSV_PATH.read_text(encoding="utf-8").splitlines()
+    for i in range(3):
+        shard = rows[i * 43:(i + 1) * 43]
+        (tmp_path / f"shard_{i}.tsv").write_text(
+            "\n".join([header, *shard]), encoding="utf-8")
+    return tmp_path
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_directory_with_worker_pool(conf_account, tsv_shards):
+    call_command("pipe_tsv", tsv_shards, author=conf_account.username,
+                 workers=2, chunk_size=20)
+
+    assert Adversary.objects.count() == 129
+    assert Tactic.objects.filter(name="burrow").count() == 1
+    assert not list(tsv_shards.glob("*.checkpoint"))
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_keys_same_named_files_by_relative_path(conf_account,
+                                                         tsv_shards):
+    for i, folder in enumerate(["a", "b"]):
+        (tsv_shards / folder).mkdir()
+        (tsv_shards / f"shard_{i}.tsv").rename(
+            tsv_shards / folder / "adversaries.tsv")
+    call_command("pipe_tsv", str(tsv_shards / "*" / "adversaries.tsv"),
+                 author=conf_account.username, workers=2, chunk_size=10,
+                 retire=True)
+
+    assert Adversary.objects.count() == 86
+    assert set(Adversary.objects.values_list("source_key", flat=True)) \
+        == {"a/adversaries.tsv", "b/adversaries.tsv"}
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_workers_need_a_row_parser(conf_account, tmp_path):
+    script = tmp_path / "parser.py"
+    script.write_text("def parse_tsv(filepath):\n    return []\n")
+    with pytest.raises(CommandError, match="parse_row"):
+        call_command("pipe_tsv", TSV_PATH, author=conf_account.username,
+                     script_filepath=script, workers=2)
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_reports_feature_parse_errors(conf_account, tmp_path):
+    header, row, *_ = TSV_PATH.read_text(encoding="utf-8").splitlines()
+    cells = row.split("\t")
+    cells[15] = "Stray text  " + cells[15]
+    tsv = tmp_path / "a.tsv"
+    tsv.write_text("\n".join([header, "\t".join(cells)]), encoding="utf-8")
+
+    out, err = StringIO(), StringIO()
+    call_command("pipe_tsv", tsv, author=conf_account.username,
+                 stdout=out, stderr=err)
+
+    assert "1 feature parse error(s)" in out.getvalue()
+    assert f"a.tsv: {cells[0]}: features, character 0: text before the " \
+        "first feature header" in err.getvalue()
+    assert Adversary.objects.get().features.exists()
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_glob(conf_account, tsv_shards):
+    call_command("pipe_tsv", str(tsv_shards / "shard_[01].tsv"),
+                 author=conf_account.username)
+
+    assert Adversary.objects.count() == 86
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_no_matching_file(conf_account, tmp_path):
+    with pytest.raises(CommandError):
+        call_command("pipe_tsv", str(tmp_path / "*.tsv"),
+                     author=conf_account.username)
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_reimport_unchanged_file_writes_nothing(conf_account,
+                                                         tsv_shards):
+    shard = tsv_shards / "shard_0.tsv"
+    call_command("pipe_tsv", shard, author=conf_account.username)
+    assert Adversary.objects.get(name="Acid Burrower").source_key == \
+        "shard_0.tsv"
+
+    out = StringIO()
+    with CaptureQueriesContext(connection) as ctx:
+        call_command("pipe_tsv", shard, author=conf_account.username,
+                     stdout=out)
+
+    assert "0 created, 0 updated, 43 unchanged" in out.getvalue()
+    assert not [q for q in ctx.captured_queries
+                if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+    assert Adversary.objects.count() == 43
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_reimport_updates_changed_and_retires_missing(
+        conf_account, tsv_shards):
+    shard = tsv_shards / "shard_0.tsv"
+    call_command("pipe_tsv", shard, author=conf_account.username)
+
+    header, first, second, *rows = shard.read_text(
+        encoding="utf-8").splitlines()
+    cells = first.split("\t")
+    cells[8] = "99"  # hit points
+    shard.write_text("\n".join([header, "\t".join(cells), *rows]),
+                     encoding="utf-8")
+
+    out = StringIO()
+    call_command("pipe_tsv", shard, author=conf_account.username,
+                 retire=True, stdout=out)
+
+    assert "0 created, 1 updated, 41 unchanged, 1 retired" in out.getvalue()
+    assert Adversary.objects.count() == 42
+    assert Adversary.objects.get(name=cells[0]).hit_point == 99
+    assert not Adversary.objects.filter(name=second.split("\t")[0]).exists()
+
+
+@pytest.mark.django_db
+def test_pipe_tsv_profile_report(conf_account, tsv_shards, tmp_path):
+    report_path = tmp_path / "profile.json"
+    out = StringIO()
+    call_command("pipe_tsv", tsv_shards / "shard_0.tsv",
+                 author=conf_account.username, profile=report_path,
+                 stdout=out)
+
+    assert "43 rows in" in out.getvalue()
+    assert "peak memory" in out.getvalue()
+
+    report = json.loads(report_path.read_text())
+    assert report["rows"] == 43
+    assert report["created"] == 43
+    assert report["peak_memory_bytes"] > 0
+    assert {"parse", "diff", "resolve", "insert", "link"} <= \
+        set(report["stages"])
+    assert report["stages"]["insert"]["queries"] > 0
+    assert report["stages"]["parse"]["queries"] == 0
+    assert report["hot_spots"][0]["calls"] > 0
+    assert {"hits", "misses"} <= set(report["interning"]["adversaries.tag"])
+
+
+# --- DUMP ADVERSARIES --- #
+def _comparable(adv):
+    doc = to_document(adv)
+    del doc["id"]
+    for key in ("tactics", "tags", "experiences", "features"):
+        doc[key] = sorted(doc[key], key=str)
+    return doc
+
+
+@pytest.mark.django_db
+def test_dump_adversaries_tsv_round_trips_with_pipe_tsv(conf_account,
+                                                        tmp_path):
+    call_command("pipe_tsv", TSV_PATH, author=conf_account.username)
+    dump = tmp_path / "dump.tsv"
+    call_command("dump_adversaries", output=dump, chunk_size=50)
+
+    other = Account.objects.create(username="other")
+    call_command("pipe_tsv", dump, author=other.username)
+
+    originals = {a.name: _comparable(a) for a in adversary_iter()
+                 if a.author_id == conf_account.id}
+    copies = {a.name: _comparable(a) for a in adversary_iter()
+              if a.author_id == other.id}
+    assert len(copies) == 129
+    assert copies == originals
+
+
+@pytest.mark.django_db
+def test_dump_adversaries_ndjson_to_stdout(conf_account):
+    Adversary.objects.create(name="Goblin", author=conf_account, tier=1)
+    Adversary.objects.create(name="Orc", author=conf_account)
+
+    out = StringIO()
+    call_command("dump_adversaries", format="ndjson", stdout=out)
+
+    lines = out.getvalue().splitlines()
+    assert [json.loads(line)["name"] for line in lines] == ["Goblin", "Orc"]
+    assert json.loads(lines[0])["tier"] == 1
+
+
+@pytest.mark.django_db
+def test_adversary_iter_prefetches_chunk_by_chunk(conf_account):
+    for i in range(5):
+        Adversary.objects.create(name=f"Goblin {i}", author=conf_account)
+
+    with CaptureQueriesContext(connection) as ctx:
+        rows = adversary_iter(chunk_size=2)
+        next(rows)
+        # the first chunk only: adversaries + 4 prefetches
+        assert len(ctx.captured_queries) == 5
+        assert len(list(rows)) == 4
+    assert len(ctx.captured_queries) == 1 + 3 * 4
+
+
+# --- GC VALUE OBJECTS --- #
+@pytest.fixture
+def orphaned_value_objects(conf_account):
+    adv = adversary_create(AdversaryDTO(
+        name="Goblin",
+        basic_attack=BasicAttackDTO(name="Stab", damage=DamageDTO(
+            dice_number=1, dice_type=6, bonus=0, damage_type="PHY")),
+        tactics=[TacticDTO(name="Flank")],
+        features=[FeatureDTO(name="Sneaky", type="PAS",
+                             description="Hides")],
+    ), author_id=conf_account.id)
+    # the old basic attack, damage profile, tactic and feature are left
+    adversary_update(adv, AdversaryDTO(
+        name="Goblin",
+        basic_attack=BasicAttackDTO(name="Slash", damage=DamageDTO(
+            dice_number=1, dice_type=8, bonus=0, damage_type="PHY")),
+        tactics=[TacticDTO(name="Ambush")],
+        features=[FeatureDTO(name="Sneaky", type="PAS",
+                             description="Hides well")],
+    ))
+    return adv
+
+
+@pytest.mark.django_db
+def test_gc_value_objects_deletes_orphans_only(orphaned_value_objects):
+    out = StringIO()
+    call_command("gc_value_objects", batch_size=1, grace_days=0,
+                 stdout=out)
+
+    assert "GC deleted 4 row(s)" in out.getvalue()
+    assert list(BasicAttack.objects.values_list("name", flat=True)) == \
+        ["Slash"]
+    assert list(DamageProfile.objects.values_list("dice_type", flat=True)) \
+        == [8]
+    assert list(Tactic.objects.values_list("name", flat=True)) == ["Ambush"]
+    assert list(Feature.objects.values_list("description", flat=True)) == \
+        ["Hides well"]
+
+
+@pytest.mark.django_db
+def test_gc_value_objects_dry_run_and_periodic(orphaned_value_objects):
+    out = StringIO()
+    call_command("gc_value_objects", dry_run=True, grace_days=0,
+                 stdout=out)
+    assert "GC would delete 4 row(s)" in out.getvalue()
+    assert BasicAttack.objects.count() == 2
+
+    out = StringIO()
+    call_command("gc_value_objects", interval=0, runs=2, grace_days=0,
+                 stdout=out)
+    lines = out.getvalue().splitlines()
+    assert lines[0].startswith("GC deleted 4 row(s)")
+    assert lines[1].startswith("GC deleted 0 row(s)")
+
+
+@pytest.mark.django_db
+def test_gc_value_objects_waits_for_the_grace_period(
+        orphaned_value_objects):
+    adv = orphaned_value_objects
+    assert value_objects_gc()["adversaries.tactic"] == 0
+    flank = Tactic.objects.get(name="Flank")
+    assert flank.orphaned_at is not None
+
+    # referenced again, the row loses its mark
+    adv.tactics.add(flank)
+    value_objects_gc()
+    flank.refresh_from_db()
+    assert flank.orphaned_at is None
+
+    adv.tactics.remove(flank)
+    value_objects_gc()
+    Tactic.objects.filter(pk=flank.pk).update(
+        orphaned_at=F("orphaned_at") - timedelta(days=31))
+    assert value_objects_gc()["adversaries.tactic"] == 1
+    assert not Tactic.objects.filter(pk=flank.pk).exists()
+
+
+@pytest.mark.django_db
+def test_gc_value_objects_invalidates_interning(
+        orphaned_value_objects, django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        resolved = value_objects_gc(grace=timedelta(0))
+    assert resolved["adversaries.tactic"] == 1
+    assert intern_cache(Tactic).stats()["size"] == 0
+
+
+@pytest.mark.django_db
+def test_gc_value_objects_keeps_rows_linked_after_the_lookup(
+        orphaned_value_objects):
+    adv = orphaned_value_objects
+    flank = Tactic.objects.get(name="Flank")
+    through = Adversary.tactics.through
+    linked = []
+
+    def link_before_delete(execute, sql, params, many, context):
+        # another writer links the orphan right before the gc deletes it
+        if not linked and sql.startswith("DELETE") \
+                and through._meta.db_table in sql:
+            linked.append(True)
+            through.objects.create(adversary=adv, tactic=flank)
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(link_before_delete):
+        reclaimed = value_objects_gc(grace=timedelta(0))
+
+    assert linked
+    assert reclaimed["adversaries.tactic"] == 0
+    assert set(adv.tactics.values_list("name", flat=True)) == \
+        {"Ambush", "Flank"}
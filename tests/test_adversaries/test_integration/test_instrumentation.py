@@ -0,0 +1,37 @@
+import pytest
+
+from adversaries.helpers.instrumentation import ImportProfiler, stage
+from adversaries.models import Tactic
+
+
+@pytest.mark.django_db
+def test_profiler_charges_queries_to_innermost_stage():
+    profiler = ImportProfiler()
+    with profiler.run():
+        with stage("outer"):
+            Tactic.objects.count()
+            with stage("inner"):
+                Tactic.objects.create(name="Flank")
+                Tactic.objects.count()
+        Tactic.objects.count()
+    profiler.rows = 10
+
+    report = profiler.report()
+    assert report["stages"]["outer"]["queries"] == 1
+    assert report["stages"]["inner"]["queries"] == 2
+    assert report["stages"]["other"]["queries"] == 1
+    assert report["stages"]["outer"]["seconds"] >= \
+        report["stages"]["inner"]["seconds"]
+    assert report["peak_memory_bytes"] is None
+    assert report["hot_spots"] == []
+
+
+def test_stage_without_active_profiler_is_noop():
+    with stage("anything"):
+        pass
+
+
+def test_profiler_iterate_times_each_item():
+    profiler = ImportProfiler()
+    assert list(profiler.iterate("parse", range(3))) == [0, 1, 2]
+    assert profiler.stages["parse"].queries == 0
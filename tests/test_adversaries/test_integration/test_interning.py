@@ -0,0 +1,129 @@
+import pytest
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from adversaries.dtos.dto import AdversaryDTO, TacticDTO, TagDTO
+from adversaries.helpers.interning import InternCache, intern_cache, \
+    intern_stats
+from adversaries.models import Adversary, Tactic, Tag
+from adversaries.services import adversary_create
+
+
+def _dto(name):
+    return AdversaryDTO(name=name,
+                        tactics=[TacticDTO(name="Flank"),
+                                 TacticDTO(name="Ambush")],
+                        tags=[TagDTO(name="fire")])
+
+
+# --- INTERN CACHE --- #
+def test_intern_cache_is_a_bounded_lru():
+    c = InternCache("test.lru", maxsize=2)
+    c.lookup([])
+    c._store({("a",): 1, ("b",): 2}, c._generation)
+    c.lookup([("a",)])
+    c._store({("c",): 3}, c._generation)
+
+    found, missing = c.lookup([("a",), ("b",), ("c",)])
+    assert found == {("a",): 1, ("c",): 3}
+    assert missing == [("b",)]
+    assert c.stats()["size"] == 2
+
+
+def test_intern_cache_entries_expire():
+    c = InternCache("test.ttl", ttl=0)
+    c.lookup([])
+    c._store({("a",): 1}, c._generation)
+    assert c.lookup([("a",)]) == ({}, [("a",)])
+
+
+def test_interning_needs_a_shared_cache(settings):
+    del settings.ADVERSARIES_INTERNING
+    assert intern_cache(Tactic) is None
+
+    settings.CACHES = {"default": {
+        "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+        "LOCATION": "django_cache"}}
+    assert intern_cache(Tactic) is not None
+
+
+def test_intern_cache_drops_entries_when_version_moves():
+    worker_1 = InternCache("test.version")
+    worker_2 = InternCache("test.version")
+    worker_1.lookup([])
+    worker_1._store({("a",): 1}, worker_1._generation)
+
+    worker_2._bump_version()
+
+    assert worker_1.lookup([("a",)]) == ({}, [("a",)])
+
+
+# --- SERVICES --- #
+@pytest.mark.django_db
+def test_resolution_is_interned_after_commit(conf_account,
+                                             django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        adversary_create(_dto("Goblin"), author_id=conf_account.id)
+
+    with CaptureQueriesContext(connection) as ctx:
+        with django_capture_on_commit_callbacks(execute=True):
+            adv = adversary_create(_dto("Hobgoblin"),
+                                   author_id=conf_account.id)
+
+    # apart from the prefetches rendering the read model document
+    sql = " ".join(q["sql"] for q in ctx.captured_queries
+                   if "_prefetch_related_val" not in q["sql"])
+    assert '"adversaries_tactic"' not in sql
+    assert '"adversaries_tag"' not in sql
+    assert set(adv.tactics.values_list("name", flat=True)) == {"Flank",
+                                                               "Ambush"}
+    assert intern_stats()["adversaries.tactic"]["hits"] == 2
+
+
+@pytest.mark.django_db
+def test_rolled_back_ids_are_not_interned(conf_account,
+                                          django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        with pytest.raises(RuntimeError):
+            with transaction.atomic():
+                adversary_create(_dto("Goblin"), author_id=conf_account.id)
+                raise RuntimeError
+
+    # the on_commit callbacks of a rolled back block are discarded
+    assert callbacks == []
+    assert intern_cache(Tactic).stats()["size"] == 0
+
+
+@pytest.mark.django_db
+def test_modified_value_object_invalidates(conf_account,
+                                           django_capture_on_commit_callbacks):
+    with django_capture_on_commit_callbacks(execute=True):
+        adversary_create(_dto("Goblin"), author_id=conf_account.id)
+    assert intern_cache(Tag).stats()["size"] == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        tag = Tag.objects.get(name="fire")
+        tag.name = "ember"
+        tag.save()
+
+    assert intern_cache(Tag).stats()["size"] == 0
+    found, missing = intern_cache(Tag).lookup([("fire",)])
+    assert missing == [("fire",)]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_create_retries_without_a_deleted_interned_id(conf_account):
+    adversary_create(_dto("Goblin"), author_id=conf_account.id)
+    assert intern_cache(Tactic).stats()["size"] == 2
+
+    # another process deletes a tactic, its invalidation does not reach
+    # this one
+    through = Adversary.tactics.through._meta.db_table
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {through}")
+        cursor.execute(f"DELETE FROM {Tactic._meta.db_table} "
+                       f"WHERE name = 'Flank'")
+
+    adv = adversary_create(_dto("Hobgoblin"), author_id=conf_account.id)
+    assert set(adv.tactics.values_list("name", flat=True)) == {"Flank",
+                                                               "Ambush"}
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from adversaries.helpers.exporting import to_document
+from adversaries.models import Adversary, BasicAttack
+from adversaries.selectors import adversary_iter, adversary_export_documents
+
+
+TSV_PATH = settings.BASE_DIR.parent / "data" / "adversaries.tsv"
+
+
+def _sorted_relations(doc):
+    for key in ("tactics", "tags", "experiences", "features"):
+        doc[key] = sorted(doc[key], key=str)
+    return doc
+
+
+# --- EXPORT DOCUMENTS --- #
+@pytest.mark.django_db
+def test_export_documents_match_to_document(conf_account):
+    call_command("pipe_tsv", TSV_PATH, author=conf_account.username)
+    # a basic attack without damage, an adversary without anything
+    Adversary.objects.create(
+        name="Unarmed", author=conf_account,
+        basic_attack=BasicAttack.objects.create(name="Fists"))
+    Adversary.objects.create(name="Blank", author=conf_account)
+
+    with CaptureQueriesContext(connection) as ctx:
+        documents = [json.loads(d) for d in
+                     adversary_export_documents(chunk_size=50)]
+    assert len(ctx.captured_queries) == 1
+
+    expected = [to_document(adv) for adv in adversary_iter()]
+    assert len(documents) == 131
+    # both list the relations in no guaranteed order
+    assert [_sorted_relations(d) for d in documents] == \
+        [_sorted_relations(d) for d in expected]
+
+
+@pytest.mark.django_db
+def test_export_documents_filtered(conf_account):
+    Adversary.objects.create(name="Goblin", author=conf_account, tier=1)
+    Adversary.objects.create(name="Orc", author=conf_account, tier=2)
+
+    documents = [json.loads(d) for d in adversary_export_documents(tier=2)]
+    assert [d["name"] for d in documents] == ["Orc"]
+    assert documents[0]["tactics"] == []
+    assert documents[0]["basic_attack"] is None
@@ -169,6 +169,29 @@ def test_feature_type_choices_validation():
         bad.full_clean()
 
 
+@pytest.mark.django_db
+def test_feature_unique_entity_on_hash():
+    f = Feature.objects.create(name="Relentless", type=Feature.Type.PASSIVE)
+    assert len(f.hash) == 64
+
+    # NULL descriptions are part of the identity too
+    with pytest.raises(Django_IntegrityError):
+        Feature.objects.create(name="Relentless", type=Feature.Type.PASSIVE)
+
+
+@pytest.mark.django_db
+def test_feature_hash_follows_updates():
+    f = Feature.objects.create(name="Relentless", type=Feature.Type.PASSIVE,
+                               description="Act twice")
+    old_hash = f.hash
+
+    f.description = "Act thrice"
+    f.save(update_fields=["description"])
+
+    f.refresh_from_db()
+    assert f.hash != old_hash
+
+
 # --- ADVERSARY TESTS --- #
 @pytest.mark.django_db
 def test_adversary_defaults_and_relations(conf_basic_attack, conf_account):
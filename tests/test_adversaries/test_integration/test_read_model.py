@@ -0,0 +1,122 @@
+import json
+from io import StringIO
+
+import pytest
+from django.contrib import admin
+from django.core.management import call_command
+
+from adversaries.admin import TagAdmin
+from adversaries.dtos.dto import AdversaryDTO, FeatureDTO, TagDTO
+from adversaries.dtos.dto_patch import AdversaryPatchDTO
+from adversaries.models import Adversary, AdversaryDocument, Tag
+from adversaries.selectors import adversary_get
+from adversaries.services import adversary_create, adversary_update, \
+    adversary_partial_update, adversary_bulk_create, \
+    adversary_retire_missing
+from api.v1.adversaries.serializers_out import AdversaryDetailOut, \
+    AdversaryListOut
+
+
+def _document(adv):
+    doc = AdversaryDocument.objects.get(pk=adv.pk)
+    return json.loads(doc.detail), json.loads(doc.summary)
+
+
+def _rendered(adv):
+    adv = adversary_get(adv.pk)
+    summary = AdversaryListOut(adv, fields=[
+        f for f in AdversaryListOut().fields if f != "url"]).data
+    return AdversaryDetailOut(adv).data, summary
+
+
+# --- DOCUMENTS --- #
+@pytest.mark.django_db
+def test_documents_follow_writes(conf_account):
+    adv = adversary_create(AdversaryDTO(
+        name="Acid Burrower", tier=1,
+        tags=[TagDTO(name="cavern")],
+        features=[FeatureDTO(name="Spit Acid", type="ACT")],
+    ), conf_account.id)
+    assert _document(adv) == _rendered(adv)
+    detail, summary = _document(adv)
+    assert detail["author"] == {"id": conf_account.id, "username": "lou"}
+    assert summary["tags"] == "cavern"
+    assert "url" not in summary
+
+    adversary_update(adv, AdversaryDTO(name="Acid Burrower", tier=2))
+    assert _document(adv) == _rendered(adv)
+    assert _document(adv)[0]["features"] == []
+
+    adversary_partial_update(adversary_get(adv.pk),
+                             AdversaryPatchDTO(hit_point=9))
+    assert _document(adv)[0]["hit_point"] == 9
+
+    [other] = adversary_bulk_create([AdversaryDTO(name="Cave Ogre")],
+                                    conf_account.id)
+    assert _document(other) == _rendered(other)
+
+
+@pytest.mark.django_db
+def test_documents_deleted_with_adversaries(conf_account):
+    adv = adversary_create(AdversaryDTO(name="Goblin"), conf_account.id)
+    Adversary.objects.filter(pk=adv.pk).update(source_key="a.tsv")
+
+    adversary_retire_missing(conf_account.id, "a.tsv", kept_names=set())
+    assert not AdversaryDocument.objects.exists()
+
+
+@pytest.mark.django_db
+def test_documents_follow_author_rename(conf_account):
+    adv = adversary_create(AdversaryDTO(name="Goblin"), conf_account.id)
+
+    conf_account.username = "louise"
+    conf_account.save()
+    detail, summary = _document(adv)
+    assert detail["author"]["username"] == "louise"
+    assert summary["author"] == "louise"
+    # the ETag of the detail moves with the document
+    assert adversary_get(adv.pk).version == adv.version + 1
+
+
+@pytest.mark.django_db
+def test_documents_ignore_author_saves_without_rename(conf_account):
+    adv = adversary_create(AdversaryDTO(name="Goblin"), conf_account.id)
+    document = AdversaryDocument.objects.get(pk=adv.pk).detail
+
+    conf_account.set_password("s3cret-passw0rd")
+    conf_account.save()
+    conf_account.save(update_fields=["last_login"])
+
+    assert adversary_get(adv.pk).version == adv.version
+    assert AdversaryDocument.objects.get(pk=adv.pk).detail == document
+
+
+@pytest.mark.django_db
+def test_documents_follow_admin_writes(conf_account):
+    adv = adversary_create(AdversaryDTO(
+        name="Goblin", tags=[TagDTO(name="cavern"), TagDTO(name="swamp")],
+    ), conf_account.id)
+    tag_admin = TagAdmin(Tag, admin.site)
+
+    tag_admin.delete_model(None, Tag.objects.get(name="cavern"))
+    assert _document(adv)[1]["tags"] == "swamp"
+    assert adversary_get(adv.pk).version == adv.version + 1
+
+    tag_admin.delete_queryset(None, Tag.objects.filter(name="swamp"))
+    assert _document(adv)[1]["tags"] is None
+    assert adversary_get(adv.pk).version == adv.version + 2
+
+
+# --- REBUILD COMMAND --- #
+@pytest.mark.django_db
+def test_rebuild_read_model_backfills_documents(conf_account):
+    advs = [Adversary.objects.create(name=f"Goblin {i}", author=conf_account)
+            for i in range(5)]
+    assert not AdversaryDocument.objects.exists()
+
+    out = StringIO()
+    call_command("rebuild_read_model", batch_size=2, stdout=out)
+
+    assert "Rebuilt 5 document(s)" in out.getvalue()
+    for adv in advs:
+        assert _document(adv) == _rendered(adv)
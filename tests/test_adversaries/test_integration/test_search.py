@@ -0,0 +1,153 @@
+from types import SimpleNamespace
+
+import pytest
+from django.contrib import admin
+from django.db.models.signals import post_delete
+
+from adversaries.admin import AdversaryAdmin, FeatureAdmin
+from adversaries.dtos.dto import AdversaryDTO, FeatureDTO
+from adversaries.dtos.dto_patch import AdversaryPatchDTO, FeaturePatchDTO
+from adversaries.models import Adversary, Feature
+from adversaries.search import search_ranked
+from adversaries.selectors import adversary_get, adversary_search
+from adversaries.services import adversary_create, adversary_update, \
+    adversary_partial_update, adversary_bulk_create, \
+    adversary_retire_missing
+from adversaries.signals import _unindex_on_delete
+
+
+def _dto(name, description=None, features=()):
+    return AdversaryDTO(
+        name=name, description=description,
+        features=[FeatureDTO(name=n, type="ACT", description=d)
+                  for n, d in features],
+    )
+
+
+def _found(query):
+    return [Adversary.objects.get(pk=pk).name
+            for pk, _ in search_ranked(query, 50)]
+
+
+@pytest.fixture
+def searchable(conf_account):
+    return [
+        adversary_create(_dto("Acid Burrower", "A horse-sized insect.",
+                              [("Spit Acid", "Sprays acid in a cone.")]),
+                         conf_account.id),
+        adversary_create(_dto("Cave Ogre", "Burrows under the hills."),
+                         conf_account.id),
+        adversary_create(_dto("Jagged Knife Bandit", "Ambushes caravans."),
+                         conf_account.id),
+    ]
+
+
+# --- SEARCH INDEX --- #
+@pytest.mark.django_db
+def test_search_matches_names_descriptions_and_features(searchable):
+    assert _found("insect") == ["Acid Burrower"]
+    assert _found("cone") == ["Acid Burrower"]
+    assert _found("bandit") == ["Jagged Knife Bandit"]
+    assert _found("dragon") == []
+    assert _found("  ?! ") == []
+
+
+@pytest.mark.django_db
+def test_search_any_word_ranked(searchable):
+    # stemmed: burrows / burrower, spits / spit
+    found = _found("anything that burrows or spits acid")
+    assert set(found) == {"Acid Burrower", "Cave Ogre"}
+    assert found[0] == "Acid Burrower"
+
+
+@pytest.mark.django_db
+def test_search_name_ranks_first(conf_account):
+    adversary_create(_dto("Ogre Shaman", "Leads the horde."),
+                     conf_account.id)
+    adversary_create(_dto("Shaman", "Serves an ogre."), conf_account.id)
+    assert _found("ogre") == ["Ogre Shaman", "Shaman"]
+
+
+@pytest.mark.django_db
+def test_search_pages_after_score_and_id(conf_account):
+    adversary_bulk_create([_dto(f"Wolf {i}", "Hunts in packs.")
+                           for i in range(5)], conf_account.id)
+    first = search_ranked("packs", 2)
+    pk, score = first[-1]
+    rest = search_ranked("packs", 10, after=(score, pk))
+    assert [pk for pk, _ in first + rest] == \
+        [pk for pk, _ in search_ranked("packs", 10)]
+    assert len(rest) == 3
+
+
+@pytest.mark.django_db
+def test_search_pages_through_equal_scores(conf_account):
+    advs = adversary_bulk_create(
+        [_dto(f"Wolf {suffix}", "Hunts in packs.")
+         for suffix in ("Alpha", "Gamma", "Delta", "Omega", "Sigma")],
+        conf_account.id)
+    assert len({score for _, score in search_ranked("wolf", 10)}) == 1
+
+    found, after = [], None
+    while page := search_ranked("wolf", 2, after=after):
+        found += [pk for pk, _ in page]
+        after = (page[-1][1], page[-1][0])
+    assert found == sorted(adv.pk for adv in advs)
+
+
+@pytest.mark.django_db
+def test_search_index_follows_writes(searchable, conf_account):
+    burrower, ogre, bandit = searchable
+
+    adversary_update(ogre, _dto("Cave Troll", "Lives under bridges."))
+    assert _found("ogre") == []
+    assert _found("bridges") == ["Cave Troll"]
+
+    adversary_partial_update(adversary_get(bandit.pk), AdversaryPatchDTO(
+        features=[FeaturePatchDTO(name="Smoke Bomb", type="ACT",
+                                  description="Vanishes.")]))
+    assert _found("smoke") == ["Jagged Knife Bandit"]
+
+    Adversary.objects.filter(pk=burrower.pk).update(source_key="a.tsv")
+    adversary_retire_missing(conf_account.id, "a.tsv", kept_names=set())
+    assert _found("acid") == []
+
+
+@pytest.mark.django_db
+def test_search_unindexes_deletes_outside_the_services(searchable):
+    burrower, ogre, _ = searchable
+    Adversary.objects.filter(pk=burrower.pk).delete()
+    ogre.delete()
+    assert _found("acid") == []
+    assert _found("burrows") == []
+
+
+@pytest.mark.django_db
+def test_search_skips_stale_index_entries(searchable):
+    burrower, *_ = searchable
+    # deleted without its signals, the index still holds it
+    post_delete.disconnect(sender=Adversary,
+                           dispatch_uid="search_unindex_adversary")
+    try:
+        burrower.delete()
+    finally:
+        post_delete.connect(_unindex_on_delete, sender=Adversary,
+                            dispatch_uid="search_unindex_adversary")
+    assert [pk for pk, _ in search_ranked("insect", 50)] != []
+    assert adversary_search("insect", 50) == []
+
+
+@pytest.mark.django_db
+def test_search_index_follows_admin_writes(searchable):
+    burrower, ogre, _ = searchable
+
+    ogre.name = "Cave Troll"
+    ogre.save()
+    AdversaryAdmin(Adversary, admin.site).save_related(
+        None, SimpleNamespace(instance=ogre, save_m2m=lambda: None), [],
+        change=True)
+    assert _found("troll") == ["Cave Troll"]
+
+    FeatureAdmin(Feature, admin.site).delete_model(
+        None, Feature.objects.get(name="Spit Acid"))
+    assert _found("cone") == []
@@ -0,0 +1,115 @@
+import pytest
+from django.db import connection
+
+from accounts.models import Account
+from adversaries.models import Adversary, Tag, Tactic
+from adversaries.selectors import adversary_list, ADVERSARY_ORDERINGS
+
+
+@pytest.fixture
+def listed_adversaries(conf_account):
+    other = Account.objects.create(username="other")
+    fire, desert = Tag.objects.create(name="Fire"), \
+        Tag.objects.create(name="Desert")
+    flank = Tactic.objects.create(name="Flank")
+
+    def make(name, author=conf_account, tags=(), tactics=(), **fields):
+        adv = Adversary.objects.create(name=name, author=author, **fields)
+        adv.tags.set(tags)
+        adv.tactics.set(tactics)
+        return adv
+
+    return {
+        "imp": make("Imp", tier=1, type="MIN", status="PUB", difficulty=10,
+                    hit_point=2, tags=[fire]),
+        "wyrm": make("Wyrm", tier=4, type="SOL", status="PUB",
+                     difficulty=20, hit_point=12, tags=[fire, desert],
+                     tactics=[flank]),
+        "jackal": make("Jackal", author=other, tier=1, type="SKU",
+                       status="DRA", difficulty=12, hit_point=4,
+                       tags=[desert], tactics=[flank]),
+    }
+
+
+def _names(qs):
+    return sorted(a.name for a in qs)
+
+
+# --- ADVERSARY LIST FILTERS --- #
+@pytest.mark.django_db
+@pytest.mark.parametrize("filters, expected", [
+    ({}, ["Imp", "Jackal", "Wyrm"]),
+    ({"tier": 1}, ["Imp", "Jackal"]),
+    ({"type": "SOL"}, ["Wyrm"]),
+    ({"type": "SKU", "tier": 1}, ["Jackal"]),
+    ({"status": "DRA"}, ["Jackal"]),
+    ({"difficulty_min": 11, "difficulty_max": 20}, ["Jackal", "Wyrm"]),
+    ({"hit_point_max": 4}, ["Imp", "Jackal"]),
+    ({"tags": ["fire"]}, ["Imp", "Wyrm"]),
+    ({"tags": ["FIRE", "desert"]}, ["Wyrm"]),
+    ({"tactics": ["flank"], "tier": 1}, ["Jackal"]),
+    ({"tags": ["unknown"]}, []),
+])
+def test_adversary_list_filters(listed_adversaries, filters, expected):
+    assert _names(adversary_list(**filters)) == expected
+
+
+@pytest.mark.django_db
+def test_adversary_list_filters_non_ascii_tag(conf_account):
+    adv = Adversary.objects.create(name="Troll", author=conf_account)
+    adv.tags.set([Tag.objects.create(name="Forêt")])
+    assert _names(adversary_list(tags=["forêt"])) == ["Troll"]
+
+
+@pytest.mark.django_db
+def test_adversary_list_filters_author(listed_adversaries, conf_account):
+    assert _names(adversary_list(author_id=conf_account.id)) == \
+        ["Imp", "Wyrm"]
+
+
+@pytest.mark.django_db
+def test_adversary_list_fields_defer_and_skip_relations(listed_adversaries,
+                                                       django_assert_num_queries):
+    with django_assert_num_queries(1):
+        advs = list(adversary_list(fields=["name", "tier"]))
+    assert "description" in advs[0].get_deferred_fields()
+    assert "name" not in advs[0].get_deferred_fields()
+
+    with django_assert_num_queries(2):
+        advs = list(adversary_list(fields=["name", "tags"]))
+        assert {t.name for a in advs for t in a.tags.all()} == \
+            {"Fire", "Desert"}
+
+
+# --- ADVERSARY LIST QUERY PLANS --- #
+@pytest.mark.skipif(connection.vendor != "sqlite",
+                    reason="EXPLAIN QUERY PLAN output of sqlite")
+@pytest.mark.django_db
+@pytest.mark.parametrize("filters, ordering, expected", [
+    ({}, "name", "SCAN adversaries_adversary USING INDEX"),
+    ({}, "-updated_at", "SCAN adversaries_adversary USING INDEX"),
+    ({}, "created_at", "SCAN adversaries_adversary USING INDEX"),
+    ({"tier": 1}, "name", "USING INDEX adversaries_tier_"),
+    ({"type": "SOL"}, "name", "(type=?)"),
+    ({"type": "SOL", "tier": 1}, "name",
+     "SEARCH adversaries_adversary USING INDEX"),
+    ({"status": "PUB"}, "name", "USING INDEX adversaries_status_"),
+    ({"author_id": 1}, "name", "(author_id=?)"),
+    ({"difficulty_min": 1, "difficulty_max": 9}, "name",
+     "(difficulty>? AND difficulty<?)"),
+    ({"hit_point_min": 1, "hit_point_max": 9}, "name",
+     "(hit_point>? AND hit_point<?)"),
+    ({"tags": ["fire"]}, "name", "(tag_id=?)"),
+    ({"tactics": ["flank"]}, "name", "(tactic_id=?)"),
+])
+def test_adversary_list_filters_use_indexes(filters, ordering, expected):
+    qs = adversary_list(**filters).order_by(*ADVERSARY_ORDERINGS[ordering])
+    plan = qs[:51].explain()
+
+    assert expected in plan
+    # the adversary table is never read in full
+    assert not [line for line in plan.splitlines()
+                if line.endswith("SCAN adversaries_adversary")]
+    # an unfiltered page is read in index order
+    if not filters:
+        assert "TEMP B-TREE" not in plan
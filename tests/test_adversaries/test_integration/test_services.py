@@ -1,15 +1,22 @@
+from dataclasses import replace
+
 import pytest
-from django.db import IntegrityError
+from django.db import IntegrityError, connection
+from django.test.utils import CaptureQueriesContext
 
 from adversaries.dtos.dto import AdversaryDTO, BasicAttackDTO, DamageDTO, \
     TacticDTO, TagDTO, ExperienceDTO, FeatureDTO
 from adversaries.dtos.dto_patch import AdversaryPatchDTO, TagPatchDTO, \
     TacticPatchDTO, FeaturePatchDTO, ExperiencePatchDTO, BasicAttackPatchDTO, \
     DamagePatchDTO
+from adversaries.exceptions import VersionConflict
+from adversaries.helpers.generations import generations
 from adversaries.models import Adversary, DamageProfile, BasicAttack, Tactic, \
     Tag, Experience, Feature, DamageType, AdversaryExperience
+from adversaries.selectors import adversary_get
 from adversaries.services import adversary_create, adversary_update, \
-    adversary_partial_update
+    adversary_partial_update, adversary_patch_changes, \
+    adversary_bulk_create, adversary_import_batch
 
 
 @pytest.fixture
@@ -190,6 +197,79 @@ def test_rollback_on_invalid_damage_constraint(conf_account):
     assert BasicAttack.objects.count() == 0
 
 
+@pytest.mark.django_db
+def test_create_query_count_does_not_grow_with_relations(conf_account,
+                                                         dummy_dto_package):
+    def run(prefix, size):
+        dto = AdversaryDTO(**{
+            **dummy_dto_package,
+            "name": prefix,
+            "tactics": [TacticDTO(name=f"{prefix} tactic {i}")
+                        for i in range(size)],
+            "tags": [TagDTO(name=f"{prefix} tag {i}") for i in range(size)],
+            "experiences": [ExperienceDTO(name=f"{prefix} exp {i}", bonus=i)
+                            for i in range(size)],
+            "features": [FeatureDTO(name=f"{prefix} {i}", type="PAS")
+                         for i in range(size)],
+        })
+        with CaptureQueriesContext(connection) as ctx:
+            adversary_create(dto, author_id=conf_account.id)
+        return len(ctx.captured_queries)
+
+    # shared value objects (basic attack, damage profile) now exist
+    run("warmup", 1)
+    assert run("small", 1) == run("large", 10)
+
+    large = Adversary.objects.get(name="large")
+    assert large.tactics.count() == 10
+    assert large.features.count() == 10
+    assert AdversaryExperience.objects.filter(adversary=large).count() == 10
+
+
+@pytest.mark.django_db
+def test_create_names_differing_by_casing_share_row(conf_account,
+                                                    dummy_dto_package):
+    Tactic.objects.create(name="flank")
+    dto = AdversaryDTO(**{
+        **dummy_dto_package,
+        "tactics": [TacticDTO(name="Flank"), TacticDTO(name="FLANK")],
+        "tags": [TagDTO(name="Fire"), TagDTO(name="fire")],
+        "experiences": [ExperienceDTO(name="Burrow", bonus=1),
+                        ExperienceDTO(name="burrow", bonus=2)],
+    })
+
+    adv = adversary_create(dto, author_id=conf_account.id)
+
+    assert list(adv.tactics.values_list("name", flat=True)) == ["flank"]
+    assert list(adv.tags.values_list("name", flat=True)) == ["Fire"]
+    assert list(AdversaryExperience.objects
+                .filter(adversary=adv)
+                .values_list("experience__name", "bonus")) == [("Burrow", 2)]
+    assert Tactic.objects.count() == 1
+    assert Tag.objects.count() == 1
+    assert Experience.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_create_non_ascii_names(conf_account):
+    dto = AdversaryDTO(
+        name="Troll",
+        tactics=[TacticDTO(name="Écraser"), TacticDTO(name="écraser")],
+        tags=[TagDTO(name="Forêt")],
+        experiences=[ExperienceDTO(name="Überlebender", bonus=2)],
+    )
+
+    adv = adversary_create(dto, author_id=conf_account.id)
+    again = adversary_create(replace(dto, name="Troll 2"),
+                             author_id=conf_account.id)
+
+    assert set(adv.tactics.values_list("id", flat=True)) == \
+        set(again.tactics.values_list("id", flat=True))
+    assert list(adv.tags.values_list("name", flat=True)) == ["Forêt"]
+    assert Tag.objects.count() == 1
+    assert Experience.objects.count() == 1
+
+
 # --- PUT TESTS --- #
 @pytest.mark.django_db
 def test_put_adversary_minimal_default(conf_account):
@@ -376,6 +456,51 @@ def test_put_adversary_overwrite_nested_and_m2m(conf_account,
     assert Experience.objects.count() == 3
 
 
+def _write_queries(ctx):
+    return [q["sql"] for q in ctx.captured_queries
+            if q["sql"].split()[0] in ("INSERT", "UPDATE", "DELETE")]
+
+
+@pytest.mark.django_db
+def test_put_identical_payload_writes_nothing(conf_account,
+                                              dummy_dto_package):
+    dto = AdversaryDTO(**{
+        **dummy_dto_package,
+        "tier": 1, "difficulty": 14, "threshold_major": 8, "hit_point": 8,
+        "atk_bonus": 3, "basic_attack": BasicAttackDTO(
+            name="Claws", range="VCL",
+            damage=DamageDTO(dice_number=1, dice_type=12, bonus=2,
+                             damage_type="PHY")),
+    })
+    adv = adversary_create(dto, author_id=conf_account.id)
+    updated_at = Adversary.objects.get(pk=adv.pk).updated_at
+
+    with CaptureQueriesContext(connection) as ctx:
+        adversary_update(adv, dto)
+
+    assert _write_queries(ctx) == []
+    assert Adversary.objects.get(pk=adv.pk).updated_at == updated_at
+
+
+@pytest.mark.django_db
+def test_put_single_field_writes_only_that_column(conf_account,
+                                                  dummy_dto_package):
+    dto = AdversaryDTO(**{**dummy_dto_package, "hit_point": 8})
+    adv = adversary_create(dto, author_id=conf_account.id)
+
+    with CaptureQueriesContext(connection) as ctx:
+        adversary_update(adv, AdversaryDTO(**{**dummy_dto_package,
+                                              "hit_point": 9}))
+
+    # the adversary row, then its read model document
+    writes = _write_queries(ctx)
+    assert len(writes) == 2
+    assert '"adversaries_adversarydocument"' in writes[1]
+    assert '"hit_point"' in writes[0]
+    assert '"name"' not in writes[0] and '"tier"' not in writes[0]
+    assert Adversary.objects.get(pk=adv.pk).hit_point == 9
+
+
 # --- PATCH TESTS --- #
 @pytest.mark.django_db
 def test_patch_adversary_minimal(conf_account):
@@ -488,6 +613,48 @@ def test_patch_m2m_replace_ignore_and_clear(conf_account, dummy_dto_package):
     assert Experience.objects.count() >= 2
 
 
+@pytest.mark.django_db
+def test_patch_same_values_is_a_no_op(conf_account, dummy_dto_package):
+    adv = adversary_create(AdversaryDTO(**dummy_dto_package),
+                           author_id=conf_account.id)
+    adv = adversary_get(adv.pk)
+    dto = AdversaryPatchDTO(
+        name="Ashen Tyrant",
+        hit_point=8,
+        tags=[TagPatchDTO(name="desert"), TagPatchDTO(name="fire")],
+        experiences=[ExperiencePatchDTO(name="Burrow", bonus=2),
+                     ExperiencePatchDTO(name="Flank", bonus=3)],
+        basic_attack=BasicAttackPatchDTO(name="Claws"),
+    )
+
+    assert adversary_patch_changes(adv, dto) == set()
+    with CaptureQueriesContext(connection) as ctx:
+        assert adversary_partial_update(adv, dto) is adv
+    assert len(ctx.captured_queries) == 0
+
+
+@pytest.mark.django_db
+def test_patch_writes_only_changed_columns(conf_account, dummy_dto_package):
+    adv = adversary_create(AdversaryDTO(**dummy_dto_package),
+                           author_id=conf_account.id)
+    adv = adversary_get(adv.pk)
+    dto = AdversaryPatchDTO(name="Ashen Tyrant", hit_point=9,
+                            tags=[TagPatchDTO(name="fire"),
+                                  TagPatchDTO(name="desert")])
+
+    assert adversary_patch_changes(adv, dto) == {"hit_point"}
+    with CaptureQueriesContext(connection) as ctx:
+        updated = adversary_partial_update(adv, dto)
+
+    # the adversary row, then its read model document
+    writes = _write_queries(ctx)
+    assert len(writes) == 2
+    assert '"adversaries_adversarydocument"' in writes[1]
+    assert '"hit_point"' in writes[0] and '"name"' not in writes[0]
+    assert updated.hit_point == 9
+    assert Adversary.objects.get(pk=adv.pk).hit_point == 9
+
+
 @pytest.mark.django_db
 def test_patch_basic_attack_crud_and_partial(conf_account):
     # Seed without BA
@@ -594,3 +761,220 @@ def test_patch_update_basic_attack_profile_reuse_basic_attack(conf_account):
     )
     adversary_partial_update(adv, p3)
     assert BasicAttack.objects.count() == 2
+
+
+# --- VERSION TESTS --- #
+@pytest.mark.django_db
+def test_writes_bump_version_no_op_does_not(conf_account):
+    adv = adversary_create(AdversaryDTO(name="Goblin"),
+                           author_id=conf_account.id)
+    assert adv.version == 1
+
+    adv = adversary_update(adv, AdversaryDTO(name="Goblin", hit_point=3))
+    assert adv.version == 2
+    adv = adversary_update(adv, AdversaryDTO(name="Goblin", hit_point=3))
+    assert adv.version == 2
+
+    adv = adversary_partial_update(adv, AdversaryPatchDTO(
+        tags=[TagPatchDTO(name="fire")]))
+    assert adv.version == 3
+    assert Adversary.objects.get(pk=adv.pk).version == 3
+
+
+@pytest.mark.django_db
+def test_update_with_stale_version_raises(conf_account):
+    adv = adversary_create(AdversaryDTO(name="Goblin"),
+                           author_id=conf_account.id)
+    adversary_update(adv, AdversaryDTO(name="Goblin", hit_point=3))
+
+    with pytest.raises(VersionConflict):
+        adversary_update(adv, AdversaryDTO(name="Hobgoblin"),
+                         expected_version=1)
+    assert Adversary.objects.get(pk=adv.pk).name == "Goblin"
+
+
+@pytest.mark.django_db
+def test_partial_update_lost_update_rolls_back(conf_account):
+    adv = adversary_create(AdversaryDTO(name="Goblin"),
+                           author_id=conf_account.id)
+    stale = Adversary.objects.get(pk=adv.pk)
+    # a concurrent writer commits first
+    adversary_partial_update(adv, AdversaryPatchDTO(hit_point=5))
+
+    with pytest.raises(VersionConflict):
+        adversary_partial_update(stale, AdversaryPatchDTO(
+            hit_point=7, tactics=[TacticPatchDTO(name="Flank")]))
+
+    fresh = Adversary.objects.get(pk=adv.pk)
+    assert (fresh.hit_point, fresh.version) == (5, 2)
+    assert fresh.tactics.count() == 0
+
+
+@pytest.mark.parametrize("write", [
+    lambda adv: adversary_update(adv, AdversaryDTO(
+        name="Goblin", tags=[TagDTO(name="fire")])),
+    lambda adv: adversary_partial_update(adv, AdversaryPatchDTO(
+        tags=[TagPatchDTO(name="fire")])),
+], ids=["update", "partial_update"])
+@pytest.mark.django_db
+def test_link_sync_racing_a_writer_is_a_conflict(conf_account, write):
+    adv = adversary_create(AdversaryDTO(name="Goblin"),
+                           author_id=conf_account.id)
+    fire = Tag.objects.create(name="fire")
+    through = Adversary.tags.through
+    linked = []
+
+    def concurrent_link(execute, sql, params, many, context):
+        # another writer links the same tag right before this one
+        if not linked and sql.startswith("INSERT") \
+                and through._meta.db_table in sql:
+            linked.append(True)
+            through.objects.create(adversary=adv, tag=fire)
+        return execute(sql, params, many, context)
+
+    with pytest.raises(VersionConflict):
+        with connection.execute_wrapper(concurrent_link):
+            write(adv)
+    assert Adversary.objects.get(pk=adv.pk).version == 1
+
+# --- GENERATION TESTS --- #
+@pytest.mark.django_db
+def test_writes_bump_generations_on_commit(
+        conf_account, dummy_dto_package,
+        django_capture_on_commit_callbacks):
+    before = generations([Adversary, Tag])
+
+    with django_capture_on_commit_callbacks(execute=False) as callbacks:
+        adv = adversary_create(AdversaryDTO(**dummy_dto_package),
+                               author_id=conf_account.id)
+    assert generations([Adversary, Tag]) == before
+    for callback in callbacks:
+        callback()
+    created = generations([Adversary, Tag])
+    assert all(a > b for a, b in zip(created, before))
+
+    with django_capture_on_commit_callbacks(execute=True):
+        adversary_update(adv, AdversaryDTO(**{**dummy_dto_package,
+                                              "hit_point": 12}))
+    updated = generations([Adversary, Tag])
+    assert updated[0] > created[0]
+    # no new tag, the tag lists stay cached
+    assert updated[1] == created[1]
+
+
+# --- BULK CREATE TESTS --- #
+@pytest.mark.django_db
+def test_bulk_create_adversaries_share_value_objects(conf_account,
+                                                     dummy_dto_package):
+    dtos = [
+        AdversaryDTO(**{**dummy_dto_package, "name": "Ashen Tyrant"}),
+        AdversaryDTO(**{**dummy_dto_package, "name": "Ashen Wyrm"}),
+    ]
+    advs = adversary_bulk_create(dtos, author_id=conf_account.id)
+
+    assert [a.name for a in advs] == ["Ashen Tyrant", "Ashen Wyrm"]
+    assert all(a.pk for a in advs)
+    assert Adversary.objects.count() == 2
+    assert DamageProfile.objects.count() == 1
+    assert BasicAttack.objects.count() == 1
+    assert Tactic.objects.count() == 2
+    assert Tag.objects.count() == 2
+    assert Experience.objects.count() == 2
+    assert Feature.objects.count() == 2
+
+    adv = Adversary.objects.get(name="Ashen Wyrm")
+    assert adv.author == conf_account
+    assert adv.tier == 1
+    assert adv.status == Adversary.Status.DRAFT
+    assert adv.basic_attack.damage.dice_type == 12
+    assert set(adv.tags.values_list("name", flat=True)) == {"fire", "desert"}
+    assert set(adv.tactics.values_list("name", flat=True)) == {
+        "Flank", "Ambush"
+    }
+    assert set(adv.features.values_list("name", flat=True)) == {
+        "Relentless", "Spit Acid"
+    }
+    assert set(
+        adv.adversary_experiences.values_list("experience__name", "bonus")
+    ) == {("Burrow", 2), ("Flank", 3)}
+
+
+@pytest.mark.django_db
+def test_bulk_create_reuses_existing_value_objects(conf_account):
+    Tactic.objects.create(name="Flank")
+    dp = DamageProfile.objects.create(dice_number=1, dice_type=6)
+    BasicAttack.objects.create(name="Claws", range="MEL", damage=dp)
+
+    dto = AdversaryDTO(
+        name="Goblin",
+        basic_attack=BasicAttackDTO(
+            name="Claws", range="MEL",
+            damage=DamageDTO(dice_number=1, dice_type=6)),
+        tactics=[TacticDTO(name="Flank"), TacticDTO(name="Flank")],
+        experiences=[ExperienceDTO(name="Sneak")],
+    )
+    adv, = adversary_bulk_create([dto], author_id=conf_account.id)
+
+    assert Tactic.objects.count() == 1
+    assert DamageProfile.objects.count() == 1
+    assert BasicAttack.objects.count() == 1
+    assert adv.tactics.count() == 1
+    assert adv.adversary_experiences.get().bonus == 0
+
+
+@pytest.mark.django_db
+def test_bulk_create_query_count_does_not_grow_with_batch(conf_account,
+                                                           dummy_dto_package):
+    def run(prefix, size):
+        dtos = [
+            AdversaryDTO(**{
+                **dummy_dto_package,
+                "name": f"{prefix} {i}",
+                "tactics": [TacticDTO(name=f"{prefix} tactic {i}")],
+                "features": [FeatureDTO(name=f"{prefix} {i}", type="PAS")],
+            })
+            for i in range(size)
+        ]
+        with CaptureQueriesContext(connection) as ctx:
+            adversary_bulk_create(dtos, author_id=conf_account.id)
+        return len(ctx.captured_queries)
+
+    # shared value objects (tags, experiences, basic attack) now exist
+    run("warmup", 1)
+    assert run("small", 2) == run("large", 20)
+    assert Adversary.objects.count() == 23
+
+
+@pytest.mark.django_db
+def test_bulk_create_rollback_on_duplicate_name(conf_account):
+    dtos = [AdversaryDTO(name="Goblin", tactics=[TacticDTO(name="Flank")]),
+            AdversaryDTO(name="Goblin")]
+
+    with pytest.raises(IntegrityError):
+        adversary_bulk_create(dtos, author_id=conf_account.id)
+
+    assert Adversary.objects.count() == 0
+    assert Tactic.objects.count() == 0
+
+
+# --- IMPORT BATCH TESTS --- #
+@pytest.mark.django_db
+def test_import_batch_creates_skips_and_updates(conf_account):
+    legacy = Adversary.objects.create(name="Legacy", author=conf_account)
+    dtos = [AdversaryDTO(name="Goblin", tier=1),
+            AdversaryDTO(name="Legacy", hit_point=4)]
+
+    stats = adversary_import_batch(dtos, conf_account.id, "a.tsv")
+    assert stats == {"created": 1, "updated": 1, "unchanged": 0}
+    legacy.refresh_from_db()
+    assert legacy.hit_point == 4
+    assert legacy.source_key == "a.tsv"
+    assert legacy.content_hash is not None
+
+    stats = adversary_import_batch(dtos, conf_account.id, "a.tsv")
+    assert stats == {"created": 0, "updated": 0, "unchanged": 2}
+
+    # same content coming from another file moves the row to it
+    stats = adversary_import_batch(dtos[:1], conf_account.id, "b.tsv")
+    assert stats == {"created": 0, "updated": 1, "unchanged": 0}
+    assert Adversary.objects.get(name="Goblin").source_key == "b.tsv"
@@ -1,5 +1,6 @@
 import pytest
-from django.db import IntegrityError, transaction
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from adversaries.dtos.dto import TagDTO, TacticDTO, FeatureDTO, ExperienceDTO
 from adversaries.models import Tag, Tactic, Feature, Experience, \
@@ -46,11 +47,39 @@ def test_sync_m2m_by_name_tags_clears_empty(conf_adv):
 
 
 @pytest.mark.django_db
-def test_sync_m2m_by_name_tags_conflicts_raises(conf_adv):
-    Tag.objects.create(name="sneak")
+def test_sync_m2m_by_name_tags_matches_other_casing(conf_adv):
+    tag = Tag.objects.create(name="sneak")
 
-    with pytest.raises(IntegrityError):
-        _sync_m2m_by_name(conf_adv.tags, Tag, [TagDTO(name="SNEAK")])
+    _sync_m2m_by_name(conf_adv.tags, Tag, [TagDTO(name="SNEAK")])
+
+    assert Tag.objects.count() == 1
+    assert list(conf_adv.tags.values_list("id", "name")) == \
+        [(tag.id, "sneak")]
+
+
+@pytest.mark.django_db
+def test_sync_m2m_by_name_casing_change_writes_nothing(conf_adv):
+    _sync_m2m_by_name(conf_adv.tags, Tag, [TagDTO(name="Sneak")])
+
+    with CaptureQueriesContext(connection) as ctx:
+        changed = _sync_m2m_by_name(conf_adv.tags, Tag,
+                                    [TagDTO(name="SNEAK")])
+
+    assert not changed
+    assert not [q for q in ctx.captured_queries
+                if not q["sql"].startswith("SELECT")]
+
+
+@pytest.mark.django_db
+def test_sync_m2m_by_name_lookup_uses_lower(conf_adv):
+    with CaptureQueriesContext(connection) as ctx:
+        _sync_m2m_by_name(conf_adv.tags, Tag, [TagDTO(name="Fire")])
+
+    lookups = [q["sql"] for q in ctx.captured_queries
+               if "adversaries_tag" in q["sql"]
+               and q["sql"].startswith("SELECT")
+               and "LOWER" in q["sql"]]
+    assert lookups
 
 
 @pytest.mark.django_db
@@ -102,6 +131,33 @@ def test_sync_m2m_by_name_tactics_works(conf_adv):
     assert conf_adv.tactics.count() == 2
 
 
+@pytest.mark.django_db
+def test_sync_m2m_by_name_unchanged_writes_nothing(conf_adv):
+    dtos = [TagDTO(name="fire"), TagDTO(name="desert")]
+    assert _sync_m2m_by_name(conf_adv.tags, Tag, dtos)
+
+    current = dict(conf_adv.tags.values_list("name", "id"))
+    with CaptureQueriesContext(connection) as ctx:
+        assert not _sync_m2m_by_name(conf_adv.tags, Tag, dtos, current)
+    assert len(ctx.captured_queries) == 0
+
+
+@pytest.mark.django_db
+def test_sync_m2m_by_name_only_touches_the_diff(conf_adv):
+    _sync_m2m_by_name(conf_adv.tags, Tag, [TagDTO(name="fire"),
+                                           TagDTO(name="desert")])
+    through = conf_adv.tags.through
+    kept = through.objects.get(tag__name="desert")
+
+    _sync_m2m_by_name(conf_adv.tags, Tag, [TagDTO(name="desert"),
+                                           TagDTO(name="earth")])
+
+    # the link of the kept tag is the same row
+    assert through.objects.get(tag__name="desert").pk == kept.pk
+    assert (set(conf_adv.tags.values_list("name", flat=True)) ==
+            {"desert", "earth"})
+
+
 # --- _sync_features --- #
 @pytest.mark.django_db
 def test_sync_features_creates_and_links(conf_adv):
@@ -147,19 +203,16 @@ def test_sync_features_does_not_replace_existing(conf_adv):
 
 
 @pytest.mark.django_db
-def test_sync_features_duplicate_raises(conf_adv):
+def test_sync_features_duplicate_linked_once(conf_adv):
+    # same behaviour as create, a repeated feature is a single link
     dtos = [
         FeatureDTO(name="Relentless", type="PAS", description="Act twice"),
         FeatureDTO(name="Relentless", type="PAS", description="Act twice"),
     ]
+    _sync_features(conf_adv.features, dtos)
 
-    with pytest.raises(IntegrityError):
-        # add savepoint for rollback (without can't do assert after error)
-        with transaction.atomic():
-            _sync_features(conf_adv.features, dtos)
-
-    assert conf_adv.features.count() == 0
-    assert Feature.objects.count() == 0
+    assert conf_adv.features.count() == 1
+    assert Feature.objects.count() == 1
 
 
 @pytest.mark.django_db
@@ -177,6 +230,27 @@ def test_sync_feature_only_desc_diff(conf_adv):
     assert Feature.objects.count() == 2
 
 
+@pytest.mark.django_db
+def test_sync_features_single_hash_lookup(conf_adv):
+    long_text = "Spit acid. " * 2000
+    dtos = [FeatureDTO(name=f"Feature {i}", type="ACT",
+                       description=long_text)
+            for i in range(20)]
+    _sync_features(conf_adv.features, dtos)
+
+    conf_adv.features.clear()
+    with CaptureQueriesContext(connection) as ctx:
+        _sync_features(conf_adv.features, dtos)
+
+    lookups = [q["sql"] for q in ctx.captured_queries
+               if 'FROM "adversaries_feature"' in q["sql"]
+               and "INNER JOIN" not in q["sql"]]
+    assert len(lookups) == 1
+    assert '"hash" IN' in lookups[0]
+    assert conf_adv.features.count() == 20
+    assert Feature.objects.count() == 20
+
+
 @pytest.mark.django_db
 def test_sync_feature_update_delete(conf_adv):
     assert Feature.objects.count() == 0
@@ -268,3 +342,41 @@ def test_sync_experiences_empty_list_clear_links_only(conf_adv):
     assert AdversaryExperience.objects.filter(adversary=conf_adv).count() == 0
 
     assert Experience.objects.filter(name="Burrow").exists()
+
+
+@pytest.mark.django_db
+def test_sync_experiences_upserts_bonuses(conf_adv):
+    _sync_experiences(conf_adv, [ExperienceDTO(name="Burrow", bonus=1),
+                                 ExperienceDTO(name="Flank", bonus=2)])
+    flank = AdversaryExperience.objects.get(experience__name="Flank")
+
+    with CaptureQueriesContext(connection) as ctx:
+        assert _sync_experiences(conf_adv,
+                                 [ExperienceDTO(name="Burrow", bonus=4),
+                                  ExperienceDTO(name="Flank", bonus=2)])
+    # load current links + one upsert
+    assert len(ctx.captured_queries) == 2
+
+    assert (set(AdversaryExperience.objects
+                .filter(adversary=conf_adv)
+                .values_list("experience__name", "bonus")) ==
+            {("Burrow", 4), ("Flank", 2)})
+    assert AdversaryExperience.objects.get(pk=flank.pk).bonus == 2
+    assert not _sync_experiences(conf_adv,
+                                 [ExperienceDTO(name="Burrow", bonus=4),
+                                  ExperienceDTO(name="Flank", bonus=2)])
+
+
+@pytest.mark.django_db
+def test_sync_experiences_casing_change_keeps_link(conf_adv):
+    _sync_experiences(conf_adv, [ExperienceDTO(name="Burrow", bonus=1)])
+    link = AdversaryExperience.objects.get(adversary=conf_adv)
+
+    assert _sync_experiences(conf_adv,
+                             [ExperienceDTO(name="BURROW", bonus=3)])
+
+    assert Experience.objects.count() == 1
+    assert list(AdversaryExperience.objects
+                .filter(adversary=conf_adv)
+                .values_list("pk", "experience__name", "bonus")) == \
+        [(link.pk, "Burrow", 3)]
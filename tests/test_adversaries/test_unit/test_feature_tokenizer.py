@@ -0,0 +1,80 @@
+import csv
+import re
+from pathlib import Path
+
+import pytest
+
+from adversaries.helpers.feature_tokenizer import tokenize_features, \
+    FeatureParseError
+
+
+TSV_PATH = Path(__file__).parents[3] / "data" / "adversaries.tsv"
+
+
+def legacy_clean_feature_input(feature_input):
+    """Former regex based implementation, kept as reference output."""
+    chunks = re.split(r'\s{2,}', feature_input.strip())
+    header_pattern = re.compile(r'(.+)\s*-\s*(Passive|Action|Reaction):', re.I)
+    header_indexes = [idx for idx, chunk in enumerate(chunks)
+                      if header_pattern.match(chunk.strip())]
+    out = []
+    for i, header_idx in enumerate(header_indexes):
+        name, ftype = header_pattern.match(chunks[header_idx].strip()).groups()
+        end = header_indexes[i + 1] if i + 1 < len(header_indexes) \
+            else len(chunks)
+        out.append({
+            "name": name.strip(),
+            "type": ftype.strip().upper()[:3],
+            "description": " ".join(chunks[header_idx + 1:end]).strip()
+        })
+    return out
+
+
+def test_tokenize_features_matches_legacy_output_on_dataset():
+    with open(TSV_PATH, encoding="utf-8") as file:
+        _, *rows = csv.reader(file, delimiter="\t")
+
+    for row in rows:
+        features, errors = tokenize_features(row[15])
+        assert features == legacy_clean_feature_input(row[15]), row[0]
+        assert errors == [], row[0]
+
+
+@pytest.mark.parametrize(
+    "text,expected",
+    [
+        ("", []),
+        ("   ", []),
+        ("Relentless (3) - Passive:  Act  twice.",
+         [{"name": "Relentless (3)", "type": "PAS",
+           "description": "Act twice."}]),
+        (" Bite - action:  Chomp.  Dodge - REACTION:  Jump away. ",
+         [{"name": "Bite", "type": "ACT", "description": "Chomp."},
+          {"name": "Dodge", "type": "REA", "description": "Jump away."}]),
+    ]
+)
+def test_tokenize_features(text, expected):
+    features, errors = tokenize_features(text)
+    assert features == expected
+    assert errors == []
+    assert features == legacy_clean_feature_input(text)
+
+
+def test_tokenize_features_reports_error_positions():
+    text = "Intro text  Bite - Action:  Chomp.  Roar - Action:"
+    features, errors = tokenize_features(text)
+
+    assert [f["name"] for f in features] == ["Bite", "Roar"]
+    assert errors == [
+        FeatureParseError(0, "text before the first feature header"),
+        FeatureParseError(text.index("Roar"),
+                          "feature 'Roar' has no description"),
+    ]
+
+
+def test_tokenize_features_reports_description_glued_to_header():
+    text = "Bite - Action: Chomp."
+    features, errors = tokenize_features(text)
+
+    assert features == legacy_clean_feature_input(text)
+    assert errors[0].position == text.index(" Chomp")
@@ -0,0 +1,19 @@
+from adversaries.dtos.dto import AdversaryDTO, TacticDTO
+from adversaries.helpers.hashing import content_hash
+
+
+def test_content_hash_is_stable_and_content_based():
+    dto = AdversaryDTO(name="Goblin", tier=1, tactics=[TacticDTO("Flank")])
+
+    assert content_hash(dto) == content_hash(
+        AdversaryDTO(name="Goblin", tier=1, tactics=[TacticDTO("Flank")]))
+    assert len(content_hash(dto)) == 64
+
+
+def test_content_hash_changes_with_nested_values():
+    dto = AdversaryDTO(name="Goblin", tactics=[TacticDTO("Flank")])
+
+    assert content_hash(dto) != content_hash(
+        AdversaryDTO(name="Goblin", tactics=[TacticDTO("Ambush")]))
+    assert content_hash(dto) != content_hash(
+        AdversaryDTO(name="Goblin", tier=2, tactics=[TacticDTO("Flank")]))
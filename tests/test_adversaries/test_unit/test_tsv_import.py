@@ -0,0 +1,23 @@
+from adversaries.helpers.tsv_import import tsv_ranges, source_key
+
+
+# --- TSV RANGES --- #
+def test_tsv_ranges_split_on_records(tmp_path):
+    tsv = tmp_path / "a.tsv"
+    # the quoted cell of the second record spans two lines
+    tsv.write_bytes(b"h1\th2\na\t1\n\"b\nb\"\t2\nc\t3\n")
+    ranges = list(tsv_ranges(tsv, 2))
+
+    data = tsv.read_bytes()
+    assert [data[start:end] for start, end in ranges] == \
+        [b"a\t1\n\"b\nb\"\t2\n", b"c\t3\n"]
+
+
+def test_tsv_ranges_of_a_file_without_records(tmp_path):
+    tsv = tmp_path / "a.tsv"
+    tsv.write_bytes(b"h1\th2\n")
+    assert list(tsv_ranges(tsv, 2)) == [(6, 6)]
+
+
+def test_source_key_relative_to_the_import_root(tmp_path):
+    assert source_key(tmp_path, tmp_path / "a" / "x.tsv") == "a/x.tsv"
@@ -1,9 +1,17 @@
+import datetime
+import json
+
 import pytest
+from django.core.cache import cache
+from django.db import connection
 from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import resolve
 from rest_framework.test import APIClient
 
-from adversaries.models import Adversary
+from accounts.models import Account
+from adversaries.models import Adversary, AdversaryDocument
+from adversaries.selectors import ADVERSARY_ORDERINGS
 from adversaries.services import adversary_create
 from api.v1.helpers.mappers import to_adversary_dto
 
@@ -21,7 +29,7 @@ def test_adversary_list_empty_returns_200_and_empty_array():
     client = APIClient()
     resp = client.get("/adversaries/")
     assert resp.status_code == 200
-    assert resp.json() == []
+    assert resp.json() == {"next": None, "previous": None, "results": []}
 
 
 @override_settings(ROOT_URLCONF="api.v1.urls")
@@ -48,7 +56,7 @@ def test_adversary_list_and_detail_success_via_service_setup(
     client.force_authenticate(user=conf_account)
     resp_list = client.get("/adversaries/")
     assert resp_list.status_code == 200
-    assert resp_list.json()[0]["name"] == "Acid Burrower"
+    assert resp_list.json()["results"][0]["name"] == "Acid Burrower"
 
     resp_detail = client.get(f"/adversaries/{adv.id}/")
     assert resp_detail.status_code == 200
@@ -138,3 +146,564 @@ def test_adversary_patch(conf_account):
     # Forgotten type in PATCH body didn't modify value
     assert patch_resp.json().get("type") == Adversary.Type.SOLO
     assert patch_resp.json()["difficulty"] == 14
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_patch_unchanged_writes_nothing(conf_account,
+                                                  big_adversary_payload):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    resp = client.post("/adversaries/", big_adversary_payload, format="json")
+    adv_id = resp.json()["id"]
+    detail = client.get(f"/adversaries/{adv_id}/").json()
+
+    patch_payload = {
+        "name": detail["name"],
+        "difficulty": detail["difficulty"],
+        "tags": detail["tags"],
+        "tactics": detail["tactics"],
+    }
+    with CaptureQueriesContext(connection) as ctx:
+        patch_resp = client.patch(f"/adversaries/{adv_id}/", patch_payload,
+                                  format="json")
+
+    assert patch_resp.status_code == 200, patch_resp.json()
+    assert patch_resp.json() == detail
+    assert not [q for q in ctx.captured_queries
+                if q["sql"].startswith(("INSERT", "UPDATE", "DELETE"))]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_if_match_conditional_writes(conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    resp = client.post("/adversaries/", {"name": "Fire dragon"},
+                       format="json")
+    url = f"/adversaries/{resp.json()['id']}/"
+
+    get_resp = client.get(url)
+    assert get_resp["ETag"] == '"1"'
+
+    put_resp = client.put(url, {"name": "Frost dragon"}, format="json",
+                          HTTP_IF_MATCH='"1"')
+    assert put_resp.status_code == 200, put_resp.json()
+    assert put_resp["ETag"] == '"2"'
+
+    # a client still editing version 1 lost the race
+    stale = client.patch(url, {"name": "Ice dragon"}, format="json",
+                         HTTP_IF_MATCH='"1"')
+    assert stale.status_code == 412
+    assert client.get(url).json()["name"] == "Frost dragon"
+
+    patch_resp = client.patch(url, {"name": "Ice dragon"}, format="json",
+                              HTTP_IF_MATCH='"2", "9"')
+    assert patch_resp.status_code == 200, patch_resp.json()
+    assert patch_resp["ETag"] == '"3"'
+
+    any_resp = client.patch(url, {"hit_point": 4}, format="json",
+                            HTTP_IF_MATCH="*")
+    assert any_resp.status_code == 200
+    assert any_resp["ETag"] == '"4"'
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_detail_conditional_get(conf_account):
+    adv = Adversary.objects.create(name="Fire dragon", author=conf_account)
+    client = APIClient()
+    url = f"/adversaries/{adv.id}/"
+
+    resp = client.get(url)
+    assert resp["ETag"] == '"1"'
+    assert resp["Last-Modified"]
+
+    with CaptureQueriesContext(connection) as ctx:
+        current = client.get(url, HTTP_IF_NONE_MATCH='"1"')
+    assert current.status_code == 304
+    assert current["ETag"] == '"1"'
+    assert not current.content
+    # the validators only, no prefetch
+    assert len(ctx.captured_queries) == 1
+
+    since = client.get(url, HTTP_IF_MODIFIED_SINCE=resp["Last-Modified"])
+    assert since.status_code == 304
+
+    Adversary.objects.filter(pk=adv.pk).update(version=2)
+    stale = client.get(url, HTTP_IF_NONE_MATCH='"1"')
+    assert stale.status_code == 200
+    assert stale["ETag"] == '"2"'
+    assert client.get("/adversaries/999/",
+                      HTTP_IF_NONE_MATCH='"1"').status_code == 404
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_conditional_get(
+        paged_adversaries, conf_account,
+        django_capture_on_commit_callbacks):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    resp = client.get("/adversaries/?limit=2")
+    tag = resp["ETag"]
+    assert tag.startswith('W/"')
+
+    with CaptureQueriesContext(connection) as ctx:
+        current = client.get("/adversaries/?limit=2", HTTP_IF_NONE_MATCH=tag)
+    assert current.status_code == 304
+    assert not [q for q in ctx.captured_queries
+                if "adversaries_" in q["sql"]]
+
+    # other page or filters, other representation
+    assert client.get("/adversaries/?limit=3")["ETag"] != tag
+    assert client.get("/adversaries/?limit=2&tier=II",
+                      HTTP_IF_NONE_MATCH=tag).status_code == 200
+
+    # a delete changes the state too
+    with django_capture_on_commit_callbacks(execute=True):
+        paged_adversaries[-1].delete()
+    changed = client.get("/adversaries/?limit=2", HTTP_IF_NONE_MATCH=tag)
+    assert changed.status_code == 200
+    assert changed["ETag"] != tag
+
+
+# --- TEST COLLECTION PAGINATION --- #
+@pytest.fixture
+def paged_adversaries(conf_account):
+    # two authors use each name, the id breaks the tie
+    other = Account.objects.create(username="other")
+    return [
+        Adversary.objects.create(name=name, author=author)
+        for author in (conf_account, other)
+        for name in ("Crab", "Adder", "Bear")
+    ]
+
+
+def _walk(client, url, key):
+    names, pages = [], 0
+    while url:
+        body = client.get(url).json()
+        names += [(a["name"], a["id"]) for a in body["results"]]
+        url = body[key]
+        pages += 1
+    return names, pages
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_pages_follow_name_id(paged_adversaries):
+    client = APIClient()
+    expected = sorted((a.name, a.id) for a in paged_adversaries)
+
+    forward, pages = _walk(client, "/adversaries/?limit=2", "next")
+    assert forward == expected
+    assert pages == 3
+
+    last = client.get("/adversaries/?limit=2")
+    for _ in range(2):
+        last = client.get(last.json()["next"])
+    assert last.json()["next"] is None
+    backward, _ = _walk(client, last.json()["previous"], "previous")
+    # each previous page is served in the forward order
+    assert backward == expected[2:4] + expected[0:2]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+@pytest.mark.parametrize("ordering", list(ADVERSARY_ORDERINGS))
+def test_adversary_list_pages_every_ordering(paged_adversaries, ordering):
+    # timestamps within one millisecond, two of them equal
+    base = datetime.datetime(2025, 1, 1, tzinfo=datetime.timezone.utc)
+    for i, adv in enumerate(paged_adversaries):
+        Adversary.objects.filter(pk=adv.pk).update(
+            created_at=base + datetime.timedelta(microseconds=min(i, 4)),
+            updated_at=base + datetime.timedelta(microseconds=(7 * i) % 5))
+    client = APIClient()
+    expected = [a.id for a in Adversary.objects.order_by(
+        *ADVERSARY_ORDERINGS[ordering])]
+
+    forward, pages = _walk(client, f"/adversaries/?ordering={ordering}"
+                                   f"&limit=2", "next")
+    assert [pk for _, pk in forward] == expected
+    assert pages == 3
+
+    last = client.get(f"/adversaries/?ordering={ordering}&limit=4")
+    last = client.get(last.json()["next"])
+    backward, _ = _walk(client, last.json()["previous"], "previous")
+    assert [pk for _, pk in backward] == expected[:4]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_deep_page_same_queries(paged_adversaries):
+    client = APIClient()
+    # the first request also computes the list state (ETag), once
+    body = client.get("/adversaries/?limit=1").json()
+    with CaptureQueriesContext(connection) as second:
+        body = client.get(body["next"]).json()
+    for _ in range(3):
+        body = client.get(body["next"]).json()
+    with CaptureQueriesContext(connection) as deep:
+        client.get(body["next"])
+
+    assert len(second.captured_queries) == len(deep.captured_queries)
+    sql = " ".join(q["sql"] for q in deep.captured_queries)
+    assert "OFFSET" not in sql
+    assert "COUNT(" not in sql
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["limit=0", "limit=201", "limit=x",
+                                   "cursor=nope", "cursor=W10"])
+def test_adversary_list_bad_pagination_params_400(query):
+    resp = APIClient().get(f"/adversaries/?{query}")
+    assert resp.status_code == 400
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_filters_and_ordering(paged_adversaries, conf_account):
+    Adversary.objects.filter(name="Bear").update(tier=2, status="PUB")
+    client = APIClient()
+
+    resp = client.get("/adversaries/", {"tier": "II", "status": "published",
+                                        "author": conf_account.id})
+    assert resp.status_code == 200
+    assert [a["name"] for a in resp.json()["results"]] == ["Bear"]
+
+    resp = client.get("/adversaries/", {"ordering": "-name", "limit": 2})
+    assert [a["name"] for a in resp.json()["results"]] == ["Crab", "Crab"]
+    assert "ordering=-name" in resp.json()["next"]
+    rest, _ = _walk(client, resp.json()["next"], "next")
+    assert [name for name, _ in rest] == ["Bear", "Bear", "Adder", "Adder"]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["tier=9", "type=dragon", "ordering=hp",
+                                   "difficulty_min=-1", "author=x"])
+def test_adversary_list_bad_filters_400(query):
+    resp = APIClient().get(f"/adversaries/?{query}")
+    assert resp.status_code == 400
+
+
+# --- TEST RESPONSE CACHE --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_cached_until_write(
+        big_adversary_payload, conf_account,
+        django_capture_on_commit_callbacks):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    assert client.get("/adversaries/?limit=5").json()["results"] == []
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get("/adversaries/?limit=5")
+    assert resp.json()["results"] == []
+    assert not [q for q in ctx.captured_queries
+                if "adversaries_" in q["sql"]]
+
+    # other parameters, other entry
+    with CaptureQueriesContext(connection) as ctx:
+        client.get("/adversaries/?limit=6")
+    assert ctx.captured_queries
+
+    with django_capture_on_commit_callbacks(execute=True):
+        client.post("/adversaries/", big_adversary_payload, format="json")
+    names = [a["name"] for a in
+             client.get("/adversaries/?limit=5").json()["results"]]
+    assert names == ["Acid Burrower"]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls",
+                   ALLOWED_HOSTS=["internal", "api.example.com"])
+@pytest.mark.django_db
+def test_adversary_list_cached_per_host(big_adversary_payload,
+                                        conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    client.post("/adversaries/", big_adversary_payload, format="json",
+                HTTP_HOST="internal")
+
+    internal = client.get("/adversaries/", HTTP_HOST="internal").json()
+    public = client.get("/adversaries/", HTTP_HOST="api.example.com",
+                        secure=True).json()
+    assert internal["results"][0]["url"].startswith("http://internal/")
+    assert public["results"][0]["url"].startswith(
+        "https://api.example.com/")
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_errors_not_cached():
+    client = APIClient()
+    assert client.get("/adversaries/?limit=0").status_code == 400
+    assert client.get("/adversaries/?limit=0").status_code == 400
+
+
+# --- TEST SPARSE FIELDSETS --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_sparse_fields_shrink_query(big_adversary_payload,
+                                                   conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    client.post("/adversaries/", big_adversary_payload, format="json")
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get("/adversaries/", {
+            "fields": "id,name,tier,type,difficulty"})
+
+    assert resp.status_code == 200
+    assert resp.json()["results"] == [{
+        "id": resp.json()["results"][0]["id"], "name": "Acid Burrower",
+        "tier": "1", "type": "SOL", "difficulty": 14,
+    }]
+    # the page, apart from the list state (ETag) aggregate
+    adversary_queries = [q["sql"] for q in ctx.captured_queries
+                         if "adversaries_" in q["sql"]
+                         and "MAX(" not in q["sql"]]
+    assert len(adversary_queries) == 1
+    assert '"description"' not in adversary_queries[0]
+    assert "JOIN" not in adversary_queries[0]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_list_expand_adds_relations(big_adversary_payload,
+                                              conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    client.post("/adversaries/", big_adversary_payload, format="json")
+
+    with CaptureQueriesContext(connection) as ctx:
+        resp = client.get("/adversaries/", {"fields": "name,url",
+                                            "expand": "tags,author",
+                                            "ordering": "-updated_at"})
+
+    item = resp.json()["results"][0]
+    assert set(item) == {"name", "url", "tags", "author"}
+    assert item["author"] == conf_account.username
+    assert item["tags"] == "underworld, cavern, desert"
+    # the page joined with the documents, apart from the list state
+    page = [q["sql"] for q in ctx.captured_queries
+            if "adversaries_" in q["sql"] and "MAX(" not in q["sql"]]
+    assert len(page) == 1
+    assert '"adversaries_adversarydocument"' in page[0]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["fields=id,hp", "fields=,", "expand=name",
+                                   "fields=name&expand=bogus"])
+def test_adversary_list_bad_fields_400(query):
+    resp = APIClient().get(f"/adversaries/?{query}")
+    assert resp.status_code == 400
+
+
+# --- TEST READ MODEL --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_reads_documents_as_rendered(big_adversary_payload,
+                                               conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    adv_id = client.post("/adversaries/", big_adversary_payload,
+                         format="json").json()["id"]
+    urls = [f"/adversaries/{adv_id}/", "/adversaries/",
+            "/adversaries/?fields=name,url&expand=tags",
+            "/adversaries/search/?q=acid"]
+
+    with CaptureQueriesContext(connection) as ctx:
+        detail = client.get(urls[0])
+    # a single fetch by primary key
+    assert len(ctx.captured_queries) == 1
+    from_documents = [client.get(url).content for url in urls]
+    assert from_documents[0] == detail.content
+
+    # without documents (not built yet) the rows are rendered
+    AdversaryDocument.objects.all().delete()
+    cache.clear()
+    assert [client.get(url).content for url in urls] == from_documents
+
+
+# --- TEST SEARCH ENDPOINT --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_search_ranked_pages(big_adversary_payload, conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    client.post("/adversaries/", big_adversary_payload, format="json")
+    for i in range(3):
+        client.post("/adversaries/", {"name": f"Mole {i}",
+                                      "description": "Burrows slowly."},
+                    format="json")
+
+    resp = client.get("/adversaries/search/", {"q": "acid burrows",
+                                               "limit": 2})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert [a["name"] for a in body["results"]][0] == "Acid Burrower"
+    assert body["previous"] is None
+
+    rest = client.get(body["next"]).json()
+    assert rest["next"] is None
+    assert len(body["results"]) + len(rest["results"]) == 4
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_search_pages_equal_scores(conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    for suffix in ("Alpha", "Gamma", "Delta", "Omega", "Sigma"):
+        client.post("/adversaries/", {"name": f"Mole {suffix}",
+                                      "description": "Burrows slowly."},
+                    format="json")
+
+    names = []
+    url = "/adversaries/search/?q=mole&limit=2"
+    while url:
+        body = client.get(url).json()
+        names += [a["name"] for a in body["results"]]
+        url = body["next"]
+    assert names == ["Mole Alpha", "Mole Gamma", "Mole Delta",
+                     "Mole Omega", "Mole Sigma"]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+@pytest.mark.parametrize("query", ["", "q=", "q=a&cursor=nope",
+                                   "q=a&limit=0"])
+def test_adversary_search_bad_params_400(query):
+    resp = APIClient().get(f"/adversaries/search/?{query}")
+    assert resp.status_code == 400
+
+
+# --- TEST EXPORT ENDPOINT --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_export_ndjson_streams_create_payloads(
+        big_adversary_payload, conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+    client.post("/adversaries/", big_adversary_payload, format="json")
+
+    resp = client.get("/adversaries/export/")
+    assert resp.status_code == 200
+    assert resp.streaming
+    assert resp["Content-Type"] == "application/x-ndjson"
+
+    doc, = [json.loads(line) for line in
+            b"".join(resp.streaming_content).decode().splitlines()]
+    assert doc["name"] == "Acid Burrower"
+    assert doc["basic_attack"]["damage"]["dice_type"] == 12
+
+    # an exported document is a valid create payload
+    doc["name"] = "Acid Burrower copy"
+    assert client.post("/adversaries/", doc, format="json").status_code == 201
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_export_tsv_and_json(conf_account):
+    Adversary.objects.create(name="Goblin", author=conf_account, tier=1,
+                             difficulty=10)
+    client = APIClient()
+
+    tsv = b"".join(
+        client.get("/adversaries/export/?output=tsv").streaming_content)
+    header, row = tsv.decode().splitlines()
+    assert header.startswith("Adversary\tTier\tType")
+    assert row.split("\t")[:3] == ["Goblin", "Tier 1", "Unknown"]
+
+    resp = client.get("/adversaries/export/?output=json")
+    assert [a["name"] for a in json.loads(
+        b"".join(resp.streaming_content))] == ["Goblin"]
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_export_documents_filtered_from_database(conf_account):
+    Adversary.objects.create(name="Goblin", author=conf_account, tier=1)
+    Adversary.objects.create(name="Orc", author=conf_account, tier=2)
+    client = APIClient()
+
+    resp = client.get("/adversaries/export/", {"output": "json",
+                                               "tier": "II"})
+    with CaptureQueriesContext(connection) as ctx:
+        body = b"".join(resp.streaming_content)
+    # the documents, relations included, in a single query
+    assert len(ctx.captured_queries) == 1
+    assert [a["name"] for a in json.loads(body)] == ["Orc"]
+
+    assert client.get("/adversaries/export/?tier=9").status_code == 400
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_export_unknown_output_400():
+    resp = APIClient().get("/adversaries/export/?output=xml")
+    assert resp.status_code == 400
+
+
+# --- TEST BULK ENDPOINT --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_bulk_create_per_item_results(conf_account,
+                                                big_adversary_payload):
+    Adversary.objects.create(name="Taken", author=conf_account)
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+
+    payload = [
+        big_adversary_payload,
+        {"name": "Goblin", "tactics": ["Burrow"]},
+        {"tier": "1"},
+        {"name": "Taken"},
+        {"name": "Goblin"},
+    ]
+    resp = client.post("/adversaries/bulk/", payload, format="json")
+
+    assert resp.status_code == 207
+    results = resp.json()
+    assert [r["status"] for r in results] == [201, 201, 400, 409, 409]
+    assert "name" in results[2]["errors"]
+    assert results[1]["url"].endswith(f"/adversaries/{results[1]['id']}/")
+
+    goblin = Adversary.objects.get(name="Goblin")
+    assert goblin.author == conf_account
+    assert list(goblin.tactics.values_list("name", flat=True)) == ["Burrow"]
+    assert Adversary.objects.count() == 3
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_bulk_create_query_count_does_not_grow(
+        conf_account, big_adversary_payload):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+
+    def post(prefix, size):
+        payload = [{**big_adversary_payload, "name": f"{prefix} {i}"}
+                   for i in range(size)]
+        with CaptureQueriesContext(connection) as ctx:
+            resp = client.post("/adversaries/bulk/", payload, format="json")
+        assert resp.status_code == 201
+        return len(ctx.captured_queries)
+
+    post("warmup", 1)
+    assert post("small", 2) == post("large", 25)
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_adversary_bulk_create_expects_a_list(conf_account):
+    client = APIClient()
+    client.force_authenticate(user=conf_account)
+
+    resp = client.post("/adversaries/bulk/", {"name": "Goblin"},
+                       format="json")
+    assert resp.status_code == 400
@@ -145,3 +145,19 @@ def test_empty_lists_return_200_and_empty_array():
         resp = client.get(endpoint)
         assert resp.status_code == 200
         assert resp.json() == []
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_lookup_list_cached_until_write(django_assert_num_queries,
+                                        django_capture_on_commit_callbacks):
+    client = APIClient()
+    Tag.objects.create(name="fire")
+    assert len(client.get("/lookups/tags/").json()) == 1
+
+    with django_assert_num_queries(0):
+        assert len(client.get("/lookups/tags/").json()) == 1
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Tag.objects.create(name="desert")
+    assert len(client.get("/lookups/tags/").json()) == 2
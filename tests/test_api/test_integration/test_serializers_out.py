@@ -0,0 +1,57 @@
+import pytest
+from django.test import override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from adversaries.models import Adversary, BasicAttack, Feature
+from adversaries.selectors import adversary_list
+from adversaries.services import adversary_create
+from api.v1.adversaries.serializers_in import AdversaryCreateIn
+from api.v1.adversaries.serializers_out import AdversaryDetailOut, \
+    AdversaryListOut, detail_representation, list_representation, \
+    detail_url_template
+from api.v1.helpers.mappers import to_adversary_dto
+
+
+def _json(data):
+    return JSONRenderer().render(data)
+
+
+@pytest.fixture
+def varied_adversaries(big_adversary_payload, conf_account):
+    ser = AdversaryCreateIn(data=big_adversary_payload)
+    ser.is_valid(raise_exception=True)
+    adversary_create(to_adversary_dto(ser.validated_data), conf_account.id)
+    # every optional field left out
+    Adversary.objects.create(name="Blank", author=conf_account)
+    # a basic attack without damage, a feature without description
+    adv = Adversary.objects.create(
+        name="Unarmed", author=conf_account, tier=2, atk_bonus=-1,
+        basic_attack=BasicAttack.objects.create(name="Fists"))
+    adv.features.add(Feature.objects.create(name="Shove"))
+    advs = list(adversary_list().order_by("id"))
+    assert len(advs) == 3
+    return advs
+
+
+# --- COMPILED REPRESENTATIONS --- #
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+def test_detail_representation_renders_as_serializer(varied_adversaries):
+    for adv in varied_adversaries:
+        assert _json(detail_representation(adv)) == \
+            _json(AdversaryDetailOut(adv).data)
+
+
+@override_settings(ROOT_URLCONF="api.v1.urls")
+@pytest.mark.django_db
+@pytest.mark.parametrize("fields", [None, ["name", "url"],
+                                    ["url", "tags", "basic_attack", "id"]])
+def test_list_representation_renders_as_serializer(varied_adversaries,
+                                                   fields):
+    request = APIRequestFactory().get("/adversaries/")
+    render = list_representation(fields, detail_url_template(request))
+    expected = AdversaryListOut(varied_adversaries, many=True, fields=fields,
+                                context={"request": request}).data
+    assert _json([render(adv) for adv in varied_adversaries]) == \
+        _json(expected)
@@ -0,0 +1,61 @@
+import datetime
+
+import pytest
+from django.db.models import Q
+
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.v1.helpers.pagination import encode_cursor, decode_cursor, \
+    keyset_filter, RankedPagination
+
+
+# --- CURSOR TESTS --- #
+def test_cursor_roundtrip():
+    token = encode_cursor(["Acid Burrower", 12], reverse=True)
+    assert "=" not in token
+    assert decode_cursor(token) == (["Acid Burrower", 12], True)
+
+
+def test_cursor_keeps_datetime_microseconds():
+    moment = datetime.datetime(2025, 1, 2, 3, 4, 5, 123456,
+                               tzinfo=datetime.timezone.utc)
+    values, _ = decode_cursor(encode_cursor([moment, 1]))
+    assert datetime.datetime.fromisoformat(values[0]) == moment
+
+
+@pytest.mark.parametrize("token", ["", "nope", "e30", "W10"])
+def test_cursor_decode_rejects_foreign_tokens(token):
+    with pytest.raises(ValueError):
+        decode_cursor(token)
+
+
+# --- KEYSET FILTER TESTS --- #
+def test_keyset_filter_after_position():
+    assert keyset_filter(("name", "id"), ["Bear", 4]) == (
+        Q(name__gte="Bear") & (Q(name__gt="Bear") | Q(name="Bear", id__gt=4))
+    )
+
+
+def test_keyset_filter_reverse_and_descending():
+    assert keyset_filter(("-updated_at", "id"), ["t", 4], reverse=True) == (
+        Q(updated_at__gte="t")
+        & (Q(updated_at__gt="t") | Q(updated_at="t", id__lt=4))
+    )
+
+
+# --- RANKED PAGINATION TESTS --- #
+def test_ranked_pages_decided_on_the_ranked_ids():
+    ranked = [(1, 3.0), (2, 2.0), (3, 1.0)]
+    request = Request(APIRequestFactory().get("/search/?limit=2"))
+    paginator = RankedPagination()
+
+    # the last result of the page was deleted since it was indexed
+    rows = paginator.paginate_ranked(
+        lambda limit, after: ranked[:limit],
+        lambda page: [(f"adv {pk}", score) for pk, score in page
+                      if pk != 2],
+        request,
+    )
+    assert rows == [("adv 1", 3.0)]
+    assert decode_cursor(paginator.next_cursor) == ([2.0, 2], False)
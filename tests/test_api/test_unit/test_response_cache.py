@@ -0,0 +1,40 @@
+from django.core.cache import cache
+
+from api.v1.helpers import response_cache
+from api.v1.helpers.response_cache import get_or_compute
+
+
+# --- STAMPEDE PROTECTION TESTS --- #
+def test_get_or_compute_stores_and_serves():
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"rows": 1}
+
+    assert get_or_compute("k", compute) == {"rows": 1}
+    assert get_or_compute("k", compute) == {"rows": 1}
+    assert len(calls) == 1
+    assert cache.get("k:lock") is None
+
+
+def test_get_or_compute_none_is_not_cached():
+    assert get_or_compute("k", lambda: None) is None
+    assert get_or_compute("k", lambda: 2) == 2
+
+
+def test_get_or_compute_waits_for_lock_holder(monkeypatch):
+    cache.add("k:lock", 1)
+    # the request holding the lock stores the value while we wait
+    monkeypatch.setattr(response_cache.time, "sleep",
+                        lambda s: cache.set("k", "theirs"))
+
+    assert get_or_compute("k", lambda: "ours") == "theirs"
+
+
+def test_get_or_compute_gives_up_waiting(monkeypatch):
+    cache.add("k:lock", 1)
+    monkeypatch.setattr(response_cache, "WAIT_TIMEOUT", 0.01)
+    monkeypatch.setattr(response_cache, "WAIT_STEP", 0.001)
+
+    assert get_or_compute("k", lambda: "ours") == "ours"